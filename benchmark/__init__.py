@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# benchmark/__init__.py
+"""Performance benchmarks. Every module is runnable with 'python -m benchmark.<module>' from the project root."""
+import time
+
+
+def measure(function, repeat=20):
+    """Calls function repeat times. Returns (median, max) duration in milliseconds"""
+
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - start) * 1000)
+    durations.sort()
+    return durations[len(durations) // 2], durations[-1]
+
+
+def percentile(values, fraction):
+    """Takes list of values and fraction (0.99 for p99), returns value at that position of sorted values"""
+
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
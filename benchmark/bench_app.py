@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+# benchmark/bench_app.py
+"""Load and latency benchmark of the main endpoints on seeded synthetic data (benchmark/data.py). Every scenario
+runs with concurrent clients through app.test_client() and through a real threaded WSGI server, and reports
+p50/p95/p99 latency, throughput and SQL statements per request. Results are saved as JSON and can be compared
+with a previous run.
+
+Usage: python -m benchmark.bench_app [--users 50] [--tasks 2000] [--votes 10000] [--clients 8] [--requests 50]
+                                     [--modes client server] [--scenarios task_list erase ...]
+                                     [--output results.json] [--compare previous.json]
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+from sqlalchemy import event
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from benchmark import percentile
+from benchmark.data import PASSWORD, get_task_ids, get_username, populate
+from todo import create_app, db
+from todo.cache import page_cache, poll_results_cache, user_cache
+from todo.hashing import password_hasher
+
+app = create_app()
+
+BASE_URL = 'https://localhost'      # SSLify przekierowuje żądania http
+
+
+class AppClient(object):
+    """app.test_client() making requests without following redirects"""
+
+    def __init__(self):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        return self.client.open(path, method=method, data=data, base_url=BASE_URL).status_code
+
+
+class HttpClient(object):
+    """HTTP client of the WSGI server keeping cookies, one connection per request"""
+
+    def __init__(self, port):
+        self.port = port
+        self.cookies = SimpleCookie()
+
+    def request(self, method, path, data=None):
+        headers = {'X-Forwarded-Proto': 'https'}
+        body = None
+        if data is not None:
+            body = urlencode(data, doseq=True)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.cookies:
+            headers['Cookie'] = '; '.join('{}={}'.format(key, morsel.value) for key, morsel in self.cookies.items())
+        connection = http.client.HTTPConnection('127.0.0.1', self.port)
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            response.read()
+            for cookie in response.headers.get_all('Set-Cookie') or []:
+                self.cookies.load(cookie)
+            return response.status
+        finally:
+            connection.close()
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class StatementCounter(object):
+    """Counts SQL statements executed by all threads"""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        with self._lock:
+            self.count += 1
+
+
+def login(client, state):
+    client.request('POST', '/', {'login': state['username'], 'password': PASSWORD})
+
+
+# scenariusz: funkcja wykonująca jedno mierzone żądanie, zwraca kod odpowiedzi
+def scenario_login(client, state):
+    # wylogowanie nie jest wliczane do czasu, ale jego zapytania są wliczane do sql/req
+    status = client.request('POST', '/', {'login': state['username'], 'password': PASSWORD})
+    client.request('GET', '/logout')
+    return status
+
+
+def scenario_task_list(client, state):
+    return client.request('GET', '/user/{}/{}'.format(state['username'], state['rng'].randint(1, state['pages'])))
+
+
+def scenario_add_task(client, state):
+    return client.request('POST', '/user/' + state['username'], {'task': 'new benchmark task', 'date': ''})
+
+
+def scenario_erase(client, state):
+    return client.request('POST', '/erase', {'erase': [state['task_ids'].pop()]})
+
+
+def scenario_poll(client, state):
+    return client.request('POST', '/poll', {'choice1': state['rng'].choice(['1', '2']),
+                                            'choice3': state['rng'].choice(['3', '4']), 'choice2': '', 'choice4': ''})
+
+
+def scenario_results(client, state):
+    return client.request('GET', '/results')
+
+
+SCENARIOS = OrderedDict([
+    ('login', scenario_login),
+    ('task_list', scenario_task_list),
+    ('add_task', scenario_add_task),
+    ('poll', scenario_poll),
+    ('results', scenario_results),
+    ('erase', scenario_erase),
+])
+
+
+def worker(make_client, scenario, state, requests, ready, latencies, errors, lock):
+    client = make_client()
+    if scenario is not scenario_login:
+        login(client, state)
+    ready.wait()    # pomiar zaczyna się gdy wszyscy klienci są zalogowani
+    done, failed = [], 0
+    for _ in range(requests):
+        start = time.perf_counter()
+        status = scenario(client, state)
+        done.append((time.perf_counter() - start) * 1000)
+        if status >= 400:
+            failed += 1
+    with lock:
+        latencies.extend(done)
+        errors[0] += failed
+
+
+def run_scenario(name, make_client, states, requests, counter):
+    latencies, errors, lock = [], [0], threading.Lock()
+    ready = threading.Barrier(len(states) + 1)
+    threads = [threading.Thread(target=worker, args=(make_client, SCENARIOS[name], state, requests, ready,
+                                                     latencies, errors, lock)) for state in states]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    statements = counter.count
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    statements = counter.count - statements
+    return OrderedDict([
+        ('requests', len(latencies)),
+        ('errors', errors[0]),
+        ('p50_ms', round(percentile(latencies, 0.5), 3)),
+        ('p95_ms', round(percentile(latencies, 0.95), 3)),
+        ('p99_ms', round(percentile(latencies, 0.99), 3)),
+        ('mean_ms', round(sum(latencies) / len(latencies), 3)),
+        ('throughput_rps', round(len(latencies) / elapsed, 1)),
+        ('sql_per_request', round(statements / len(latencies), 2)),
+    ])
+
+
+def make_states(clients, tasks_per_user, requests, seed):
+    pages = max(1, tasks_per_user // app.config['TASKS_PER_PAGE'])
+    return [{'username': get_username(number), 'pages': pages, 'rng': random.Random(seed + number),
+             'task_ids': list(get_task_ids(number, tasks_per_user))[-requests:]} for number in range(clients)]
+
+
+def clear_caches():
+    user_cache.clear()
+    poll_results_cache.clear()
+    page_cache.clear()
+
+
+def get_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, previous):
+    """Prints change of p50/p95/throughput against results of a previous run"""
+
+    old = {(row['mode'], row['scenario']): row for row in previous['results']}
+    print("\nchange against {} ({}):".format(previous['meta'].get('revision'), previous['meta'].get('date')))
+    print("{:<8} {:<10} {:>9} {:>9} {:>12}".format("mode", "scenario", "p50", "p95", "throughput"))
+    for row in results:
+        base = old.get((row['mode'], row['scenario']))
+        if base is None:
+            continue
+        print("{:<8} {:<10} {:>+8.0f}% {:>+8.0f}% {:>+11.0f}%".format(
+            row['mode'], row['scenario'], 100.0 * (row['p50_ms'] / base['p50_ms'] - 1),
+            100.0 * (row['p95_ms'] / base['p95_ms'] - 1),
+            100.0 * (row['throughput_rps'] / base['throughput_rps'] - 1)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--tasks', type=int, default=2000, help="tasks per user")
+    parser.add_argument('--votes', type=int, default=10000, help="poll votes in total")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--clients', type=int, default=8, help="concurrent clients, each logged in as other user")
+    parser.add_argument('--requests', type=int, default=50, help="requests per client in every scenario")
+    parser.add_argument('--modes', nargs='+', choices=['client', 'server'], default=['client', 'server'])
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--hash-profile', default='interactive', help="PASSWORD_HASH_PROFILE")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help="JSON file with results of a previous run")
+    args = parser.parse_args()
+    if args.clients > args.users:
+        parser.error("--clients can't be greater than --users")
+    if 'erase' in args.scenarios and args.requests * len(args.modes) > args.tasks:
+        parser.error("--tasks must be at least --requests times number of modes for the erase scenario")
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app.config['PASSWORD_HASH_PROFILE'] = args.hash_profile
+    app.config['PASSWORD_HASH_QUEUE_SIZE'] = max(args.clients, app.config.get('PASSWORD_HASH_QUEUE_SIZE', 0))
+    app.config['MAIL_OUTBOX_WORKER'] = False
+    app.config['ACCOUNT_PURGE_WORKER'] = False
+    password_hasher.init_app(app)
+    start = time.perf_counter()
+    with app.app_context():
+        populate(args.users, args.tasks, args.votes, args.seed)
+        counter = StatementCounter()
+        event.listen(db.engine, 'before_cursor_execute', counter)
+    print("{} users x {} tasks, {} votes loaded in {:.1f} s".format(args.users, args.tasks, args.votes,
+                                                                  time.perf_counter() - start))
+
+    states = make_states(args.clients, args.tasks, args.requests * len(args.modes), args.seed)
+    results = []
+    print("{:<8} {:<10} {:>8} {:>8} {:>8} {:>8} {:>9} {:>8} {:>7}".format(
+        "mode", "scenario", "requests", "p50 ms", "p95 ms", "p99 ms", "req/s", "sql/req", "errors"))
+    for mode in args.modes:
+        server = None
+        if mode == 'server':
+            server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietRequestHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            make_client = lambda: HttpClient(server.server_port)
+        else:
+            make_client = AppClient
+        try:
+            for name in args.scenarios:
+                clear_caches()
+                row = OrderedDict([('mode', mode), ('scenario', name)])
+                row.update(run_scenario(name, make_client, states, args.requests, counter))
+                results.append(row)
+                print("{mode:<8} {scenario:<10} {requests:>8} {p50_ms:>8.2f} {p95_ms:>8.2f} {p99_ms:>8.2f} "
+                      "{throughput_rps:>9.1f} {sql_per_request:>8.2f} {errors:>7}".format(**row))
+        finally:
+            if server is not None:
+                server.shutdown()
+    password_hasher.shutdown()
+
+    output = {
+        'meta': OrderedDict([
+            ('date', datetime.now().isoformat(timespec='seconds')), ('revision', get_revision()),
+            ('python', platform.python_version()), ('platform', platform.platform()), ('cpus', os.cpu_count()),
+            ('users', args.users), ('tasks_per_user', args.tasks), ('votes', args.votes), ('seed', args.seed),
+            ('clients', args.clients), ('requests_per_client', args.requests), ('hash_profile', args.hash_profile),
+            ('sqlite_profile', app.config['SQLITE_PROFILE']),
+        ]),
+        'results': results,
+    }
+    with open(args.output, 'w') as output_file:
+        json.dump(output, output_file, indent=2)
+    print("results saved to {}".format(args.output))
+    if args.compare:
+        with open(args.compare) as previous_file:
+            compare(results, json.load(previous_file))
+
+
+if __name__ == '__main__':
+    main()
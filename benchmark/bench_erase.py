@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# benchmark/bench_erase.py
+"""Compares deleting selected tasks one by one (SELECT + DELETE + COMMIT per id, as the /erase view used to do)
+with Task.handle_tasks_deleting() issuing a single DELETE statement.
+
+Usage: python -m benchmark.bench_erase [--sizes 10 100 1000] [--repeat 5]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from todo import create_app, db
+from todo.models import User, Task
+
+app = create_app()
+
+
+def insert_tasks(user_id, count):
+    db.session.execute(Task.__table__.insert(), [
+        dict(task="task {}".format(i), executed=0, data_pub=None, username_id=user_id) for i in range(count)])
+    db.session.commit()
+    return [task_id for (task_id,) in db.session.query(Task.id).filter_by(username_id=user_id)]
+
+
+def delete_one_by_one(task_ids, user_id):
+    for task_id in task_ids:
+        task = Task.query.filter_by(id=task_id).first()
+        db.session.delete(task)
+        db.session.commit()
+
+
+def delete_in_bulk(task_ids, user_id):
+    Task.handle_tasks_deleting(task_ids, user_id)
+
+
+def timed(function, task_ids, user_id):
+    start = time.perf_counter()
+    function(task_ids, user_id)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', password='x', email='bench@test.com')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        print("{:>6}  {:>14}  {:>10}  {:>8}".format("ids", "one by one ms", "bulk ms", "speedup"))
+        for size in args.sizes:
+            results = {}
+            for function in (delete_one_by_one, delete_in_bulk):
+                durations = sorted(timed(function, insert_tasks(user_id, size), user_id) for _ in range(args.repeat))
+                results[function] = durations[len(durations) // 2]
+            print("{:>6}  {:>14.2f}  {:>10.2f}  {:>7.1f}x".format(
+                size, results[delete_one_by_one], results[delete_in_bulk],
+                results[delete_one_by_one] / results[delete_in_bulk]))
+
+
+if __name__ == '__main__':
+    main()
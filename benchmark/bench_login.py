@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# benchmark/bench_login.py
+"""Measures login latency (p50/p95/p99) and throughput under concurrent load, hashing on the request threads
+(PASSWORD_HASH_WORKERS = 0) and on the bounded hashing pool.
+
+Usage: python -m benchmark.bench_login [--clients 16] [--logins 8] [--workers 0 2] [--profile interactive]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from benchmark import percentile
+from todo import create_app, db
+from todo.cache import user_cache
+from todo.hashing import password_hasher
+from todo.models import User
+
+app = create_app()
+
+BASE_URL = 'https://localhost'      # SSLify przekierowuje żądania http
+
+
+def client_loop(username, logins, latencies, lock):
+    client = app.test_client()
+    for _ in range(logins):
+        start = time.perf_counter()
+        response = client.post('/', data=dict(login=username, password='password'), base_url=BASE_URL)
+        duration = (time.perf_counter() - start) * 1000
+        assert response.status_code == 302, response.status_code
+        with lock:
+            latencies.append(duration)
+        client.get('/logout', base_url=BASE_URL)
+
+
+def run(clients, logins):
+    latencies, lock = [], threading.Lock()
+    threads = [threading.Thread(target=client_loop, args=('bench{}'.format(i), logins, latencies, lock))
+               for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=16, help="concurrent clients")
+    parser.add_argument('--logins', type=int, default=8, help="logins per client")
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 2], help="PASSWORD_HASH_WORKERS values")
+    parser.add_argument('--profile', default='interactive', help="PASSWORD_HASH_PROFILE")
+    args = parser.parse_args()
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app.config['PASSWORD_HASH_PROFILE'] = args.profile
+    app.config['PASSWORD_HASH_QUEUE_SIZE'] = args.clients
+    app.config['PASSWORD_HASH_TIMEOUT'] = 60
+    password_hasher.init_app(app)
+    with app.app_context():
+        db.create_all()
+        password = User.hash_password('password')
+        for i in range(args.clients):
+            db.session.add(User(username='bench{}'.format(i), password=password, email='bench{}@test.com'.format(i)))
+        db.session.commit()
+
+    print("{} clients x {} logins, profile '{}' ({} cpu)".format(args.clients, args.logins, args.profile,
+                                                              os.cpu_count()))
+    print("{:>8}  {:>9}  {:>9}  {:>9}  {:>11}".format("workers", "p50 ms", "p95 ms", "p99 ms", "logins/s"))
+    for workers in args.workers:
+        app.config['PASSWORD_HASH_WORKERS'] = workers
+        password_hasher.init_app(app)
+        user_cache.clear()
+        latencies, elapsed = run(args.clients, args.logins)
+        print("{:>8}  {:>9.1f}  {:>9.1f}  {:>9.1f}  {:>11.1f}".format(
+            workers, percentile(latencies, 0.5), percentile(latencies, 0.95), percentile(latencies, 0.99),
+            len(latencies) / elapsed))
+    password_hasher.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+# benchmark/bench_search.py
+"""Measures task search on a large corpus: bulk build of the FTS5 index (as done by migration 012), insert cost
+with the sync triggers and latency of ranked, paginated searches compared with a LIKE scan.
+
+Usage: python -m benchmark.bench_search [--tasks 1000000] [--users 10] [--per-page 9]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from benchmark import measure
+from todo.search import CREATE_INDEX, CREATE_TRIGGERS, REBUILD_INDEX, build_match_query
+
+SCHEMA = """
+CREATE TABLE task (id INTEGER NOT NULL, task VARCHAR(255) NOT NULL, executed SMALLINT NOT NULL,
+                   data_pub DATETIME, username_id INTEGER, PRIMARY KEY (id));
+CREATE INDEX ix_task_username_id_data_pub_id ON task (username_id, data_pub, id);
+"""
+# słownik o rozkładzie zbliżonym do Zipfa: kilka bardzo częstych słów i długi ogon rzadkich
+COMMON = ['buy', 'call', 'send', 'email', 'meeting', 'report', 'pay', 'fix', 'clean', 'book']
+RARE = ['word{}'.format(i) for i in range(50000)]
+
+SEARCH = "SELECT task.* FROM task JOIN task_search ON task_search.rowid = task.id " \
+         "WHERE task.username_id = ? AND task_search MATCH ? ORDER BY task_search.rank, task.id DESC LIMIT ? OFFSET ?"
+COUNT = "SELECT count(*) FROM task WHERE task.username_id = ? " \
+        "AND task.id IN (SELECT rowid FROM task_search WHERE task_search MATCH ?)"
+LIKE = "SELECT count(*) FROM task WHERE username_id = ? AND task LIKE ?"
+
+
+def generate_rows(users, tasks):
+    random.seed(0)
+    for task_id in range(tasks):
+        words = [random.choice(COMMON)] + [random.choice(RARE) for _ in range(random.randint(1, 5))]
+        random.shuffle(words)
+        yield task_id, ' '.join(words), 0, None, task_id % users
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=1000000, help="tasks in total")
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--per-page', type=int, default=9)
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(os.path.join(tempfile.mkdtemp(), 'bench.db'))
+    connection.executescript(SCHEMA)
+    connection.executemany("INSERT INTO task VALUES (?, ?, ?, ?, ?)", generate_rows(args.users, args.tasks))
+    connection.commit()
+
+    start = time.perf_counter()
+    connection.execute(CREATE_INDEX)
+    connection.execute(REBUILD_INDEX)
+    for statement in CREATE_TRIGGERS:
+        connection.execute(statement)
+    connection.commit()
+    print("{} tasks, {} users: bulk index build {:.1f} s".format(args.tasks, args.users, time.perf_counter() - start))
+
+    next_id = [args.tasks]
+
+    def insert():
+        connection.execute("INSERT INTO task VALUES (?, ?, 0, NULL, 0)", (next_id[0], "buy word1 word2 word3"))
+        connection.commit()
+        next_id[0] += 1
+
+    median, worst = measure(insert, repeat=200)
+    print("insert + commit with trigger: median {:.2f} ms  max {:.2f} ms".format(median, worst))
+
+    per_page = args.per_page
+    cases = [
+        ("common word, page 1", 'buy', 0),
+        ("common word, page 100", 'buy', 99 * per_page),
+        ("rare word", 'word123', 0),
+        ("two words", 'buy word123', 0),
+        ("prefix 'word12'", 'word12', 0),
+    ]
+    print("{:<24} {:>12} {:>12} {:>10}".format("query", "page ms", "count ms", "matches"))
+    for name, text, offset in cases:
+        match_query = build_match_query(text)
+        page, _ = measure(lambda: connection.execute(SEARCH, (0, match_query, per_page, offset)).fetchall(), 10)
+        count, _ = measure(lambda: connection.execute(COUNT, (0, match_query)).fetchone(), 10)
+        matches = connection.execute(COUNT, (0, match_query)).fetchone()[0]
+        print("{:<24} {:>12.2f} {:>12.2f} {:>10}".format(name, page, count, matches))
+    like, _ = measure(lambda: connection.execute(LIKE, (0, '%word123%')).fetchone(), 5)
+    print("{:<24} {:>12} {:>12.2f}".format("rare word, LIKE scan", "", like))
+
+
+if __name__ == '__main__':
+    main()
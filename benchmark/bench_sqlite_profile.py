@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# benchmark/bench_sqlite_profile.py
+"""Compares SQLite engine profiles (SQLITE_PROFILES in config.py) under concurrent load: reader threads fetch
+pages of the task list while writer threads add tasks, each operation in its own transaction, like requests do.
+
+Usage: python -m benchmark.bench_sqlite_profile [--readers 8] [--writers 2] [--seconds 5] [--profiles default production]
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
+
+from benchmark import percentile
+from todo import create_app, db
+from todo.models import User, Task
+
+app = create_app()
+
+USERS = 20
+
+
+def setup_database(profile, tasks):
+    app.config['SQLITE_PROFILE'] = profile
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    with app.app_context():
+        db.create_all()
+        db.session.execute(User.__table__.insert(), [
+            dict(id=i, username='bench{}'.format(i), password='x', email='bench{}@test.com'.format(i),
+                 tasks_per_page=9, data_version=0) for i in range(USERS)])
+        db.session.execute(Task.__table__.insert(), [
+            dict(task="task {}".format(i), executed=0, data_pub=None, username_id=i % USERS) for i in range(tasks)])
+        db.session.commit()
+        User.repair_task_counters()
+
+
+def worker(operation, deadline, latencies, errors, lock):
+    with app.app_context():
+        done, failed = [], 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                operation(random.randrange(USERS))
+            except OperationalError:      # 'database is locked'
+                db.session.rollback()
+                failed += 1
+                continue
+            finally:
+                db.session.remove()
+            done.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(done)
+            errors[0] += failed
+
+
+def read(user_id):
+    user = User.query.get(user_id)
+    pages = max(1, min(20, user.tasks_count // user.tasks_per_page))
+    Task.get_all_tasks_by_username(user, random.randint(1, pages))
+
+
+def write(user_id):
+    Task.handle_task_adding('new task', '', user_id)
+
+
+def run(readers, writers, seconds):
+    deadline = time.perf_counter() + seconds
+    results = {read: ([], [0]), write: ([], [0])}
+    lock = threading.Lock()
+    threads = [threading.Thread(target=worker, args=(operation, deadline) + results[operation] + (lock,))
+               for operation, count in ((read, readers), (write, writers)) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--tasks', type=int, default=100000)
+    parser.add_argument('--profiles', nargs='+', default=['default', 'production'])
+    args = parser.parse_args()
+
+    print("{} readers, {} writers, {} s, {} tasks ({} cpu)".format(args.readers, args.writers, args.seconds,
+                                                                   args.tasks, os.cpu_count()))
+    print("{:<12} {:>9} {:>10} {:>10} {:>9} {:>10} {:>10} {:>7}".format(
+        "profile", "reads/s", "read p50", "read p99", "writes/s", "write p50", "write p99", "locked"))
+    for profile in args.profiles:
+        setup_database(profile, args.tasks)
+        results = run(args.readers, args.writers, args.seconds)
+        (reads, read_errors), (writes, write_errors) = results[read], results[write]
+        print("{:<12} {:>9.0f} {:>10.2f} {:>10.2f} {:>9.0f} {:>10.2f} {:>10.2f} {:>7}".format(
+            profile, len(reads) / args.seconds, percentile(reads, 0.5), percentile(reads, 0.99),
+            len(writes) / args.seconds, percentile(writes, 0.5), percentile(writes, 0.99),
+            read_errors[0] + write_errors[0]))
+
+
+if __name__ == '__main__':
+    main()
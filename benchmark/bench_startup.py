@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+# benchmark/bench_startup.py
+"""Measures cold start of the application (import and creation, first request) and memory of prefork workers:
+private (USS) and proportional (PSS) memory of workers forked from a master which imported the application
+before forking (preload) compared with workers importing it on their own. Linux only (/proc/<pid>/smaps_rollup).
+
+The application uses a database in a temporary directory and the account purge and mail outbox threads are
+disabled, so the benchmark does not create the database of config.py and no thread polls it.
+
+Usage: python -m benchmark.bench_startup [--entry wsgi:app] [--runs 10] [--workers 4] [--requests 20]
+"""
+import argparse
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BASE_URL = 'https://localhost'      # SSLify przekierowuje żądania http
+
+COLD_START = """
+import json, resource, sys, time
+start = time.perf_counter()
+module, _, name = sys.argv[1].partition(':')
+app = getattr(__import__(module, fromlist=[name]), name)
+app.config.update(json.loads(sys.argv[2]))
+ready = time.perf_counter()
+app.test_client().get('/', base_url='{base_url}')
+first = time.perf_counter()
+print(json.dumps({{'import': ready - start, 'first_request': first - ready,
+                  'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}}))
+""".format(base_url=BASE_URL)
+
+
+def get_settings():
+    """Returns settings of the measured application: database in a new temporary directory, no background threads"""
+
+    return {'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'),
+            'ACCOUNT_PURGE_WORKER': False, 'MAIL_OUTBOX_WORKER': False}
+
+
+def load_app(entry, settings):
+    module, _, name = entry.partition(':')
+    app = getattr(importlib.import_module(module), name)
+    app.config.update(settings)
+    return app
+
+
+def read_memory():
+    """Returns dict of Rss, Pss and private (Private_Clean + Private_Dirty) memory of this process in MiB"""
+
+    values = {}
+    with open('/proc/self/smaps_rollup') as smaps:
+        for line in smaps:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return {'rss': values['Rss'], 'pss': values['Pss'],
+            'uss': values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)}
+
+
+def serve(app, requests):
+    client = app.test_client()
+    for _ in range(requests):
+        client.get('/', base_url=BASE_URL)
+
+
+def run_workers(entry, settings, workers, requests, preload):
+    """Forks workers, each serves requests and reports its memory while all of them are alive"""
+
+    app = load_app(entry, settings) if preload else None
+    pipes, pids = [], []
+    release_read, release_write = os.pipe()
+    for _ in range(workers):
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            serve(app if preload else load_app(entry, settings), requests)
+            os.write(write_end, b'.')
+            os.read(release_read, 1)    # pomiar PSS dopiero gdy wszystkie procesy są gotowe
+            os.write(write_end, json.dumps(read_memory()).encode())
+            os._exit(0)
+        os.close(write_end)
+        pipes.append(read_end)
+        pids.append(pid)
+    for read_end in pipes:
+        os.read(read_end, 1)
+    os.write(release_write, b'.' * workers)
+    results = [json.loads(os.read(read_end, 4096).decode()) for read_end in pipes]
+    for pid in pids:
+        os.waitpid(pid, 0)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entry', default='wsgi:app', help="module:attribute of the application object")
+    parser.add_argument('--runs', type=int, default=10, help="cold starts measured")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=20, help="requests served by every worker")
+    parser.add_argument('--worker', choices=['preload', 'no-preload'], help=argparse.SUPPRESS)
+    parser.add_argument('--settings', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        # osobny proces, żeby aplikacja nie była zaimportowana wcześniej przez pomiar zimnego startu
+        print(json.dumps(run_workers(args.entry, json.loads(args.settings), args.workers, args.requests,
+                                     args.worker == 'preload')))
+        return
+
+    settings = json.dumps(get_settings())
+    starts = [json.loads(subprocess.check_output([sys.executable, '-c', COLD_START, args.entry, settings]))
+              for _ in range(args.runs)]
+    print("{} cold starts of {}:".format(args.runs, args.entry))
+    for key, unit, scale in (('import', 'ms', 1000), ('first_request', 'ms', 1000), ('rss_mb', 'MiB', 1)):
+        print("  {:<14} median {:>8.1f} {}".format(key, statistics.median(start[key] for start in starts) * scale,
+                                                  unit))
+
+    print("{} workers x {} requests:".format(args.workers, args.requests))
+    print("  {:<11} {:>9} {:>9} {:>9}".format("mode", "RSS MiB", "PSS MiB", "USS MiB"))
+    for mode in ('no-preload', 'preload'):
+        output = subprocess.check_output([sys.executable, '-m', 'benchmark.bench_startup', '--entry', args.entry,
+                                          '--workers', str(args.workers), '--requests', str(args.requests),
+                                          '--worker', mode, '--settings', settings])
+        workers = json.loads(output.decode().strip().splitlines()[-1])
+        print("  {:<11} {:>9.1f} {:>9.1f} {:>9.1f}".format(
+            mode, *(statistics.mean(worker[key] for worker in workers) for key in ('rss', 'pss', 'uss'))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# benchmark/bench_task_ordering.py
+"""Compares reading a page of the task list with the old schema (data_pub VARCHAR, no index on username_id)
+and the new one (data_pub DATETIME with (username_id, data_pub, id) index).
+
+Usage: python -m benchmark.bench_task_ordering [--tasks 100000] [--users 3] [--per-page 9]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+
+from benchmark import measure
+
+OLD_SCHEMA = """
+CREATE TABLE task (id INTEGER NOT NULL, task VARCHAR(255) NOT NULL, executed SMALLINT NOT NULL,
+                   data_pub VARCHAR(40), username_id INTEGER, PRIMARY KEY (id));
+"""
+NEW_SCHEMA = """
+CREATE TABLE task (id INTEGER NOT NULL, task VARCHAR(255) NOT NULL, executed SMALLINT NOT NULL,
+                   data_pub DATETIME, username_id INTEGER, PRIMARY KEY (id));
+CREATE INDEX ix_task_username_id_data_pub_id ON task (username_id, data_pub, id);
+"""
+FIRST_PAGE = "SELECT * FROM task WHERE username_id = ? ORDER BY data_pub DESC, id DESC LIMIT ?"
+DEEP_PAGE = "SELECT * FROM task WHERE username_id = ? ORDER BY data_pub DESC, id DESC LIMIT ? OFFSET ?"
+SEEK_PAGE = "SELECT * FROM task WHERE username_id = ? AND data_pub <= ? AND (data_pub < ? OR id < ?) " \
+            "ORDER BY data_pub DESC, id DESC LIMIT ?"
+
+
+def generate_rows(users, tasks, new_format):
+    """Yields task rows of given users in random insertion order, dates spread over ~3 years"""
+
+    random.seed(0)
+    start = datetime(2015, 1, 1)
+    task_id = 0
+    for _ in range(tasks):
+        for user_id in range(users):
+            date = start + timedelta(minutes=random.randint(0, 60 * 24 * 365 * 3))
+            data_pub = date.strftime('%Y-%m-%d %H:%M:%S.%f' if new_format else '%Y-%m-%d %H:%M')
+            yield task_id, "task {}".format(task_id), 0, data_pub, user_id
+            task_id += 1
+
+
+def build_database(path, schema, users, tasks, new_format):
+    connection = sqlite3.connect(path)
+    connection.executescript(schema)
+    connection.executemany("INSERT INTO task VALUES (?, ?, ?, ?, ?)", generate_rows(users, tasks, new_format))
+    connection.commit()
+    connection.execute("ANALYZE")
+    return connection
+
+
+def run(connection, per_page, tasks):
+    deep_offset = (tasks // per_page // 2) * per_page
+    boundary = connection.execute(DEEP_PAGE, (0, 1, deep_offset - 1)).fetchone()
+    queries = [
+        ("first page", FIRST_PAGE, (0, per_page)),
+        ("middle page, OFFSET", DEEP_PAGE, (0, per_page, deep_offset)),
+        ("middle page, keyset", SEEK_PAGE, (0, boundary[3], boundary[3], boundary[0], per_page)),
+    ]
+    results = []
+    for name, sql, params in queries:
+        median, worst = measure(lambda: connection.execute(sql, params).fetchall(), repeat=10)
+        plan = "; ".join(row[-1] for row in connection.execute("EXPLAIN QUERY PLAN " + sql, params))
+        results.append((name, median, worst, plan))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=100000, help="tasks per user")
+    parser.add_argument('--users', type=int, default=3)
+    parser.add_argument('--per-page', type=int, default=9)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    for label, schema, new_format in (("old schema", OLD_SCHEMA, False), ("new schema", NEW_SCHEMA, True)):
+        connection = build_database(os.path.join(directory, label.replace(' ', '_') + '.db'), schema,
+                                    args.users, args.tasks, new_format)
+        print("{} ({} users x {} tasks)".format(label, args.users, args.tasks))
+        for name, median, worst, plan in run(connection, args.per_page, args.tasks):
+            print("  {:<22} median {:8.2f} ms  max {:8.2f} ms  plan: {}".format(name, median, worst, plan))
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
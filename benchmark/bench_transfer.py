@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# benchmark/bench_transfer.py
+"""Measures streaming import and export of tasks: time and peak Python memory (tracemalloc) for growing files, which
+should stay flat, and the speed of batched import compared with adding tasks one by one.
+
+Usage: python -m benchmark.bench_transfer [--rows 10000 100000 1000000] [--format csv]
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from todo import create_app, db
+from todo.models import User, Task
+from todo.transfer import read_tasks, write_tasks
+
+app = create_app()
+
+SINGLE_ROWS = 2000
+
+
+def setup_database():
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    db.create_all()
+    db.session.add(User(id=1, username='bench', password='x', email='bench@test.com'))
+    db.session.commit()
+
+
+def generate_file(path, rows, file_format):
+    # co 50. wiersz jest pusty (odrzucany), co 3. ma datę
+    lines = (('task number {}'.format(i) if i % 50 else '', None if i % 3 else datetime(2017, 1, 19, 4, i % 60), i % 2)
+             for i in range(rows))
+    with open(path, 'w', encoding='utf-8', newline='') as output:
+        output.writelines(write_tasks(lines, file_format))
+
+
+def measure_memory(function):
+    """Returns (result, seconds, peak MiB allocated while function ran)"""
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+    args = parser.parse_args()
+
+    with app.app_context():
+        directory = tempfile.mkdtemp()
+        print("{:>9} {:>10} {:>12} {:>10} {:>12} {:>10}".format(
+            "rows", "import s", "import MiB", "export s", "export MiB", "rows/s"))
+        for rows in args.rows:
+            setup_database()
+            path = os.path.join(directory, 'tasks.' + args.format)
+            generate_file(path, rows, args.format)
+            with open(path, 'rb') as stream:
+                result, import_time, import_peak = measure_memory(
+                    lambda: Task.handle_tasks_import(read_tasks(stream, args.format), 1))
+            assert result.imported + result.rejected == rows
+            db.session.remove()
+
+            def export():
+                with open(os.devnull, 'w', encoding='utf-8') as output:
+                    output.writelines(write_tasks(Task.iter_tasks(1), args.format))
+
+            _, export_time, export_peak = measure_memory(export)
+            db.session.remove()
+            print("{:>9} {:>10.1f} {:>12.1f} {:>10.1f} {:>12.1f} {:>10.0f}".format(
+                rows, import_time, import_peak, export_time, export_peak, rows / import_time))
+
+        setup_database()
+        start = time.perf_counter()
+        for i in range(SINGLE_ROWS):
+            Task.handle_task_adding('task number {}'.format(i), '', 1)
+        print("handle_task_adding one by one: {:.0f} rows/s".format(SINGLE_ROWS / (time.perf_counter() - start)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# benchmark/data.py
+"""Seeded synthetic data for benchmarks: users, their tasks and poll votes, bulk loaded with executemany INSERTs.
+The same seed always gives the same data, so results of different runs can be compared."""
+import random
+from datetime import datetime, timedelta
+
+from todo import db
+from todo.models import User, Task, Question, Choice
+
+PASSWORD = 'password'
+CHUNK_SIZE = 10000
+POLL = [
+    (1, 'Do You like this website?', [(1, 'Yes'), (2, 'No')]),
+    (2, 'What do you like? What would You improve?', []),
+    (3, 'Does this website work properly?', [(3, 'Yes'), (4, 'No')]),
+    (4, 'If not then what works wrong?', []),
+]
+WORDS = ['buy', 'call', 'send', 'email', 'meeting', 'report', 'pay', 'fix', 'clean', 'book', 'milk', 'car', 'mom',
+         'invoice', 'tickets', 'dentist', 'project', 'review', 'garden', 'gym']
+
+
+def get_username(user_number):
+    return 'bench{}'.format(user_number)
+
+
+def get_task_ids(user_number, tasks_per_user):
+    """Returns range of ids of tasks loaded for the user (tasks are inserted user after user)"""
+
+    return range(user_number * tasks_per_user + 1, (user_number + 1) * tasks_per_user + 1)
+
+
+def generate_tasks(rng, users, tasks_per_user):
+    start = datetime(2017, 1, 1)
+    for user_number in range(users):
+        for _ in range(tasks_per_user):
+            # co piąte zadanie bez daty, co trzecie wykonane
+            data_pub = None if rng.random() < 0.2 else start + timedelta(minutes=rng.randrange(2 * 365 * 24 * 60))
+            yield {'task': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 6))),
+                   'executed': int(rng.random() < 0.33), 'data_pub': data_pub, 'username_id': user_number + 1}
+
+
+def insert_chunks(table, rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == CHUNK_SIZE:
+            db.session.execute(table.insert(), chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(table.insert(), chunk)
+
+
+def populate(users, tasks_per_user, votes, seed=0):
+    """Creates tables and loads users bench0..bench<users-1> (password PASSWORD, user number n has id n + 1),
+    tasks_per_user tasks for each of them and the poll with votes votes spread over its choices. Requires
+    application context"""
+
+    rng = random.Random(seed)
+    db.create_all()
+    password = User.hash_password(PASSWORD)     # jeden hash dla wszystkich, hashowanie jest celowo wolne
+    insert_chunks(User.__table__, ({'id': user_number + 1, 'username': get_username(user_number), 'password': password,
+                                    'email': '{}@bench.com'.format(get_username(user_number)), 'tasks_per_page': 9,
+                                    'data_version': 0} for user_number in range(users)))
+    insert_chunks(Task.__table__, generate_tasks(rng, users, tasks_per_user))
+    db.session.execute(Question.__table__.insert(), [
+        {'id': question_id, 'question_text': text, 'pub_date': datetime(2017, 1, 1)} for question_id, text, _ in POLL])
+    choices = [(question_id, choice_id, text) for question_id, _, question_choices in POLL
+               for choice_id, text in question_choices]
+    counts = [0] * len(choices)
+    for _ in range(votes):
+        counts[rng.randrange(len(choices))] += 1
+    db.session.execute(Choice.__table__.insert(), [
+        {'id': choice_id, 'question': question_id, 'choice_text': text, 'votes': count}
+        for (question_id, choice_id, text), count in zip(choices, counts)])
+    db.session.commit()
+    User.repair_task_counters()     # zadania wstawione bezpośrednio, liczniki liczone raz na końcu
@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 
 import os
-import pymysql
 basedir = os.path.abspath(os.path.dirname(__file__))    # ścieżka dostepu do katalogu głównego
 
 CSRF_ENABLED = True          # ochrona przed atakiami typu CSRF
@@ -10,6 +9,28 @@ SECRET_KEY = 'verysecretvalue'        # sekretna wartosc niezbeda do autoryzacji
 # połączenie z bazą danych
 SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(basedir, 'base.db')
 
+# profile połączeń SQLite: pragmy wykonywane przy każdym nowym połączeniu i ustawienia puli połączeń
+SQLITE_PROFILES = {
+    # ustawienia domyślne SQLite: dziennik rollback (zapis blokuje odczyty), nowe połączenie przy każdym użyciu
+    'default': {'pragmas': {}, 'pool_size': 0},
+    'production': {
+        'pragmas': {
+            'journal_mode': 'WAL',      # odczyty nie czekają na zapis, zapisy nie czekają na odczyty
+            'synchronous': 'NORMAL',        # w trybie WAL bezpieczne, fsync tylko przy checkpoint
+            'busy_timeout': 5000,       # ms oczekiwania na zwolnienie blokady zamiast błędu 'database is locked'
+            'cache_size': -16384,       # 16 MiB cache stron na połączenie
+            'mmap_size': 268435456,     # 256 MiB pliku bazy mapowane w pamięci
+            'temp_store': 'MEMORY',
+            'foreign_keys': 'ON',
+        },
+        'pool_size': 5,
+        'max_overflow': 10,
+        'pool_timeout': 30,     # s oczekiwania na wolne połączenie z puli
+        'pool_recycle': 3600,
+    },
+}
+SQLITE_PROFILE = 'production'
+
 SQLALCHEMY_MIGRATE_REPO = os.path.join(basedir, 'db_repository')    # repozytorium trzymające informacje o migracjach
 SITE_NAME = 'My Tasks'      # nazwa strony
 SQLALCHEMY_TRACK_MODIFICATIONS = True
@@ -22,7 +43,70 @@ MAIL_USE_SSL = True
 MAIL_USERNAME = 'example_mail'
 MAIL_PASSWORD = 'example_pass'
 
+# mail outbox, emails are sent by a background thread
+MAIL_OUTBOX_WORKER = True       # False - brak wątku, emaile wysyła 'python send_mail.py' (np. z crona)
+MAIL_OUTBOX_BATCH_SIZE = 20     # liczba emaili pobieranych z outboxa naraz
+MAIL_OUTBOX_POLL_INTERVAL = 60      # czas (s) co jaki wątek sprawdza outbox bez wybudzania
+MAIL_OUTBOX_LEASE = 300     # czas (s) po którym niewysłany, pobrany email może zostać pobrany ponownie
+MAIL_OUTBOX_RETRY_DELAY = 30        # opóźnienie (s) pierwszej ponownej próby, kolejne 2x dłuższe
+MAIL_OUTBOX_MAX_ATTEMPTS = 5
+
+# password hashing (argon2), named cost profiles
+PASSWORD_HASH_PROFILES = {
+    'interactive': {'rounds': 4, 'memory_cost': 65536, 'parallelism': 4},      # 64 MiB
+    'sensitive': {'rounds': 3, 'memory_cost': 262144, 'parallelism': 4},       # 256 MiB
+    'test': {'rounds': 1, 'memory_cost': 8, 'parallelism': 1},                  # tylko do testów!
+}
+PASSWORD_HASH_PROFILE = 'interactive'
+PASSWORD_HASH_WORKERS = 2       # liczba wątków liczących hashe, 0 - hashowanie w wątku requestu
+PASSWORD_HASH_QUEUE_SIZE = 32       # liczba zadań czekających na wolny wątek
+PASSWORD_HASH_TIMEOUT = 10      # czas (s) oczekiwania na miejsce w kolejce, potem błąd 503
+
+# user cache (user_loader flask-login)
+USER_CACHE_SIZE = 1000      # maksymalna liczba użytkowników trzymanych w pamięci
+USER_CACHE_TTL = 30         # czas (s) po którym dane użytkownika są wczytywane ponownie z bazy
+
+# poll results cache, invalidated by every vote
+POLL_RESULTS_CACHE_TTL = 300        # ogranicza nieaktualność wyników gdy głosy zapisują inne procesy
+
+# poll votes
+POLL_VOTE_BUFFER = False        # True - głosy zliczane w pamięci i zapisywane zbiorczo (np. podczas fali głosów)
+POLL_VOTE_FLUSH_INTERVAL = 1        # czas (s) pomiędzy zapisami zbuforowanych głosów
+
 # pagination
 TASKS_PER_PAGE = 9
 
+# tasks import / export
+TASKS_IMPORT_BATCH_SIZE = 1000    # zadania importowane jednym INSERT (executemany) i jedną transakcją
+TASKS_EXPORT_CHUNK_SIZE = 1000    # zadania eksportowane jednym zapytaniem
+TASKS_IMPORT_REJECTED_LINES = 10  # ile numerów odrzuconych wierszy pokazać użytkownikowi
+
+# tags
+TAG_CLOUD_SIZE = 50         # ile najczęściej używanych tagów pokazać w chmurze tagów
+TASK_LIST_MAX_TAGS = 5      # ile tagów można podać w filtrze listy zadań
+
+# account deleting
+ACCOUNT_PURGE_THRESHOLD = 10000     # konta z większą liczbą zadań są usuwane w tle, partiami
+ACCOUNT_PURGE_WORKER = True         # False - brak wątku, trzeba uruchamiać 'python purge_accounts.py' (np. z crona)
+ACCOUNT_PURGE_CHUNK_SIZE = 5000     # zadania usuwane w jednej transakcji
+ACCOUNT_PURGE_PAUSE = 0.1           # przerwa (s) pomiędzy transakcjami, żeby nie blokować innych zapisów
+ACCOUNT_PURGE_POLL_INTERVAL = 600   # co ile sekund wątek sprawdza czy są konta do usunięcia
+
+# request profiling (czas, CPU i zapytania SQL każdego żądania; histogramy pod /debug/profiling)
+PROFILING = False       # /debug/profiling nie wymaga logowania, odpowiada tylko na żądania z adresów poniżej
+PROFILING_ALLOWED_ADDRESSES = ('127.0.0.1', '::1')      # bez żądań przez proxy (z nagłówkiem X-Forwarded-For)
+PROFILING_SLOW_REQUEST = 0.5        # żądania wolniejsze niż tyle sekund są logowane razem z zapytaniami
+PROFILING_SLOW_QUERY = 0.1          # zapytania wolniejsze niż tyle sekund są logowane
+PROFILING_SAMPLE_RATE = 0.01        # część żądań wykonywana pod cProfile
+PROFILING_DUMP_DIR = os.path.join(basedir, 'profiles')      # profile wolnych żądań (pliki .prof)
+
+# rendered task list pages cache
+PAGE_CACHE_SIZE = 2000      # maksymalna liczba stron
+PAGE_CACHE_MEMORY = 32 * 1024 * 1024        # maksymalny rozmiar (B) wszystkich stron
+PAGE_CACHE_TTL = 300
+
+# JSON API
+API_TASKS_LIMIT = 20        # domyślna liczba zadań na stronie
+API_TASKS_MAX_LIMIT = 100
+
 
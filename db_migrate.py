@@ -2,6 +2,7 @@
 import imp
 from migrate.versioning import api
 from todo import db
+from todo import models     # modele rejestrują tabele w db.metadata, aplikacja nie jest potrzebna
 from config import SQLALCHEMY_DATABASE_URI
 from config import SQLALCHEMY_MIGRATE_REPO
 v = api.db_version(SQLALCHEMY_DATABASE_URI, SQLALCHEMY_MIGRATE_REPO)
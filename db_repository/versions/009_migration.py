@@ -0,0 +1,84 @@
+from datetime import datetime
+
+from sqlalchemy import *
+from migrate import *
+
+
+from migrate.changeset import schema
+pre_meta = MetaData()
+post_meta = MetaData()
+
+# Task.data_pub: String(40) -> DateTime, plus composite index used by the task list ordering
+CHUNK_SIZE = 5000
+DATE_FORMATS = ('%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d')
+INDEX_NAME = 'ix_task_username_id_data_pub_id'
+
+
+def parse_date(value):
+    """Parses date string saved by the old Task.get_string_date(). Returns datetime or None"""
+
+    if not value:
+        return None
+    value = " ".join(value.strip().split('T'))
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            pass
+    return None
+
+
+def format_date(value):
+    if value is None:
+        return ""
+    return value.strftime('%Y-%m-%d %H:%M')
+
+
+def reflect_task(migrate_engine):
+    """Reflects current shape of the task table, columns are renamed in between so metadata is never reused"""
+
+    return Table('task', MetaData(bind=migrate_engine), autoload=True)
+
+
+def copy_column(migrate_engine, task, source, target, convert):
+    """Streams (id, source) pairs in id ordered chunks and writes converted values to target with executemany"""
+
+    update = task.update().where(task.c.id == bindparam('task_id')).values({target: bindparam('value')})
+    last_id = None
+    while True:
+        query = select([task.c.id, task.c[source]]).order_by(task.c.id).limit(CHUNK_SIZE)
+        if last_id is not None:
+            query = query.where(task.c.id > last_id)
+        rows = migrate_engine.execute(query).fetchall()
+        if not rows:
+            break
+        with migrate_engine.begin() as connection:
+            connection.execute(update, [dict(task_id=row[0], value=convert(row[1])) for row in rows])
+        last_id = rows[-1][0]
+
+
+def upgrade(migrate_engine):
+    # Upgrade operations go here. Don't create your own engine; bind
+    # migrate_engine to your metadata
+    pre_meta.bind = migrate_engine
+    post_meta.bind = migrate_engine
+    task = reflect_task(migrate_engine)
+    Column('data_pub_date', DateTime).create(task)
+    copy_column(migrate_engine, task, 'data_pub', 'data_pub_date', parse_date)
+    task.c.data_pub.drop()
+    task.c.data_pub_date.alter(name='data_pub')
+    task = reflect_task(migrate_engine)
+    Index(INDEX_NAME, task.c.username_id, task.c.data_pub, task.c.id).create()
+
+
+def downgrade(migrate_engine):
+    # Operations to reverse the above upgrade go here.
+    pre_meta.bind = migrate_engine
+    post_meta.bind = migrate_engine
+    task = reflect_task(migrate_engine)
+    Index(INDEX_NAME, task.c.username_id, task.c.data_pub, task.c.id).drop()
+    task = reflect_task(migrate_engine)
+    Column('data_pub_string', String(length=40)).create(task)
+    copy_column(migrate_engine, task, 'data_pub', 'data_pub_string', format_date)
+    task.c.data_pub.drop()
+    task.c.data_pub_string.alter(name='data_pub')
@@ -0,0 +1,34 @@
+from sqlalchemy import *
+from migrate import *
+
+
+from migrate.changeset import schema
+pre_meta = MetaData()
+post_meta = MetaData()
+
+# User.tasks_per_page gets a schema default, User.page is replaced by a value kept in the signed session
+TASKS_PER_PAGE = 9
+
+
+def reflect_user(migrate_engine):
+    return Table('user', MetaData(bind=migrate_engine), autoload=True)
+
+
+def upgrade(migrate_engine):
+    # Upgrade operations go here. Don't create your own engine; bind
+    # migrate_engine to your metadata
+    pre_meta.bind = migrate_engine
+    post_meta.bind = migrate_engine
+    user = reflect_user(migrate_engine)
+    migrate_engine.execute(user.update().where(user.c.tasks_per_page.is_(None)).values(tasks_per_page=TASKS_PER_PAGE))
+    user.c.tasks_per_page.alter(server_default=str(TASKS_PER_PAGE))
+    reflect_user(migrate_engine).c.page.drop()
+
+
+def downgrade(migrate_engine):
+    # Operations to reverse the above upgrade go here.
+    pre_meta.bind = migrate_engine
+    post_meta.bind = migrate_engine
+    user = reflect_user(migrate_engine)
+    Column('page', Integer).create(user)
+    reflect_user(migrate_engine).c.tasks_per_page.alter(server_default=None)
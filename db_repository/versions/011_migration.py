@@ -0,0 +1,33 @@
+from sqlalchemy import *
+from migrate import *
+
+
+from migrate.changeset import schema
+pre_meta = MetaData()
+post_meta = MetaData()
+outbox_mail = Table('outbox_mail', post_meta,
+    Column('id', Integer, primary_key=True, nullable=False),
+    Column('recipient', String(length=100), nullable=False),
+    Column('subject', String(length=255), nullable=False),
+    Column('body', Text, nullable=False),
+    Column('created', DateTime, nullable=False),
+    Column('attempts', Integer, nullable=False, server_default='0'),
+    Column('next_attempt', DateTime),
+    Column('last_error', String(length=255)),
+    Index('ix_outbox_mail_next_attempt', 'next_attempt'),
+)
+
+
+def upgrade(migrate_engine):
+    # Upgrade operations go here. Don't create your own engine; bind
+    # migrate_engine to your metadata
+    pre_meta.bind = migrate_engine
+    post_meta.bind = migrate_engine
+    post_meta.tables['outbox_mail'].create()
+
+
+def downgrade(migrate_engine):
+    # Operations to reverse the above upgrade go here.
+    pre_meta.bind = migrate_engine
+    post_meta.bind = migrate_engine
+    post_meta.tables['outbox_mail'].drop()
@@ -0,0 +1,49 @@
+from sqlalchemy import *
+from migrate import *
+
+
+from migrate.changeset import schema
+pre_meta = MetaData()
+post_meta = MetaData()
+
+# FTS5 index of Task.task (external content table, kept in sync by triggers), SQLite only
+CREATE_INDEX = ("CREATE VIRTUAL TABLE IF NOT EXISTS task_search USING fts5("
+                "task, content='task', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+CREATE_TRIGGERS = (
+    "CREATE TRIGGER IF NOT EXISTS task_search_insert AFTER INSERT ON task BEGIN "
+    "INSERT INTO task_search(rowid, task) VALUES (new.id, new.task); END",
+    "CREATE TRIGGER IF NOT EXISTS task_search_delete AFTER DELETE ON task BEGIN "
+    "INSERT INTO task_search(task_search, rowid, task) VALUES ('delete', old.id, old.task); END",
+    "CREATE TRIGGER IF NOT EXISTS task_search_update AFTER UPDATE OF task ON task BEGIN "
+    "INSERT INTO task_search(task_search, rowid, task) VALUES ('delete', old.id, old.task); "
+    "INSERT INTO task_search(rowid, task) VALUES (new.id, new.task); END",
+)
+# one pass over the task table instead of a trigger call per row
+REBUILD_INDEX = "INSERT INTO task_search(task_search) VALUES ('rebuild')"
+TRIGGERS = ('task_search_insert', 'task_search_delete', 'task_search_update')
+
+
+def upgrade(migrate_engine):
+    # Upgrade operations go here. Don't create your own engine; bind
+    # migrate_engine to your metadata
+    pre_meta.bind = migrate_engine
+    post_meta.bind = migrate_engine
+    if migrate_engine.dialect.name != 'sqlite':
+        return
+    with migrate_engine.begin() as connection:
+        connection.execute(CREATE_INDEX)
+        connection.execute(REBUILD_INDEX)
+        for statement in CREATE_TRIGGERS:
+            connection.execute(statement)
+
+
+def downgrade(migrate_engine):
+    # Operations to reverse the above upgrade go here.
+    pre_meta.bind = migrate_engine
+    post_meta.bind = migrate_engine
+    if migrate_engine.dialect.name != 'sqlite':
+        return
+    with migrate_engine.begin() as connection:
+        for name in TRIGGERS:
+            connection.execute("DROP TRIGGER IF EXISTS " + name)
+        connection.execute("DROP TABLE IF EXISTS task_search")
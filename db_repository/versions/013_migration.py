@@ -0,0 +1,28 @@
+from sqlalchemy import *
+from migrate import *
+
+
+from migrate.changeset import schema
+pre_meta = MetaData()
+post_meta = MetaData()
+
+# User.data_version is bumped by every change of user's tasks, served as ETag by the JSON API
+
+
+def reflect_user(migrate_engine):
+    return Table('user', MetaData(bind=migrate_engine), autoload=True)
+
+
+def upgrade(migrate_engine):
+    # Upgrade operations go here. Don't create your own engine; bind
+    # migrate_engine to your metadata
+    pre_meta.bind = migrate_engine
+    post_meta.bind = migrate_engine
+    Column('data_version', Integer, nullable=False, server_default='0').create(reflect_user(migrate_engine))
+
+
+def downgrade(migrate_engine):
+    # Operations to reverse the above upgrade go here.
+    pre_meta.bind = migrate_engine
+    post_meta.bind = migrate_engine
+    reflect_user(migrate_engine).c.data_version.drop()
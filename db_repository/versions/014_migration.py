@@ -0,0 +1,31 @@
+from sqlalchemy import *
+from migrate import *
+
+
+from migrate.changeset import schema
+pre_meta = MetaData()
+post_meta = MetaData()
+
+# User.deleted_at marks accounts waiting for the background purge of their tasks
+
+
+def reflect_user(migrate_engine):
+    return Table('user', MetaData(bind=migrate_engine), autoload=True)
+
+
+def upgrade(migrate_engine):
+    # Upgrade operations go here. Don't create your own engine; bind
+    # migrate_engine to your metadata
+    pre_meta.bind = migrate_engine
+    post_meta.bind = migrate_engine
+    user = reflect_user(migrate_engine)
+    Column('deleted_at', DateTime).create(user)
+    Index('ix_user_deleted_at', user.c.deleted_at).create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    # Operations to reverse the above upgrade go here.
+    pre_meta.bind = migrate_engine
+    post_meta.bind = migrate_engine
+    Index('ix_user_deleted_at', reflect_user(migrate_engine).c.deleted_at).drop(migrate_engine)
+    reflect_user(migrate_engine).c.deleted_at.drop()
@@ -0,0 +1,43 @@
+from sqlalchemy import *
+from migrate import *
+
+
+from migrate.changeset import schema
+pre_meta = MetaData()
+post_meta = MetaData()
+
+# User.tasks_count and User.executed_count, counters of user's tasks changed together with the tasks
+
+
+def reflect_user(migrate_engine):
+    return Table('user', MetaData(bind=migrate_engine), autoload=True)
+
+
+def upgrade(migrate_engine):
+    # Upgrade operations go here. Don't create your own engine; bind
+    # migrate_engine to your metadata
+    pre_meta.bind = migrate_engine
+    post_meta.bind = migrate_engine
+    user = reflect_user(migrate_engine)
+    Column('tasks_count', Integer, nullable=False, server_default='0').create(user)
+    Column('executed_count', Integer, nullable=False, server_default='0').create(user)
+
+    # początkowe wartości liczone jednym GROUP BY po wszystkich zadaniach
+    user = reflect_user(migrate_engine)
+    task = Table('task', MetaData(bind=migrate_engine), autoload=True)
+    executed = func.sum(case([(task.c.executed != 0, 1)], else_=0))
+    counts = [{'user_id': user_id, 'tasks': tasks, 'executed': executed_tasks or 0}
+              for user_id, tasks, executed_tasks in migrate_engine.execute(
+                  select([task.c.username_id, func.count(), executed]).where(task.c.username_id.isnot(None))
+                  .group_by(task.c.username_id))]
+    if counts:
+        migrate_engine.execute(user.update().where(user.c.id == bindparam('user_id'))
+                               .values(tasks_count=bindparam('tasks'), executed_count=bindparam('executed')), counts)
+
+
+def downgrade(migrate_engine):
+    # Operations to reverse the above upgrade go here.
+    pre_meta.bind = migrate_engine
+    post_meta.bind = migrate_engine
+    reflect_user(migrate_engine).c.executed_count.drop()
+    reflect_user(migrate_engine).c.tasks_count.drop()
@@ -0,0 +1,31 @@
+from sqlalchemy import *
+from migrate import *
+
+
+from migrate.changeset import schema
+pre_meta = MetaData()
+post_meta = MetaData()
+
+# index of the task list filtered by status (Task.executed), read in data_pub order like the unfiltered list
+INDEX_NAME = 'ix_task_username_id_executed_data_pub_id'
+
+
+def reflect_task(migrate_engine):
+    return Table('task', MetaData(bind=migrate_engine), autoload=True)
+
+
+def upgrade(migrate_engine):
+    # Upgrade operations go here. Don't create your own engine; bind
+    # migrate_engine to your metadata
+    pre_meta.bind = migrate_engine
+    post_meta.bind = migrate_engine
+    task = reflect_task(migrate_engine)
+    Index(INDEX_NAME, task.c.username_id, task.c.executed, task.c.data_pub, task.c.id).create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    # Operations to reverse the above upgrade go here.
+    pre_meta.bind = migrate_engine
+    post_meta.bind = migrate_engine
+    task = reflect_task(migrate_engine)
+    Index(INDEX_NAME, task.c.username_id, task.c.executed, task.c.data_pub, task.c.id).drop(migrate_engine)
@@ -0,0 +1,79 @@
+import re
+from collections import Counter
+
+from sqlalchemy import *
+from migrate import *
+
+
+from migrate.changeset import schema
+pre_meta = MetaData()
+post_meta = MetaData()
+
+# Tag with its counter of tasks and task_tag links indexed in both directions, filled from #tags of existing tasks
+CHUNK_SIZE = 5000
+TAG_PATTERN = re.compile(r'(?<![\w#])#(\w[\w-]{0,39})(?![\w-])', re.UNICODE)
+
+tag = Table('tag', post_meta,
+    Column('id', Integer, primary_key=True, nullable=False),
+    Column('name', String(length=40), nullable=False),
+    Column('username_id', Integer, ForeignKey('user.id'), nullable=False),
+    Column('tasks_count', Integer, nullable=False, server_default='0'),
+    Index('ix_tag_username_id_name', 'username_id', 'name', unique=True),
+)
+
+task_tag = Table('task_tag', post_meta,
+    Column('task_id', Integer, ForeignKey('task.id'), primary_key=True, nullable=False),
+    Column('tag_id', Integer, ForeignKey('tag.id'), primary_key=True, nullable=False),
+    Index('ix_task_tag_tag_id_task_id', 'tag_id', 'task_id'),
+)
+
+
+def tag_tasks(migrate_engine):
+    """Streams tasks containing '#' in id ordered chunks, creates tags of their texts and links them, tag counters
+    are increased by every chunk"""
+
+    task = Table('task', MetaData(bind=migrate_engine), autoload=True)
+    tag_ids = {}
+    last_id = 0
+    while True:
+        rows = migrate_engine.execute(select([task.c.id, task.c.username_id, task.c.task])
+                                      .where(and_(task.c.id > last_id, task.c.username_id.isnot(None),
+                                                  task.c.task.contains('#')))
+                                      .order_by(task.c.id).limit(CHUNK_SIZE)).fetchall()
+        if not rows:
+            break
+        links = [(task_id, (user_id, name)) for task_id, user_id, text in rows
+                 for name in {name.lower() for name in TAG_PATTERN.findall(text)}]
+        with migrate_engine.begin() as connection:
+            for key in sorted({key for task_id, key in links} - tag_ids.keys()):
+                tag_ids[key] = connection.execute(tag.insert().values(username_id=key[0], name=key[1],
+                                                                      tasks_count=0)).inserted_primary_key[0]
+            if links:
+                connection.execute(task_tag.insert(), [dict(task_id=task_id, tag_id=tag_ids[key])
+                                                       for task_id, key in links])
+                counts = Counter(tag_ids[key] for task_id, key in links)
+                connection.execute(tag.update().where(tag.c.id == bindparam('tag_id'))
+                                   .values(tasks_count=tag.c.tasks_count + bindparam('count')),
+                                   [dict(tag_id=tag_id, count=count) for tag_id, count in counts.items()])
+        last_id = rows[-1][0]
+
+
+def upgrade(migrate_engine):
+    # Upgrade operations go here. Don't create your own engine; bind
+    # migrate_engine to your metadata
+    pre_meta.bind = migrate_engine
+    post_meta.bind = migrate_engine
+    # tabele, do których odwołują się klucze obce tag i task_tag, takie same jak w modelach
+    Table('user', post_meta, autoload=True)
+    Table('task', post_meta, autoload=True)
+    post_meta.tables['tag'].create()
+    post_meta.tables['task_tag'].create()
+    tag_tasks(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    # Operations to reverse the above upgrade go here.
+    pre_meta.bind = migrate_engine
+    post_meta.bind = migrate_engine
+    post_meta.tables['task_tag'].drop()
+    post_meta.tables['tag'].drop()
@@ -0,0 +1,25 @@
+from sqlalchemy import *
+from migrate import *
+
+
+from migrate.changeset import schema
+pre_meta = MetaData()
+post_meta = MetaData()
+
+# bodies of emails given up (OutboxMail.mark_failed after max attempts) may contain a password, they are cleared
+
+
+def upgrade(migrate_engine):
+    # Upgrade operations go here. Don't create your own engine; bind
+    # migrate_engine to your metadata
+    pre_meta.bind = migrate_engine
+    post_meta.bind = migrate_engine
+    outbox_mail = Table('outbox_mail', MetaData(bind=migrate_engine), autoload=True)
+    migrate_engine.execute(outbox_mail.update().where(outbox_mail.c.next_attempt.is_(None)).values(body=''))
+
+
+def downgrade(migrate_engine):
+    # Operations to reverse the above upgrade go here.
+    pre_meta.bind = migrate_engine
+    post_meta.bind = migrate_engine
+    # wyczyszczonych treści nie da się przywrócić
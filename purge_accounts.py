@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""Purges accounts marked deleted (User.deleted_at) with their tasks, i.e. from cron when ACCOUNT_PURGE_WORKER = False.
+
+Usage: python purge_accounts.py
+"""
+import argparse
+
+from todo import create_app
+from todo.purge import account_purger
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.parse_args()
+
+    with create_app().app_context():
+        print("Purged {} accounts".format(account_purger.purge_pending()))
+
+
+if __name__ == '__main__':
+    main()
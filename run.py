@@ -1,6 +1,8 @@
 #!flask/bin/python
 # -*- coding: utf-8 -*-
-from todo import app
+from todo import create_app
+
+app = create_app()
 
 if __name__ == '__main__':
     app.run(debug=True)         # uruchomienie aplikacji
\ No newline at end of file
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""Sends due emails from the outbox (OutboxMail), i.e. from cron when MAIL_OUTBOX_WORKER = False.
+
+Usage: python send_mail.py
+"""
+import argparse
+
+from todo import create_app
+from todo.mailer import mail_dispatcher
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.parse_args()
+
+    with create_app().app_context():
+        print("Sent {} emails".format(mail_dispatcher.flush()))
+
+
+if __name__ == '__main__':
+    main()
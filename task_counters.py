@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""Checks counters of tasks stored with users (tasks_count, executed_count) against the tasks, optionally repairs them.
+
+Usage: python task_counters.py [--repair]
+Exits with status 1 if wrong counters were found and not repaired.
+"""
+import argparse
+import sys
+
+from todo import create_app
+from todo.models import User
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repair', action='store_true', help="recount tasks of users with wrong counters")
+    args = parser.parse_args()
+
+    with create_app().app_context():
+        drift = User.get_task_counters_drift()
+        for user in drift:
+            print("user {}: tasks {} (counted {}), executed {} (counted {})".format(
+                user.user_id, user.tasks, user.actual_tasks, user.executed, user.actual_executed))
+        if not drift:
+            print("All task counters are correct")
+        elif args.repair:
+            repaired = User.repair_task_counters([user.user_id for user in drift])
+            print("Repaired counters of {} users".format(repaired))
+        else:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
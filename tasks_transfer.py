@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Imports tasks from / exports tasks to CSV or NDJSON file (format chosen by file extension or --format).
+
+Usage: python tasks_transfer.py import <login> <file>
+       python tasks_transfer.py export <login> [file] (standard output if no file given)
+"""
+import argparse
+import sys
+
+from todo import create_app
+from todo.models import User, Task
+from todo.transfer import FORMATS, get_format, read_tasks, write_tasks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['import', 'export'])
+    parser.add_argument('login')
+    parser.add_argument('file', nargs='?')
+    parser.add_argument('--format', choices=FORMATS)
+    args = parser.parse_args()
+
+    with create_app().app_context():
+        user = User.query.filter_by(username=args.login).first()
+        if user is None:
+            parser.error("no such user: {}".format(args.login))
+        file_format = args.format or get_format(args.file) or 'csv'
+
+        if args.command == 'import':
+            if not args.file:
+                parser.error("file to import is required")
+            with open(args.file, 'rb') as stream:
+                result = Task.handle_tasks_import(read_tasks(stream, file_format), user.id)
+            print("Imported {} tasks, rejected {} rows".format(result.imported, result.rejected))
+            if result.rejected_lines:
+                print("First rejected lines: {}".format(", ".join(str(line) for line in result.rejected_lines)))
+        else:
+            output = open(args.file, 'w', encoding='utf-8', newline='') if args.file else sys.stdout
+            try:
+                output.writelines(write_tasks(Task.iter_tasks(user.id), file_format))
+            finally:
+                if args.file:
+                    output.close()
+
+
+if __name__ == '__main__':
+    main()
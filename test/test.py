@@ -1,31 +1,52 @@
 # -*- coding: utf-8 -*-
 import unittest
-from todo import app, db
+from flask import Flask
+from todo import create_app, db, mail
 from config import basedir
-from todo.models import User, Task, Question, Choice, Opinion, ErrorOpinion
+from todo.models import User, Task, Tag, Question, Choice, Opinion, ErrorOpinion, OutboxMail, task_tag
+import io
+import json
 import os
+import re
+import shutil
+import socketserver
+import sys
+import tempfile
+import threading
 from passlib.hash import argon2
-from datetime import datetime
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError, OperationalError
+from werkzeug.exceptions import NotFound
 from config import TASKS_PER_PAGE
+from todo.cache import LRUCache, page_cache, user_cache
+from todo.hashing import HashingPoolBusy, PasswordHasher, password_hasher
+from todo.mailer import MailDispatcher, mail_dispatcher
+from todo.profiling import request_profiler
+from todo.purge import AccountPurger, account_purger
+from todo.votes import vote_buffer
+from todo.testing import TEST_SETTINGS, test_database
+from todo.transfer import FORMATS, read_tasks
+
+
+app = create_app('config', **TEST_SETTINGS)
+db.app = app        # modele używane w testach także poza żądaniami, bez kontekstu aplikacji
+test_database.init_app(app)
 
 
 class LoginLogoutTest(unittest.TestCase):
     """Login and logout testing class"""
     def setUp(self):
-        app.config['TESTING'] = True
-        app.config['WTF_CSRF_ENABLED'] = False
-        app.config['DEBUG'] = True
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'test/test.db')
         self.app = app.test_client()
-        db.create_all()
-        password = argon2.using(rounds=4).hash("password")
+        test_database.begin()
+        password = User.hash_password("password")
         user1 = User(username='user', password=password, email="test@test.com")
         db.session.add(user1)
         db.session.commit()
 
     def tearDown(self):
-        db.session.remove()
-        db.drop_all()
+        test_database.rollback()
 
     # Helper methods
 
@@ -71,6 +92,20 @@ class LoginLogoutTest(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b'Logged in successfully', response.data)
 
+    def test_login_fetches_user_once(self):
+        statements = []
+
+        def count_selects(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT') and 'FROM user' in statement:
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_selects)
+        try:
+            self.app.post('/', data=dict(login='user', password='password'))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_selects)
+        self.assertEqual(len(statements), 1)
+
     def test_valid_user_logout(self):
         self.login('user', 'password')
         response = self.logout()
@@ -81,20 +116,15 @@ class LoginLogoutTest(unittest.TestCase):
 class RegisterTest(unittest.TestCase):
     """Registration testing class"""
     def setUp(self):
-        app.config['TESTING'] = True
-        app.config['WTF_CSRF_ENABLED'] = False
-        app.config['DEBUG'] = True
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'test/test.db')
         self.app = app.test_client()
-        db.create_all()
-        password = argon2.using(rounds=4).hash("password")
+        test_database.begin()
+        password = User.hash_password("password")
         user1 = User(username='user', password=password, email="test@test.com")
         db.session.add(user1)
         db.session.commit()
 
     def tearDown(self):
-        db.session.remove()
-        db.drop_all()
+        test_database.rollback()
 
     # Helper methods
 
@@ -127,6 +157,19 @@ class RegisterTest(unittest.TestCase):
         self.assertIn(b'Login or email already exists', response.data)
         self.assertTrue(len(User.query.filter_by(username="user").all()) == 1)
 
+    def test_user_existence_single_query(self):
+        self.assertTrue(User.check_user_existence(username='user', email='other@test.com'))
+        self.assertTrue(User.check_user_existence(username='other', email='test@test.com'))
+        self.assertFalse(User.check_user_existence(username='other', email='other@test.com'))
+        self.assertFalse(User.check_user_existence())
+
+    def test_registration_conflict_detected_by_unique_constraint(self):
+        with app.app_context():
+            self.assertFalse(User.handle_registration('user', 'password', 'new@test.com'))
+            self.assertFalse(User.handle_registration('new', 'password', 'test@test.com'))
+            self.assertTrue(User.handle_registration('new', 'password', 'new@test.com'))
+            self.assertEqual(User.query.count(), 2)
+
     def test_invalid_user_registration_passwords_do_not_match(self):
         response = self.register('user2', 'password', 'password2', 'test@gmail.com')
         self.assertEqual(response.status_code, 200)
@@ -159,26 +202,26 @@ class RegisterTest(unittest.TestCase):
 class TaskOperationsTest(unittest.TestCase):
     """Task adding, executing, deleting testing class"""
     def setUp(self):
-        app.config['TESTING'] = True
-        app.config['WTF_CSRF_ENABLED'] = False
-        app.config['DEBUG'] = True
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'test/test.db')
         self.app = app.test_client()
-        db.create_all()
-        password = argon2.using(rounds=4).hash("password")
-        user1 = User(username='user', password=password, email="test@test.com")
-        task1 = Task(id=0, task="test task1 test", executed=False, data_pub="2017-01-19T04:00", username_id=0)
-        task2 = Task(id=1, task="test task2 test", executed=False, data_pub="2017-01-19T04:00", username_id=0)
-        task3 = Task(id=2, task="test task2 test", executed=True, data_pub="2017-01-19T04:00", username_id=0)
+        test_database.begin()
+        password = User.hash_password("password")
+        user1 = User(id=0, username='user', password=password, email="test@test.com")
+        user2 = User(id=1, username='user2', password=password, email="test2@test.com")
+        task4 = Task(id=3, task="other user task", executed=False, data_pub=datetime(2017, 1, 19, 4, 0), username_id=1)
+        db.session.add(user2)
+        db.session.add(task4)
+        task1 = Task(id=0, task="test task1 test", executed=False, data_pub=datetime(2017, 1, 19, 4, 0), username_id=0)
+        task2 = Task(id=1, task="test task2 test", executed=False, data_pub=datetime(2017, 1, 19, 4, 0), username_id=0)
+        task3 = Task(id=2, task="test task2 test", executed=True, data_pub=datetime(2017, 1, 19, 4, 0), username_id=0)
         db.session.add(user1)
         db.session.add(task1)
         db.session.add(task2)
         db.session.add(task3)
         db.session.commit()
+        User.repair_task_counters()     # liczniki zadań dodanych z pominięciem Task.handle_task_adding
 
     def tearDown(self):
-        db.session.remove()
-        db.drop_all()
+        test_database.rollback()
 
     # Helper methods
 
@@ -194,6 +237,9 @@ class TaskOperationsTest(unittest.TestCase):
     def undo(self, task_id):
         return self.app.post('/undo', data=dict(undo=task_id), follow_redirects=True)
 
+    def tasks_status(self, task_ids, executed):
+        return self.app.post('/tasks_status', data=dict(erase=task_ids, executed=executed), follow_redirects=True)
+
     def erase(self, erase):
         return self.app.post('/erase', data=dict(erase=erase), follow_redirects=True)
 
@@ -213,7 +259,20 @@ class TaskOperationsTest(unittest.TestCase):
         self.assertIn(b'New task added.', response.data)
         self.assertTrue(Task.query.filter_by(task="task1 task1 task1").first())
         task = Task.query.filter_by(task="task1 task1 task1").first()
-        self.assertTrue(task.data_pub == "")
+        self.assertIsNone(task.data_pub)
+
+    def test_valid_insert_task_date_saved_as_datetime(self):
+        self.login('user', 'password')
+        self.user('task1 task1 task1', "2017-01-19T04:00")
+        task = Task.query.filter_by(task="task1 task1 task1").first()
+        self.assertEqual(task.data_pub, datetime(2017, 1, 19, 4, 0))
+
+    def test_invalid_insert_task_incorrect_date(self):
+        self.login('user', 'password')
+        response = self.user('task1 task1 task1', "19.01.2017 4:00")
+        self.assertIn(b'Error: Incorrect date. Date format: YYYY-MM-DDTHH:MM', response.data)
+        self.assertNotIn(b'Task is empty or is too long', response.data)
+        self.assertFalse(Task.query.filter_by(task="task1 task1 task1").first())
 
     def test_invalid_insert_empty_task(self):
         self.login('user', 'password')
@@ -253,32 +312,119 @@ class TaskOperationsTest(unittest.TestCase):
         self.assertFalse(Task.query.filter_by(username_id=0).all())
         self.assertIn(b'Tasks deleted!', response.data)
 
+    def test_erase_skips_tasks_of_other_users(self):
+        self.login('user', 'password')
+        response = self.erase([0, 3, 'abc'])
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Task.query.filter_by(id=0).first())
+        self.assertTrue(Task.query.filter_by(id=3).first())
+
+    def test_valid_execute_multi_tasks(self):
+        self.login('user', 'password')
+        response = self.tasks_status([0, 1, 3], 1)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Tasks status changed!', response.data)
+        self.assertEqual(Task.query.filter_by(username_id=0, executed=1).count(), 3)
+        self.assertFalse(Task.query.filter_by(id=3).first().executed)
+
+    def test_valid_undo_multi_tasks(self):
+        self.login('user', 'password')
+        response = self.tasks_status([0, 2], 0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Task.query.filter_by(username_id=0, executed=1).count(), 0)
+
+    def test_execute_skips_tasks_of_other_users(self):
+        self.login('user', 'password')
+        self.executed(3)
+        self.assertFalse(Task.query.filter_by(id=3).first().executed)
+
+    def test_bulk_delete_returns_deleted_count(self):
+        self.assertEqual(Task.handle_tasks_deleting(['0', '1', '3', '100'], 0), 2)
+        self.assertEqual(Task.query.filter_by(username_id=0).count(), 1)
+        self.assertEqual(Task.handle_tasks_deleting([], 0), 0)
+
+    def counters(self, user_id=0):
+        counters = User.get_task_counters(user_id)
+        return counters.tasks, counters.executed
+
+    def test_counters_follow_task_changes(self):
+        self.login('user', 'password')
+        self.assertEqual(self.counters(), (3, 1))
+        self.user('new task', '')
+        self.assertEqual(self.counters(), (4, 1))
+        self.executed(0)
+        self.executed(0)
+        self.assertEqual(self.counters(), (4, 2))
+        self.undo(2)
+        self.assertEqual(self.counters(), (4, 1))
+        self.tasks_status([0, 1, 2, 3], 1)
+        self.assertEqual(self.counters(), (4, 3))
+        self.erase([0, 1, 3])
+        self.assertEqual(self.counters(), (2, 1))
+        self.assertEqual(self.counters(1), (1, 0))
+        self.assertEqual(User.get_task_counters_drift(), [])
+
+    def test_counters_follow_import_and_editing(self):
+        with app.app_context():
+            result = Task.handle_tasks_import([(1, 'a', '', 1), (2, 'b', '', 0), (3, '', '', 0), (4, 'c', '', 1)], 0)
+            self.assertEqual(result.imported, 3)
+            self.assertEqual(self.counters(), (6, 3))
+            self.assertEqual(Task.handle_task_editing(1, 0, executed=True), 1)
+            self.assertEqual(Task.handle_task_editing(1, 0, task_text='changed', executed=True), 1)
+            self.assertEqual(self.counters(), (6, 4))
+            self.assertEqual(Task.handle_task_editing(2, 0, executed=False), 1)
+            self.assertEqual(Task.handle_task_editing(3, 0, executed=False), 0)     # zadanie innego użytkownika
+            self.assertEqual(self.counters(), (6, 3))
+            self.assertEqual(User.get_task_counters_drift(), [])
+
+    def test_counters_drift_detected_and_repaired(self):
+        User.query.filter_by(id=0).update({User.tasks_count: 10}, synchronize_session=False)
+        db.session.commit()
+        version = User.get_data_version(0)
+        self.assertEqual(User.get_task_counters_drift(), [(0, 10, 1, 3, 1)])
+        self.assertEqual(User.repair_task_counters([0]), 1)
+        self.assertEqual(User.get_task_counters_drift(), [])
+        self.assertEqual(self.counters(), (3, 1))
+        self.assertNotEqual(User.get_data_version(0), version)
+
+    def test_task_list_does_not_count_tasks(self):
+        self.login('user', 'password')
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if 'count(' in statement.lower():
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = self.app.get('/user/user')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(statements, [])
+        self.assertIn(b'2 open / 1 done', response.data)
+
 
 class SettingsTest(unittest.TestCase):
     """Settings testing class, changing profile data, deleting account"""
 
     def setUp(self):
-        app.config['TESTING'] = True
-        app.config['WTF_CSRF_ENABLED'] = False
-        app.config['DEBUG'] = True
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'test/test.db')
         self.app = app.test_client()
-        db.create_all()
-        password1 = argon2.using(rounds=4).hash("password")
+        test_database.begin()
+        password1 = User.hash_password("password")
         user1 = User(id=0, username='user', password=password1, email="test@test.com")
-        password2 = argon2.using(rounds=4).hash("password1")
+        password2 = User.hash_password("password1")
         user2 = User(id=1, username='user1', password=password2, email="test@gmail.com")
-        task1 = Task(id=0, task="test task1 test", executed=False, data_pub="2017-01-19T04:00", username_id=0)
-        task2 = Task(id=1, task="test task2 test", executed=False, data_pub="2017-01-19T04:00", username_id=0)
+        task1 = Task(id=0, task="test task1 test", executed=False, data_pub=datetime(2017, 1, 19, 4, 0), username_id=0)
+        task2 = Task(id=1, task="test task2 test", executed=False, data_pub=datetime(2017, 1, 19, 4, 0), username_id=0)
         db.session.add(task1)
         db.session.add(task2)
         db.session.add(user1)
         db.session.add(user2)
         db.session.commit()
+        User.repair_task_counters()     # liczniki zadań dodanych z pominięciem Task.handle_task_adding
 
     def tearDown(self):
-        db.session.remove()
-        db.drop_all()
+        test_database.rollback()
 
     # Helper methods
 
@@ -294,6 +440,17 @@ class SettingsTest(unittest.TestCase):
 
     # Tests
 
+    def test_delete_account_with_poll_answers(self):
+        self.login('user', 'password')
+        user_id = User.query.filter_by(username='user').first().id
+        Opinion.handle_opinion("It's awesome website!", user_id)
+        ErrorOpinion.handle_error_opinion("It's broken!", user_id)
+        response = self.delete_account()
+        self.assertIn(b'Account was deleted permanently', response.data)
+        self.assertFalse(User.query.filter_by(username='user').first())
+        self.assertFalse(Opinion.query.all())
+        self.assertFalse(ErrorOpinion.query.all())
+
     def test_valid_delete_account(self):
         self.login('user', 'password')
         response = self.delete_account()
@@ -302,6 +459,90 @@ class SettingsTest(unittest.TestCase):
         self.assertFalse(User.query.filter_by(username='user').first())
         self.assertIn(b'Account was deleted permanently', response.data)
 
+    def test_delete_account_statements_do_not_depend_on_tasks_count(self):
+        for i in range(50):
+            db.session.add(Task(task="task {}".format(i), executed=0, data_pub=None, username_id=0))
+        db.session.commit()
+        self.login('user', 'password')
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('DELETE'):
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            self.delete_account()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        # jeden DELETE na tabelę: powiązania z tagami, tagi, zadania, opinie, zgłoszenia błędów, użytkownik
+        self.assertEqual(len(statements), 6)
+        self.assertFalse(Task.query.filter_by(username_id=0).first())
+
+    def test_delete_large_account_in_background(self):
+        app.config['ACCOUNT_PURGE_CHUNK_SIZE'] = 7
+        app.config['ACCOUNT_PURGE_PAUSE'] = 0
+        try:
+            for i in range(20):
+                db.session.add(Task(task="task {}".format(i), executed=0, data_pub=None, username_id=0))
+            Opinion.handle_opinion("It's awesome website!", 0)
+            db.session.commit()
+            self.assertFalse(User.handle_account_deleting(0, threshold=10))
+            self.assertIsNotNone(User.query.get(0).deleted_at)
+            self.assertEqual(Task.query.filter_by(username_id=0).count(), 22)
+            self.assertIn(b'No such user', self.login('user', 'password').data)
+            self.assertEqual(User.get_deleted_ids(), [0])
+            self.assertEqual(account_purger.purge_pending(), 1)
+            self.assertFalse(User.query.get(0))
+            self.assertFalse(Task.query.filter_by(username_id=0).first())
+            self.assertFalse(Opinion.query.all())
+            self.assertEqual(Task.query.filter_by(username_id=1).count(), 0)
+            self.assertTrue(User.query.get(1))
+        finally:
+            app.config['ACCOUNT_PURGE_CHUNK_SIZE'] = 5000
+            app.config['ACCOUNT_PURGE_PAUSE'] = 0.1
+
+    def test_account_marked_deleted_is_logged_out(self):
+        self.login('user', 'password')
+        self.assertFalse(User.handle_account_deleting(0, threshold=0))
+        response = self.app.get('/user/user', follow_redirects=True)
+        self.assertNotIn(b'test task1 test', response.data)
+        self.assertFalse(User.get_by_username('user'))
+
+    def test_account_purger_starts_on_first_request(self):
+        purger_app = Flask(__name__)
+        purger_app.config['ACCOUNT_PURGE_WORKER'] = True
+        purger = AccountPurger()
+        purger.init_app(purger_app)
+        purged = threading.Event()
+        purger.purge_pending = purged.set     # konta oznaczone przed restartem, bez usuwania kolejnego konta
+        self.assertFalse(purged.wait(0.1))
+        purger_app.test_client().get('/')
+        self.assertTrue(purged.wait(5))
+
+    def test_username_change_statements_do_not_depend_on_tasks_count(self):
+        counts = []
+        for username, tasks in (('user1234', 0), ('user5678', 100)):
+            for i in range(tasks):
+                db.session.add(Task(task="task {}".format(i), executed=0, data_pub=None, username_id=0))
+            db.session.commit()
+            user = User.query.get(0)
+            statements = []
+
+            def record(conn, cursor, statement, parameters, context, executemany):
+                statements.append(statement)
+
+            event.listen(db.engine, 'before_cursor_execute', record)
+            try:
+                with app.test_request_context():
+                    self.assertTrue(user.handle_username_change(username))
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', record)
+            self.assertFalse([statement for statement in statements if 'task' in statement.split()])
+            counts.append(len(statements))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(User.query.get(0).username, 'user5678')
+
     def test_view_settings_page(self):
         response = self.app.get('/settings', follow_redirects=True)
         self.assertEqual(response.status_code, 200)
@@ -395,20 +636,15 @@ class PasswordResetTest(unittest.TestCase):
     """Password reset testing class"""
 
     def setUp(self):
-        app.config['TESTING'] = True
-        app.config['WTF_CSRF_ENABLED'] = False
-        app.config['DEBUG'] = True
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'test/test.db')
         self.app = app.test_client()
-        db.create_all()
-        password1 = argon2.using(rounds=4).hash("password")
+        test_database.begin()
+        password1 = User.hash_password("password")
         user1 = User(username='user', password=password1, email="test@test.com")
         db.session.add(user1)
         db.session.commit()
 
     def tearDown(self):
-        db.session.remove()
-        db.drop_all()
+        test_database.rollback()
 
     # Tests
 
@@ -426,26 +662,782 @@ class PasswordResetTest(unittest.TestCase):
         self.assertIn(b'No user with given email address or address is wrong!', response.data)
         self.assertEqual(response.status_code, 200)
 
+    def test_password_reset_enqueues_email(self):
+        old_password = User.query.filter_by(username='user').first().password
+        self.app.post('/password_reset', data=dict(email='test@test.com'), follow_redirects=True)
+        outbox = OutboxMail.query.all()
+        self.assertEqual(len(outbox), 1)
+        self.assertEqual(outbox[0].recipient, 'test@test.com')
+        self.assertNotEqual(User.query.filter_by(username='user').first().password, old_password)
+
+    def test_invalid_password_reset_enqueues_nothing(self):
+        self.app.post('/password_reset', data=dict(email='bad-email.pl'), follow_redirects=True)
+        self.assertEqual(OutboxMail.query.count(), 0)
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """Minimal local SMTP server used instead of a real one. Remembers connections and received messages"""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        self.connections = 0
+        self.messages = []
+        socketserver.ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), SMTPStandInHandler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+class SMTPStandInHandler(socketserver.StreamRequestHandler):
+
+    def write(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.server.connections += 1
+        self.write('220 localhost')
+        while True:
+            line = self.rfile.readline().decode().strip()
+            command = line[:4].upper()
+            if not line or command == 'QUIT':
+                self.write('221 bye')
+                return
+            if command == 'DATA':
+                self.write('354 go ahead')
+                data = []
+                for data_line in iter(self.rfile.readline, b''):
+                    if data_line == b'.\r\n':
+                        break
+                    data.append(data_line)
+                self.server.messages.append(b''.join(data).decode())
+            self.write('250 ok')
+
+
+class MailOutboxTest(unittest.TestCase):
+    """Mail outbox and dispatcher testing class"""
+
+    mail_settings = ('MAIL_SERVER', 'MAIL_PORT', 'MAIL_USE_SSL', 'MAIL_PASSWORD', 'MAIL_SUPPRESS_SEND',
+                     'MAIL_OUTBOX_BATCH_SIZE')
+
+    def setUp(self):
+        self.app = app.test_client()
+        test_database.begin()
+        self.saved_settings = {key: app.config.get(key) for key in self.mail_settings}
+        self.smtp = SMTPStandIn()
+        self.use_smtp_port(self.smtp.server_address[1])
+
+    def tearDown(self):
+        self.smtp.shutdown()
+        self.smtp.server_close()
+        app.config.update(self.saved_settings)
+        mail.init_app(app)
+        test_database.rollback()
+
+    def use_smtp_port(self, port):
+        app.config.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=port, MAIL_USE_SSL=False, MAIL_PASSWORD=None,
+                          MAIL_SUPPRESS_SEND=False)
+        mail.init_app(app)
+
+    def flush(self):
+        with app.app_context():
+            return mail_dispatcher.flush()
+
+    # Tests
+
+    def test_flush_sends_batches_over_one_connection(self):
+        app.config['MAIL_OUTBOX_BATCH_SIZE'] = 2
+        for i in range(5):
+            OutboxMail.enqueue('user{}@test.com'.format(i), 'subject', 'body {}'.format(i))
+        db.session.commit()
+        self.assertEqual(self.flush(), 5)
+        self.assertEqual(len(self.smtp.messages), 5)
+        self.assertEqual(self.smtp.connections, 1)
+        self.assertEqual(OutboxMail.query.count(), 0)
+
+    def test_flush_without_due_emails_does_not_connect(self):
+        self.assertEqual(self.flush(), 0)
+        self.assertEqual(self.smtp.connections, 0)
+
+    def test_failed_email_is_retried_with_backoff(self):
+        closed = socketserver.TCPServer(('127.0.0.1', 0), socketserver.BaseRequestHandler)
+        port = closed.server_address[1]
+        closed.server_close()
+        self.use_smtp_port(port)        # nikt nie nasłuchuje na tym porcie
+        OutboxMail.enqueue('test@test.com', 'subject', 'body')
+        db.session.commit()
+        before = datetime.utcnow()
+        self.assertEqual(self.flush(), 0)
+        db.session.expire_all()
+        mail_row = OutboxMail.query.first()
+        self.assertEqual(mail_row.attempts, 1)
+        self.assertGreaterEqual(mail_row.next_attempt, before + timedelta(seconds=app.config['MAIL_OUTBOX_RETRY_DELAY']))
+        self.assertTrue(mail_row.last_error)
+        self.assertEqual(self.flush(), 0)       # jeszcze nie czas na ponowną próbę
+        self.assertEqual(OutboxMail.query.first().attempts, 1)
+
+        self.use_smtp_port(self.smtp.server_address[1])
+        OutboxMail.query.update({OutboxMail.next_attempt: datetime.utcnow()})
+        db.session.commit()
+        self.assertEqual(self.flush(), 1)
+        self.assertEqual(len(self.smtp.messages), 1)
+
+    def test_email_is_given_up_after_max_attempts(self):
+        OutboxMail.enqueue('test@test.com', 'subject', 'body')
+        db.session.commit()
+        mail_id = OutboxMail.query.first().id
+        for attempts in range(app.config['MAIL_OUTBOX_MAX_ATTEMPTS']):
+            OutboxMail.mark_failed(mail_id, attempts, 'error', app.config['MAIL_OUTBOX_MAX_ATTEMPTS'],
+                                   timedelta(seconds=1))
+        db.session.commit()
+        mail_row = OutboxMail.query.first()
+        self.assertIsNone(mail_row.next_attempt)
+        self.assertEqual(mail_row.body, '')     # wygenerowane hasło nie zostaje w bazie
+        self.assertEqual(mail_row.last_error, 'error')
+        self.assertEqual(self.flush(), 0)
+
+    def test_dispatcher_starts_on_first_request(self):
+        mail_app = Flask(__name__)
+        mail_app.config['MAIL_OUTBOX_WORKER'] = True
+        dispatcher = MailDispatcher()
+        dispatcher.init_app(mail_app, mail)
+        flushed = threading.Event()
+        dispatcher.flush = flushed.set      # emaile zostawione przed restartem, bez kolejnego resetu hasła
+        self.assertFalse(flushed.wait(0.1))
+        mail_app.test_client().get('/')
+        self.assertTrue(flushed.wait(5))
+
+    def test_password_reset_email_reaches_smtp_server(self):
+        db.session.add(User(username='user', password=User.hash_password("password"), email="test@test.com"))
+        db.session.commit()
+        response = self.app.post('/password_reset', data=dict(email='test@test.com'), follow_redirects=True)
+        self.assertIn(b'New password has been sent to given email address!', response.data)
+        self.assertEqual(self.smtp.connections, 0)      # view does not wait for SMTP
+        self.assertEqual(self.flush(), 1)
+        self.assertIn('test@test.com', self.smtp.messages[0])
+
+
+class SearchTest(unittest.TestCase):
+    """Task search testing class"""
+
+    def setUp(self):
+        self.app = app.test_client()
+        test_database.begin()
+        password = User.hash_password("password")
+        db.session.add(User(id=0, username='user', password=password, email="test@test.com", tasks_per_page=2))
+        db.session.add(User(id=1, username='user2', password=password, email="test2@test.com"))
+        db.session.add(Task(id=1, task="buy milk", executed=0, data_pub=datetime(2017, 1, 19, 4, 0), username_id=0))
+        db.session.add(Task(id=2, task="milk the cow, milk the goat", executed=0, data_pub=None, username_id=0))
+        db.session.add(Task(id=3, task="write report", executed=1, data_pub=None, username_id=0))
+        db.session.add(Task(id=4, task="buy milk too", executed=0, data_pub=None, username_id=1))
+        db.session.add(Task(id=5, task="Zadzwonić do mechanika", executed=0, data_pub=None, username_id=0))
+        db.session.commit()
+        User.repair_task_counters()     # liczniki zadań dodanych z pominięciem Task.handle_task_adding
+        self.user = User.query.filter_by(id=0).first()
+
+    def tearDown(self):
+        test_database.rollback()
+
+    # Helper methods
+
+    def login(self, username, password):
+        return self.app.post('/', data=dict(login=username, password=password), follow_redirects=True)
+
+    def found_ids(self, text, page=1):
+        return [task.id for task in Task.search_tasks(self.user, text, page).items]
+
+    # Tests
+
+    def test_search_returns_only_own_tasks_best_match_first(self):
+        self.assertEqual(self.found_ids('milk'), [1, 2])      # shorter task ranks higher in bm25
+
+    def test_search_requires_all_words(self):
+        self.assertEqual(self.found_ids('buy milk'), [1])
+        self.assertEqual(self.found_ids('buy report'), [])
+
+    def test_search_matches_prefix_of_last_word_and_ignores_diacritics(self):
+        self.assertEqual(self.found_ids('rep'), [3])
+        self.assertEqual(self.found_ids('zadzwonic'), [5])
+
+    def test_search_treats_operators_as_text(self):
+        self.assertEqual(self.found_ids('milk OR report'), [])
+        self.assertEqual(self.found_ids('"milk* -('), [1, 2])
+        self.assertIsNone(Task.search_tasks(self.user, '"*-()', 1))
+
+    def test_search_index_follows_adding_and_deleting(self):
+        Task.handle_task_adding('call mom about milk', '', 0)
+        task_id = Task.query.filter_by(task='call mom about milk').first().id
+        self.assertIn(task_id, self.found_ids('mom'))
+        Task.handle_tasks_deleting([task_id, 1], 0)
+        self.assertEqual(self.found_ids('milk'), [2])
+
+    def test_search_results_are_paginated(self):
+        Task.handle_task_adding('milk shake', '', 0)
+        page1 = Task.search_tasks(self.user, 'milk', 1)
+        page2 = Task.search_tasks(self.user, 'milk', 2)
+        self.assertEqual(page1.total, 3)
+        self.assertEqual(len(page1.items), 2)
+        self.assertEqual(len(page2.items), 1)
+        self.assertFalse(set(task.id for task in page1.items) & set(task.id for task in page2.items))
+
+    def test_search_page(self):
+        self.login('user', 'password')
+        response = self.app.get('/search?q=milk', follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'buy milk', response.data)
+        self.assertNotIn(b'buy milk too', response.data)
+        self.assertNotIn(b'write report', response.data)
+
+    def test_search_page_without_words(self):
+        self.login('user', 'password')
+        response = self.app.get('/search?q=%2A%2A', follow_redirects=True)
+        self.assertIn(b'Enter at least one word to search for', response.data)
+        response = self.app.get('/search?q=', follow_redirects=True)
+        self.assertIn(b'Add Task!', response.data)
+
+
+class TaskApiTest(unittest.TestCase):
+    """JSON task API testing class"""
+
+    def setUp(self):
+        self.app = app.test_client()
+        test_database.begin()
+        password = User.hash_password("password")
+        db.session.add(User(id=0, username='user', password=password, email="test@test.com"))
+        db.session.add(User(id=1, username='user2', password=password, email="test2@test.com"))
+        for i in range(5):
+            db.session.add(Task(id=i + 1, task="task {}".format(i + 1), executed=0,
+                                data_pub=datetime(2017, 1, 19, 4, i), username_id=0))
+        db.session.add(Task(id=6, task="other user task", executed=0, data_pub=None, username_id=1))
+        db.session.commit()
+        User.repair_task_counters()     # liczniki zadań dodanych z pominięciem Task.handle_task_adding
+
+    def tearDown(self):
+        test_database.rollback()
+
+    # Helper methods
+
+    def login(self, username, password):
+        return self.app.post('/', data=dict(login=username, password=password), follow_redirects=True)
+
+    # Tests
+
+    def test_api_requires_login(self):
+        response = self.app.get('/api/tasks')
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('error', response.get_json())
+
+    def test_list_tasks_with_cursor(self):
+        self.login('user', 'password')
+        response = self.app.get('/api/tasks?limit=2')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual([task['id'] for task in data['tasks']], [5, 4])
+        self.assertEqual(data['tasks'][0], {'id': 5, 'task': 'task 5', 'executed': False, 'date': '2017-01-19T04:04'})
+        ids = [task['id'] for task in data['tasks']]
+        while data['next_cursor']:
+            data = self.app.get('/api/tasks?limit=2&cursor=' + data['next_cursor']).get_json()
+            ids += [task['id'] for task in data['tasks']]
+        self.assertEqual(ids, [5, 4, 3, 2, 1])
+
+    def test_list_tasks_invalid_cursor_and_limit(self):
+        self.login('user', 'password')
+        self.assertEqual(self.app.get('/api/tasks?cursor=forged').status_code, 400)
+        self.assertEqual(self.app.get('/api/tasks?limit=0').status_code, 400)
+        self.assertEqual(self.app.get('/api/tasks?limit=abc').status_code, 400)
+
+    def test_conditional_get_returns_304_until_tasks_change(self):
+        self.login('user', 'password')
+        response = self.app.get('/api/tasks')
+        etag = response.headers['ETag']
+        response = self.app.get('/api/tasks', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        Task.handle_tasks_status_change([1], 0, True)
+        response = self.app.get('/api/tasks', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_conditional_get_does_not_read_tasks(self):
+        self.login('user', 'password')
+        etag = self.app.get('/api/tasks').headers['ETag']
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            self.app.get('/api/tasks', headers={'If-None-Match': etag})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertFalse([statement for statement in statements if 'FROM task' in statement])
+
+    def test_other_users_changes_do_not_change_etag(self):
+        self.login('user', 'password')
+        etag = self.app.get('/api/tasks').headers['ETag']
+        Task.handle_task_adding('new task', '', 1)
+        self.assertEqual(self.app.get('/api/tasks', headers={'If-None-Match': etag}).status_code, 304)
+
+    def test_create_task(self):
+        self.login('user', 'password')
+        etag = self.app.get('/api/tasks').headers['ETag']
+        response = self.app.post('/api/tasks', json={'task': 'new task', 'date': '2017-02-01T10:30'})
+        self.assertEqual(response.status_code, 201)
+        data = response.get_json()
+        self.assertEqual(data['task'], 'new task')
+        self.assertEqual(data['date'], '2017-02-01T10:30')
+        self.assertTrue(response.headers['Location'].endswith('/api/tasks/{}'.format(data['id'])))
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(self.app.get('/api/tasks', headers={'If-None-Match': response.headers['ETag']}).status_code,
+                         304)
+
+    def test_create_invalid_task(self):
+        self.login('user', 'password')
+        self.assertEqual(self.app.post('/api/tasks', json={'task': ''}).status_code, 400)
+        self.assertEqual(self.app.post('/api/tasks', json={'task': 'x', 'date': 'tomorrow'}).status_code, 400)
+        self.assertEqual(self.app.post('/api/tasks', json={'task': 5}).status_code, 400)
+        self.assertEqual(self.app.post('/api/tasks', data='not json').status_code, 400)
+        self.assertEqual(Task.query.count(), 6)
+
+    def test_update_task(self):
+        self.login('user', 'password')
+        response = self.app.patch('/api/tasks/1', json={'executed': True, 'task': 'renamed', 'date': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {'id': 1, 'task': 'renamed', 'executed': True, 'date': None})
+        self.assertEqual(self.app.patch('/api/tasks/1', json={'executed': 'yes'}).status_code, 400)
+        self.assertEqual(self.app.patch('/api/tasks/1', json={}).status_code, 400)
+
+    def test_update_and_delete_other_users_task(self):
+        self.login('user', 'password')
+        self.assertEqual(self.app.patch('/api/tasks/6', json={'executed': True}).status_code, 404)
+        self.assertEqual(self.app.delete('/api/tasks/6').status_code, 404)
+        self.assertEqual(self.app.get('/api/tasks/6').status_code, 404)
+        self.assertEqual(Task.query.filter_by(id=6).first().executed, 0)
+
+    def test_delete_task(self):
+        self.login('user', 'password')
+        response = self.app.delete('/api/tasks/1')
+        self.assertEqual(response.status_code, 204)
+        self.assertTrue(response.headers['ETag'])
+        self.assertIsNone(Task.query.filter_by(id=1).first())
+        self.assertEqual(self.app.delete('/api/tasks/1').status_code, 404)
+
+    def test_task_changes_bump_data_version(self):
+        version = User.get_data_version(0)
+        Task.handle_task_adding('new task', '', 0)
+        Task.handle_tasks_status_change([1], 0, True)
+        Task.handle_tasks_deleting([2], 0)
+        self.assertEqual(User.get_data_version(0), version + 3)
+        Task.handle_tasks_deleting([6], 0)      # nothing deleted
+        self.assertEqual(User.get_data_version(0), version + 3)
+
+
+class TasksTransferTest(unittest.TestCase):
+    """Tasks import and export testing class"""
+
+    def setUp(self):
+        self.app = app.test_client()
+        test_database.begin()
+        password = User.hash_password("password")
+        db.session.add(User(id=0, username='user', password=password, email="test@test.com"))
+        db.session.add(User(id=1, username='user2', password=password, email="test2@test.com"))
+        db.session.add(Task(id=1, task="task 1", executed=1, data_pub=datetime(2017, 1, 19, 4, 0, 30), username_id=0))
+        db.session.add(Task(id=2, task='task "2", with comma', executed=0, data_pub=None, username_id=0))
+        db.session.add(Task(id=3, task="other user task", executed=0, data_pub=None, username_id=1))
+        db.session.commit()
+        User.repair_task_counters()     # liczniki zadań dodanych z pominięciem Task.handle_task_adding
+
+    def tearDown(self):
+        test_database.rollback()
+
+    # Helper methods
+
+    def login(self, username, password):
+        return self.app.post('/', data=dict(login=username, password=password), follow_redirects=True)
+
+    def upload(self, content, filename):
+        return self.app.post('/tasks/import', data=dict(file=(io.BytesIO(content), filename)),
+                             content_type='multipart/form-data', follow_redirects=True)
+
+    # Tests
+
+    def test_import_csv(self):
+        self.login('user', 'password')
+        content = "task,date,executed\nnew task,2017-02-01T10:30,true\n\"quoted, task\",,\n" \
+                  "no date,,0\n".encode('utf-8')
+        response = self.upload(content, 'tasks.csv')
+        self.assertIn(b'Imported 3 tasks', response.data)
+        tasks = {task.task: task for task in Task.query.filter_by(username_id=0)}
+        self.assertEqual(tasks['new task'].data_pub, datetime(2017, 2, 1, 10, 30))
+        self.assertEqual(tasks['new task'].executed, 1)
+        self.assertIsNone(tasks['quoted, task'].data_pub)
+        self.assertEqual(tasks['no date'].executed, 0)
+
+    def test_import_ndjson(self):
+        self.login('user', 'password')
+        content = '{"task": "zadanie żółć", "date": "2017-02-01T10:30:15", "executed": true}\n\n' \
+                  '{"task": "no date", "date": null}\n'.encode('utf-8')
+        response = self.upload(content, 'tasks.ndjson')
+        self.assertIn(b'Imported 2 tasks', response.data)
+        task = Task.query.filter_by(task='zadanie żółć').first()
+        self.assertEqual(task.data_pub, datetime(2017, 2, 1, 10, 30, 15))
+        self.assertEqual(task.executed, 1)
+
+    def test_import_rejects_incorrect_rows(self):
+        self.login('user', 'password')
+        content = "task,date,executed\nok,,\n,,\n{},,\nbad date,2017-13-01,\nbad status,,maybe\n".format(
+            'x' * 255).encode('utf-8')
+        response = self.upload(content, 'tasks.csv')
+        self.assertIn(b'Imported 1 tasks', response.data)
+        self.assertIn(b'Rejected 4 rows', response.data)
+        self.assertIn(b'lines: 3, 4, 5, 6', response.data)
+        self.assertEqual(Task.query.filter_by(username_id=0).count(), 3)
+
+    def test_import_rejects_incorrect_json_lines(self):
+        with app.app_context():
+            result = Task.handle_tasks_import(read_tasks(io.BytesIO(b'{"task": "ok"}\nnot json\n[1]\n{"task": 5}\n'
+                                                                    b'{"task": "x", "date": 5}\n'), 'ndjson'), 0)
+            self.assertEqual(result, (1, 4, [2, 3, 4, 5]))
+
+    def test_import_rejects_invalid_utf8(self):
+        with app.app_context():
+            result = Task.handle_tasks_import(read_tasks(io.BytesIO(b'task\nok\n\xff\xfe bad\n'), 'csv'), 0)
+            self.assertEqual(result.rejected, 1)
+
+    def test_import_wrong_file_type(self):
+        self.login('user', 'password')
+        response = self.upload(b'task\nnew task\n', 'tasks.txt')
+        self.assertIn(b'Choose a .csv or .ndjson file', response.data)
+        self.assertEqual(Task.query.filter_by(username_id=0).count(), 2)
+
+    def test_import_inserts_in_batches(self):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('INSERT INTO task'):
+                statements.append(executemany)
+
+        rows = ((i, 'task {}'.format(i), '', 0) for i in range(25))
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            with app.app_context():
+                result = Task.handle_tasks_import(rows, 0, batch_size=10)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(result.imported, 25)
+        self.assertEqual(statements, [True, True, True])
+
+    def test_import_changes_data_version(self):
+        with app.app_context():
+            version = User.get_data_version(0)
+            Task.handle_tasks_import([(2, 'new task', '', 0)], 0)
+            self.assertNotEqual(User.get_data_version(0), version)
+
+    def test_export_csv(self):
+        self.login('user', 'password')
+        response = self.app.get('/tasks/export?format=csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/csv')
+        self.assertIn('attachment', response.headers['Content-Disposition'])
+        self.assertEqual(response.get_data(as_text=True), 'task,date,executed\ntask 1,2017-01-19T04:00:30,1\n'
+                                                          '"task ""2"", with comma",,0\n')
+
+    def test_export_ndjson(self):
+        self.login('user', 'password')
+        response = self.app.get('/tasks/export?format=ndjson')
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual(lines, [{'task': 'task 1', 'date': '2017-01-19T04:00:30', 'executed': True},
+                                 {'task': 'task "2", with comma', 'date': None, 'executed': False}])
+
+    def test_export_is_streamed_in_chunks(self):
+        for i in range(25):
+            db.session.add(Task(task="task {}".format(i), executed=0, data_pub=None, username_id=0))
+        db.session.commit()
+        rows = Task.iter_tasks(0, chunk_size=10)
+        self.assertEqual(next(rows)[0], 'task 1')
+        self.assertEqual(len(list(rows)), 26)
+
+    def test_export_unknown_format(self):
+        self.login('user', 'password')
+        self.assertEqual(self.app.get('/tasks/export?format=xml').status_code, 404)
+
+    def test_export_import_roundtrip(self):
+        self.login('user', 'password')
+        for file_format in FORMATS:
+            exported = self.app.get('/tasks/export?format=' + file_format).data
+            with app.app_context():
+                result = Task.handle_tasks_import(read_tasks(io.BytesIO(exported), file_format), 1)
+            self.assertEqual(result, (2, 0, []))
+        self.assertEqual(sorted((task.task, task.data_pub, task.executed) for task in Task.query.filter_by(
+            username_id=1) if task.id != 3), sorted(2 * [(task.task, task.data_pub, task.executed)
+                                                         for task in Task.query.filter_by(username_id=0)]))
+
+
+class ProfilingTest(unittest.TestCase):
+    """Request profiling testing class"""
+
+    def setUp(self):
+        self.app = app.test_client()
+        test_database.begin()
+        password = User.hash_password("password")
+        db.session.add(User(id=0, username='user', password=password, email="test@test.com"))
+        db.session.add(Task(id=1, task="task 1", executed=0, data_pub=datetime(2017, 1, 19, 4, 0), username_id=0))
+        db.session.commit()
+        User.repair_task_counters()     # liczniki zadań dodanych z pominięciem Task.handle_task_adding
+        self.dump_dir = tempfile.mkdtemp()
+        app.config['PROFILING_DUMP_DIR'] = self.dump_dir
+
+    def tearDown(self):
+        request_profiler.disable()
+        request_profiler.clear()
+        app.config['PROFILING_SLOW_REQUEST'] = 0.5
+        app.config['PROFILING_SLOW_QUERY'] = 0.1
+        app.config['PROFILING_SAMPLE_RATE'] = 0.01
+        shutil.rmtree(self.dump_dir)
+        test_database.rollback()
+
+    # Helper methods
+
+    def login(self, username, password):
+        return self.app.post('/', data=dict(login=username, password=password), follow_redirects=True)
+
+    # Tests
+
+    def test_disabled_by_default(self):
+        self.login('user', 'password')
+        response = self.app.get('/user/user')
+        self.assertNotIn('Server-Timing', response.headers)
+        self.assertEqual(self.app.get('/debug/profiling').status_code, 404)
+        self.assertFalse(event.contains(Engine, 'before_cursor_execute', request_profiler._before_cursor_execute))
+        self.assertEqual(request_profiler.get_stats(), {})
+
+    def test_request_measurements(self):
+        request_profiler.enable()
+        self.login('user', 'password')      # POST / i przekierowanie na listę zadań
+        response = self.app.get('/user/user')
+        self.assertIn('db;dur=', response.headers['Server-Timing'])
+        stats = self.app.get('/debug/profiling').get_json()
+        route = stats['routes']['GET /user/<username>']
+        self.assertEqual(route['count'], 2)
+        self.assertGreater(route['mean_sql_statements'], 0)
+        self.assertEqual(sum(route['histogram_ms'].values()), 2)
+        self.assertIsNotNone(route['p99_ms'])
+        self.assertEqual(stats['routes']['POST /']['count'], 1)
+
+    def test_stats_served_only_to_local_requests(self):
+        request_profiler.enable()
+        self.assertEqual(self.app.get('/debug/profiling').status_code, 200)
+        self.assertEqual(self.app.get('/debug/profiling', environ_base={'REMOTE_ADDR': '10.0.0.1'}).status_code, 404)
+        self.assertEqual(self.app.get('/debug/profiling', headers={'X-Forwarded-For': '10.0.0.1'}).status_code, 404)
+
+    def test_page_cache_stats_are_reported(self):
+        request_profiler.enable()
+        self.login('user', 'password')      # strona listy zadań nie jest jeszcze w cache
+        self.app.get('/user/user')
+        page_stats = self.app.get('/debug/profiling').get_json()['caches']['page_cache']
+        self.assertEqual((page_stats['hits'], page_stats['misses'], page_stats['size']), (1, 1, 1))
+        self.assertEqual(page_stats['hit_ratio'], 0.5)
+        self.assertGreater(page_stats['memory'], 0)
+
+    def test_user_cache_stats_are_reported(self):
+        request_profiler.enable()
+        self.login('user', 'password')
+        self.app.get('/user/user')
+        user_stats = self.app.get('/debug/profiling').get_json()['caches']['user_cache']
+        self.assertGreater(user_stats['hits'], 0)
+        self.assertEqual(user_stats['hits'] + user_stats['misses'], user_cache.hits + user_cache.misses)
+        self.assertEqual(user_stats['size'], 1)
+
+    def test_statements_outside_requests_are_not_counted(self):
+        app.config['PROFILING_SLOW_QUERY'] = 0
+        request_profiler.enable()
+        with self.assertLogs(app.logger, 'WARNING') as logs:
+            User.get_data_version(0)
+        self.assertIn('Slow SQL statement', logs.output[0])
+        self.assertEqual(request_profiler.get_stats(), {})
+
+    def test_failed_statement_leaves_no_timing_state(self):
+        app.config['PROFILING_SLOW_QUERY'] = 0
+        request_profiler.enable()
+        with self.assertRaises(OperationalError):
+            db.session.execute('SELECT * FROM no_such_table')
+        db.session.rollback()
+        with self.assertLogs(app.logger, 'WARNING') as logs:
+            User.get_data_version(0)
+        self.assertEqual(len(logs.output), 1)
+        self.assertNotIn('no_such_table', logs.output[0])
+        self.assertNotIn('profiling_start', db.session.connection().info)
+
+    def test_slow_request_is_logged_with_statements_and_profile(self):
+        app.config['PROFILING_SLOW_REQUEST'] = 0
+        app.config['PROFILING_SAMPLE_RATE'] = 1
+        request_profiler.enable()
+        self.login('user', 'password')
+        with self.assertLogs(app.logger, 'WARNING') as logs:
+            self.app.get('/user/user')
+        output = '\n'.join(logs.output)
+        self.assertIn('Slow request GET /user/user', output)
+        self.assertIn('SELECT', output)
+        self.assertTrue([name for name in os.listdir(self.dump_dir) if name.endswith('ms.prof')])
+
+
+class PageCacheTest(unittest.TestCase):
+    """Rendered task list cache testing class"""
+
+    def setUp(self):
+        self.app = app.test_client()
+        test_database.begin()
+        password = User.hash_password("password")
+        db.session.add(User(id=0, username='user', password=password, email="test@test.com", tasks_per_page=2))
+        for i in range(3):
+            db.session.add(Task(id=i + 1, task="task number {}".format(i + 1), executed=0,
+                                data_pub=datetime(2017, 1, 19, 4, i), username_id=0))
+        db.session.commit()
+        User.repair_task_counters()     # liczniki zadań dodanych z pominięciem Task.handle_task_adding
+        self.login('user', 'password')
+
+    def tearDown(self):
+        test_database.rollback()
+
+    # Helper methods
+
+    def login(self, username, password):
+        return self.app.post('/', data=dict(login=username, password=password), follow_redirects=True)
+
+    def count_task_selects(self, function):
+        statements = []
+
+        def count_selects(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT') and 'FROM task' in statement:
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_selects)
+        try:
+            function()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_selects)
+        return len(statements)
+
+    # Tests
+
+    def test_repeated_page_view_served_from_cache(self):
+        self.app.get('/user/user')
+        self.assertEqual(self.count_task_selects(lambda: self.app.get('/user/user')), 0)
+        self.assertEqual(self.count_task_selects(lambda: self.app.get('/user/user/2')), 1)  # no COUNT
+        stats = page_cache.stats()
+        self.assertEqual(stats['size'], 2)
+        self.assertGreater(stats['memory'], 0)
+        self.assertEqual(stats['hit_ratio'], 0.5)      # login redirect, 3 views: 2 misses, 2 hits
+
+    def test_flashed_messages_are_not_cached(self):
+        self.app.get('/user/user')
+        response = self.app.post('/user/user', data=dict(task='fresh task', date='2018-01-01T10:00'),
+                                 follow_redirects=True)
+        self.assertIn(b'fresh task', response.data)
+        self.assertIn(b'New task added.', response.data)
+        response = self.app.get('/user/user')
+        self.assertNotIn(b'New task added.', response.data)
+
+    def test_task_changes_invalidate_cached_pages(self):
+        self.assertIn(b'task number 3', self.app.get('/user/user').data)
+        self.app.post('/erase', data=dict(erase=[3]))
+        self.assertNotIn(b'task number 3', self.app.get('/user/user').data)
+        self.app.post('/executed', data=dict(execute=2))
+        self.assertIn(b'class="b6"', self.app.get('/user/user').data)
+        self.app.post('/undo', data=dict(undo=2))
+        self.assertNotIn(b'class="b6"', self.app.get('/user/user').data)
+
+    def test_cursor_page_does_not_replace_numbered_page(self):
+        first = self.app.get('/user/user').data.decode()
+        cursor = re.search(r'/user/user/2\?cursor=([^"&]+)', first).group(1)
+        Task.handle_task_adding('task number 4', '2017-01-20T10:00', 0)
+        # kursor sprzed dodania zadania wskazuje za zadaniem 2, czyli inne zadania niż strona 2 po zmianie
+        stale = self.app.get('/user/user/2?cursor=' + cursor).data
+        self.assertNotIn(b'task number 2', stale)
+        self.assertIn(b'task number 1', stale)
+        numbered = self.app.get('/user/user/2').data
+        self.assertIn(b'task number 2', numbered)
+        self.assertIn(b'task number 1', numbered)
+        self.assertEqual(self.count_task_selects(lambda: self.app.get('/user/user/2?cursor=' + cursor)), 0)
+
+    def test_tasks_per_page_change_invalidates_cached_pages(self):
+        self.assertNotIn(b'task number 1', self.app.get('/user/user').data)
+        self.app.post('/app_settings', data=dict(tasks_per_page=5), follow_redirects=True)
+        self.assertIn(b'task number 1', self.app.get('/user/user').data)
+
+    def test_memory_bound_evicts_least_recently_used_pages(self):
+        cache = LRUCache(maxsize=10, ttl=60, max_memory=3 * len('x' * 1000) + 200)
+        for i in range(4):
+            cache.set(i, 'x' * 1000)
+        self.assertIsNone(cache.get(0))
+        self.assertEqual(cache.stats()['size'], 3)
+        self.assertLessEqual(cache.stats()['memory'], cache.max_memory)
+        cache.invalidate(1)
+        cache.set(2, 'y')
+        self.assertEqual(cache.stats()['size'], 2)
+        self.assertEqual(cache.memory, sys.getsizeof('y') + sys.getsizeof('x' * 1000))
+
+
+class EngineProfileTest(unittest.TestCase):
+    """SQLite engine profile testing class"""
+
+    def setUp(self):
+        # profil 'production' dotyczy bazy w pliku, więc osobna aplikacja zamiast testowej bazy w pamięci
+        self.directory = tempfile.mkdtemp()
+        self.profile_app = Flask(__name__)
+        self.profile_app.config.from_object('config')
+        self.profile_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(self.directory, 'test.db')
+        db.init_app(self.profile_app)
+        self.context = self.profile_app.app_context()
+        self.context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+        self.context.pop()
+        shutil.rmtree(self.directory)
+
+    def pragma(self, name):
+        return db.session.execute('PRAGMA ' + name).scalar()
+
+    # Tests
+
+    def test_production_profile_pragmas(self):
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('synchronous'), 1)     # NORMAL
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        self.assertEqual(self.pragma('cache_size'), -16384)
+        self.assertEqual(self.pragma('foreign_keys'), 1)
+
+    def test_production_profile_pools_connections(self):
+        self.assertEqual(db.engine.pool.__class__.__name__, 'QueuePool')
+        self.assertEqual(db.engine.pool.size(), app.config['SQLITE_PROFILES']['production']['pool_size'])
+
+    def test_foreign_keys_are_enforced(self):
+        db.session.add(Task(task='orphan', executed=0, data_pub=None, username_id=12345))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
 
 class PollTest(unittest.TestCase):
     """Poll testing class"""
     def setUp(self):
-        app.config['TESTING'] = True
-        app.config['WTF_CSRF_ENABLED'] = False
-        app.config['DEBUG'] = True
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'test/test.db')
         self.app = app.test_client()
-        db.create_all()
-        password = argon2.using(rounds=4).hash("password")
+        test_database.begin()
+        password = User.hash_password("password")
         user1 = User(id=0, username='user', password=password, email="test@test.com")
         question1 = Question(id=1, question_text='Do You like this website?', pub_date=datetime.now())
         question2 = Question(id=2, question_text='What do you like? What would You improve?', pub_date=datetime.now())
         question3 = Question(id=3, question_text='Does this website work properly?', pub_date=datetime.now())
         question4 = Question(id=4, question_text='If not then what works wrong?', pub_date=datetime.now())
-        choice1 = Choice(id=1, question='Do You like this website?', choice_text='Yes', votes=0)
-        choice2 = Choice(id=2, question='Do You like this website?', choice_text='No', votes=0)
-        choice3 = Choice(id=3, question='Does this website work properly?', choice_text='Yes', votes=0)
-        choice4 = Choice(id=4, question='Does this website work properly?', choice_text='No', votes=0)
+        choice1 = Choice(id=1, question=1, choice_text='Yes', votes=0)
+        choice2 = Choice(id=2, question=1, choice_text='No', votes=0)
+        choice3 = Choice(id=3, question=3, choice_text='Yes', votes=0)
+        choice4 = Choice(id=4, question=3, choice_text='No', votes=0)
         db.session.add(user1)
         db.session.add(question1)
         db.session.add(question2)
@@ -458,8 +1450,7 @@ class PollTest(unittest.TestCase):
         db.session.commit()
 
     def tearDown(self):
-        db.session.remove()
-        db.drop_all()
+        test_database.rollback()
 
     # Helper methods
 
@@ -470,6 +1461,20 @@ class PollTest(unittest.TestCase):
         return self.app.post('/poll', data=dict(choice1=choice1, choice2=choice2, choice3=choice3, choice4=choice4),
                              follow_redirects=True)
 
+    def count_selects(self, function):
+        statements = []
+
+        def count_select(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT'):
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_select)
+        try:
+            function()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_select)
+        return len(statements)
+
     # Tests
 
     def test_poll_page(self):
@@ -541,6 +1546,89 @@ class PollTest(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b"Max 255 characters!", response.data)
 
+    def test_poll_results_structure(self):
+        results = Question.get_poll_results()
+        self.assertEqual([question.id for question in results], [1, 2, 3, 4])
+        self.assertEqual([(choice.id, choice.choice_text, choice.votes) for choice in results[0].choices],
+                         [(1, 'Yes', 0), (2, 'No', 0)])
+        self.assertEqual(results[1].choices, ())
+
+    def test_poll_results_loaded_with_one_query_and_cached(self):
+        self.assertEqual(self.count_selects(Question.get_poll_results), 1)
+        self.assertEqual(self.count_selects(Question.get_poll_results), 0)
+
+    def test_results_page_shows_choices_and_votes(self):
+        self.login('user', 'password')
+        self.app.get('/results')
+        self.vote(1, '', 4, '')
+        response = self.app.get('/results')
+        self.assertIn(b'Yes -- 1 vote(s)', response.data)
+        self.assertIn(b'No -- 1 vote(s)', response.data)
+        self.assertEqual(self.count_selects(lambda: self.app.get('/results')), 0)
+
+    def test_vote_invalidates_poll_results(self):
+        self.assertEqual(Question.get_poll_results()[0].choices[0].votes, 0)
+        Choice.handle_selected_choices(1, 3)
+        self.assertEqual(Question.get_poll_results()[0].choices[0].votes, 1)
+        self.assertEqual(Question.get_poll_results()[2].choices[0].votes, 1)
+
+    def vote_concurrently(self, threads_number, votes_per_thread):
+        def vote():
+            try:
+                for _ in range(votes_per_thread):
+                    self.assertTrue(Choice.handle_selected_choices('1', '3'))
+            finally:
+                db.session.remove()
+
+        threads = [threading.Thread(target=vote) for _ in range(threads_number)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_vote_is_single_update_statement(self):
+        Choice.get_valid_ids()
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement.lstrip().split()[0].upper())
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            Choice.handle_selected_choices('2', '4')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(statements, ['UPDATE'])
+        self.assertEqual(Choice.query.filter_by(id=2).first().votes, 1)
+
+    def test_invalid_vote_unknown_choice(self):
+        self.login('user', 'password')
+        response = self.vote(99, '', 3, '')
+        self.assertIn(b"You did not select a choice in all questions.", response.data)
+        self.assertEqual(Choice.query.filter_by(id=3).first().votes, 0)
+
+    def test_concurrent_votes_are_counted_exactly(self):
+        self.vote_concurrently(8, 25)
+        db.session.expire_all()
+        self.assertEqual(Choice.query.filter_by(id=1).first().votes, 200)
+        self.assertEqual(Choice.query.filter_by(id=3).first().votes, 200)
+
+    def test_buffered_votes_are_counted_exactly(self):
+        app.config.update(POLL_VOTE_BUFFER=True, POLL_VOTE_FLUSH_INTERVAL=3600)
+        vote_buffer.init_app(app)
+        try:
+            self.vote_concurrently(8, 25)
+            self.assertEqual(vote_buffer.pending(), 400)
+            self.assertEqual(Choice.query.filter_by(id=1).first().votes, 0)
+            self.assertEqual(vote_buffer.flush(), 400)
+        finally:
+            app.config.update(POLL_VOTE_BUFFER=False, POLL_VOTE_FLUSH_INTERVAL=1)
+            vote_buffer.init_app(app)
+        db.session.expire_all()
+        self.assertEqual(Choice.query.filter_by(id=1).first().votes, 200)
+        self.assertEqual(Choice.query.filter_by(id=3).first().votes, 200)
+        self.assertEqual(Question.get_poll_results()[0].choices[0].votes, 200)
+
     def test_invalid_vote_not_all_options_chosen_version1(self):
         self.login('user', 'password')
         response = self.vote(1, '', '', '')
@@ -575,30 +1663,26 @@ class PaginationTest(unittest.TestCase):
     """Pagination testing class"""
 
     def setUp(self):
-        app.config['TESTING'] = True
-        app.config['WTF_CSRF_ENABLED'] = False
-        app.config['DEBUG'] = True
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'test/test.db')
         self.app = app.test_client()
-        db.create_all()
-        password1 = argon2.using(rounds=4).hash("password")
+        test_database.begin()
+        password1 = User.hash_password("password")
         user1 = User(id=0, username='user1', password=password1, email="test@test.com", tasks_per_page=20)
         user2 = User(id=1, username='user2', password=password1, email="test2@test.com")
         db.session.add(user1)
         db.session.add(user2)
         for i in range(15):
-            task = Task(id=i, task="test task test", executed=False, data_pub="2017-01-19T04:00", username_id=0)
+            task = Task(id=i, task="test task test", executed=False, data_pub=datetime(2017, 1, 19, 4, 0), username_id=0)
             db.session.add(task)
             db.session.commit()
         for i in range(15):
             j = 20+i
-            task = Task(id=j, task="test task test", executed=False, data_pub="2017-01-19T04:00", username_id=1)
+            task = Task(id=j, task="test task test", executed=False, data_pub=datetime(2017, 1, 19, 4, 0), username_id=1)
             db.session.add(task)
             db.session.commit()
+        User.repair_task_counters()     # liczniki zadań dodanych z pominięciem Task.handle_task_adding
 
     def tearDown(self):
-        db.session.remove()
-        db.drop_all()
+        test_database.rollback()
 
     # Helper methods
 
@@ -684,6 +1768,530 @@ class PaginationTest(unittest.TestCase):
         user = User.query.filter_by(username="user2").first()
         self.assertEqual(user.tasks_per_page, 5)
 
+    def test_tasks_list_view_does_not_write(self):
+        self.login('user2', 'password')
+        statements = []
+
+        def count_writes(conn, cursor, statement, parameters, context, executemany):
+            if not statement.lstrip().upper().startswith('SELECT'):
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_writes)
+        try:
+            response = self.app.get('/user/user2/2')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_writes)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(statements, [])
+
+    def test_redirect_to_last_viewed_page_after_execute(self):
+        self.login('user2', 'password')
+        self.app.get('/user/user2/2')
+        response = self.app.post('/executed', data=dict(execute=21))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.location.endswith('/user/user2/2'))
+
+
+class KeysetPaginationTest(unittest.TestCase):
+    """Keyset (cursor) pagination testing class"""
+
+    def setUp(self):
+        self.app = app.test_client()
+        test_database.begin()
+        password1 = User.hash_password("password")
+        user1 = User(id=0, username='user1', password=password1, email="test@test.com", tasks_per_page=4)
+        db.session.add(user1)
+        # kilka zadań z tą samą datą oraz bez daty, żeby sprawdzić rozstrzyganie remisów po id
+        for i in range(10):
+            data_pub = datetime(2017, 1, i % 3 + 1, 4, 0) if i < 8 else None
+            db.session.add(Task(id=i, task="task {}".format(i), executed=False, data_pub=data_pub, username_id=0))
+        db.session.commit()
+        User.repair_task_counters()     # liczniki zadań dodanych z pominięciem Task.handle_task_adding
+        self.expected = [task.id for task in Task.query.order_by(Task.data_pub.desc(), Task.id.desc()).all()]
+
+    def tearDown(self):
+        test_database.rollback()
+
+    # Tests
+
+    def test_next_cursors_walk_all_tasks_once(self):
+        user = User.query.get(0)
+        with app.test_request_context():
+            seen = []
+            page, cursor = 1, None
+            while True:
+                tasks = Task.get_all_tasks_by_username(user, page, cursor)
+                self.assertEqual(tasks.pages, 3)
+                seen.extend(task.id for task in tasks.items)
+                if not tasks.has_next:
+                    break
+                page, cursor = tasks.next_num, tasks.next_cursor
+        self.assertEqual(seen, self.expected)
+
+    def test_prev_cursor_returns_previous_page(self):
+        user = User.query.get(0)
+        with app.test_request_context():
+            page2 = Task.get_all_tasks_by_username(user, 2)
+            page3 = Task.get_all_tasks_by_username(user, 3, page2.next_cursor)
+            back = Task.get_all_tasks_by_username(user, 2, page3.prev_cursor)
+        self.assertEqual([task.id for task in page3.items], self.expected[8:])
+        self.assertEqual([task.id for task in back.items], self.expected[4:8])
+
+    def test_invalid_cursor_falls_back_to_page_number(self):
+        user = User.query.get(0)
+        with app.test_request_context():
+            tasks = Task.get_all_tasks_by_username(user, 2, "invalid-cursor")
+        self.assertEqual([task.id for task in tasks.items], self.expected[4:8])
+
+    def test_page_below_one_is_not_found(self):
+        self.app.post('/', data=dict(login='user1', password='password'), follow_redirects=True)
+        self.assertEqual(self.app.get('/user/user1/0').status_code, 404)
+        user = User.query.get(0)
+        with app.test_request_context():
+            with self.assertRaises(NotFound):
+                Task.get_all_tasks_by_username(user, -1)
+
+    def test_cursor_links_in_tasks_list(self):
+        self.app.post('/', data=dict(login='user1', password='password'), follow_redirects=True)
+        response = self.app.get('/user/user1/1')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'/user/user1/2?cursor=', response.data)
+
+
+class TaskListOptionsTest(unittest.TestCase):
+    """Filtered and sorted task list testing class"""
+
+    def setUp(self):
+        self.app = app.test_client()
+        test_database.begin()
+        password1 = User.hash_password("password")
+        user1 = User(id=0, username='user1', password=password1, email="test@test.com", tasks_per_page=3)
+        user2 = User(id=1, username='user2', password=password1, email="test2@test.com")
+        db.session.add_all([user1, user2])
+        # zadania z kilku dni, część z tą samą datą lub bez daty, co trzecie wykonane
+        for i in range(14):
+            data_pub = datetime(2017, 1, i % 5 + 1, 12, 0) if i < 12 else None
+            db.session.add(Task(id=i, task="task {}".format(i), executed=i % 3 == 0, data_pub=data_pub,
+                                username_id=0))
+        db.session.add(Task(id=20, task="other user's task", executed=False, data_pub=datetime(2017, 1, 2),
+                            username_id=1))
+        db.session.commit()
+        User.repair_task_counters()     # liczniki zadań dodanych z pominięciem Task.handle_task_adding
+
+    def tearDown(self):
+        test_database.rollback()
+
+    # Helper methods
+
+    def login(self, username, password):
+        return self.app.post('/', data=dict(login=username, password=password), follow_redirects=True)
+
+    def expected_ids(self, options):
+        """Ids of user1's tasks matching options, sorted in Python: newest first with tasks without date last,
+        oldest first is the exact reverse"""
+
+        tasks = [task for task in Task.query.filter_by(username_id=0).all()
+                 if (options.get('status') != 'open' or not task.executed) and
+                 (options.get('status') != 'executed' or task.executed) and
+                 ('from' not in options or task.data_pub and task.data_pub.strftime('%Y-%m-%d') >= options['from']) and
+                 ('to' not in options or task.data_pub and task.data_pub.strftime('%Y-%m-%d') <= options['to'])]
+        tasks.sort(key=lambda task: (task.data_pub is not None, task.data_pub or datetime.min, task.id), reverse=True)
+        ids = [task.id for task in tasks]
+        return ids[::-1] if options.get('order') == 'oldest' else ids
+
+    def all_options(self):
+        for status in Task.list_statuses:
+            for order in Task.list_orders:
+                for dates in ({}, {'from': '2017-01-02'}, {'to': '2017-01-04'}, {'from': '2017-01-02', 'to': '2017-01-03'}):
+                    yield Task.get_list_options(dict(dates, status=status, order=order))
+
+    def walk_pages(self, user, options):
+        """Walks all pages forward with next cursors and back with prev cursors, returns ids of the tasks seen
+        going forward, asserts that going back gives the same pages"""
+
+        pages, page, cursor = [], 1, None
+        while True:
+            tasks = Task.get_all_tasks_by_username(user, page, cursor, options=options)
+            pages.append([task.id for task in tasks.items])
+            if not tasks.has_next:
+                break
+            page, cursor = tasks.next_num, tasks.next_cursor
+        while tasks.has_prev:
+            tasks = Task.get_all_tasks_by_username(user, tasks.prev_num, tasks.prev_cursor, options=options)
+            self.assertEqual([task.id for task in tasks.items], pages[tasks.page - 1])
+        self.assertEqual(tasks.total, sum(len(items) for items in pages))
+        return [task_id for items in pages for task_id in items]
+
+    # Tests
+
+    def test_list_options_skip_defaults_and_invalid_values(self):
+        with app.app_context():
+            self.assertEqual(Task.get_list_options({'status': 'all', 'order': 'newest'}), {})
+            self.assertEqual(Task.get_list_options({'status': 'done', 'order': 'random', 'from': '2017-13-01',
+                                                    'to': 'tomorrow'}), {})
+            self.assertEqual(Task.get_list_options({'status': 'open', 'order': 'oldest', 'from': '2017-01-02',
+                                                    'to': '2017-01-03'}),
+                             {'status': 'open', 'order': 'oldest', 'from': '2017-01-02', 'to': '2017-01-03'})
+
+    def test_every_combination_of_options_walks_matching_tasks(self):
+        user = User.query.get(0)
+        with app.test_request_context():
+            for options in self.all_options():
+                self.assertEqual(self.walk_pages(user, options), self.expected_ids(options), options)
+
+    def test_every_combination_of_options_is_served_by_index(self):
+        user = User.query.get(0)
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if 'from task' in statement.lower():
+                statements.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            with app.test_request_context():
+                for options in self.all_options():
+                    self.walk_pages(user, options)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertTrue(statements)
+        cursor = db.session.connection().connection.cursor()
+        for statement, parameters in statements:
+            plan = [row[3] for row in cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)]
+            for detail in plan:
+                self.assertFalse(detail.startswith('SCAN'), (statement, plan))
+                self.assertNotIn('TEMP B-TREE', detail, (statement, plan))
+
+    def test_tasks_list_keeps_options_in_links_and_redirects(self):
+        self.login('user1', 'password')
+        response = self.app.get('/user/user1?status=open&order=oldest')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'<option value="open" selected>', response.data)
+        self.assertIn(b'order=oldest', response.data)
+        self.assertIn(b'status=open', response.data)
+        # najpierw zadania bez daty, potem najstarsze, bez wykonanych
+        self.assertIn(b'task 13 ', response.data)
+        self.assertIn(b'task 5 ', response.data)
+        self.assertNotIn(b'task 0 ', response.data)
+        response = self.app.post('/executed', data=dict(execute=1))
+        self.assertIn('status=open', response.location)
+        self.assertIn('order=oldest', response.location)
+        response = self.app.get('/user/user1?status=executed&from=2017-01-05&to=2017-01-05')
+        self.assertIn(b'task 9 ', response.data)
+        self.assertNotIn(b'task 4 ', response.data)
+        self.assertNotIn(b'task 0 ', response.data)
+
+
+class TagTest(unittest.TestCase):
+    """Task tags testing class"""
+
+    def setUp(self):
+        self.app = app.test_client()
+        test_database.begin()
+        password1 = User.hash_password("password")
+        user1 = User(id=0, username='user1', password=password1, email="test@test.com", tasks_per_page=3)
+        user2 = User(id=1, username='user2', password=password1, email="test2@test.com")
+        db.session.add_all([user1, user2])
+        db.session.commit()
+        self.tasks = [Task.handle_task_adding(text, '2017-01-0{}T12:00'.format(day), 0).id for day, text in enumerate([
+            "buy milk #Shop #home", "call mom #home", "fix bike #shop #garage #shop", "read a book",
+            "paint fence #home #garage"], 1)]
+        Task.handle_task_adding("other user's task #home", '', 1)
+
+    def tearDown(self):
+        test_database.rollback()
+
+    # Helper methods
+
+    def login(self, username, password):
+        return self.app.post('/', data=dict(login=username, password=password), follow_redirects=True)
+
+    def tag_counts(self, user_id=0):
+        return {tag.name: tag.tasks_count for tag in Tag.query.filter_by(username_id=user_id)}
+
+    def tagged_ids(self, **args):
+        user = User.query.get(0)
+        with app.test_request_context():
+            tasks = Task.get_all_tasks_by_username(user, 1, options=Task.get_list_options(args))
+            while tasks.has_next:   # strona ma 3 zadania, w wyniku mogą być wszystkie
+                user.tasks_per_page += 3
+                tasks = Task.get_all_tasks_by_username(user, 1, options=Task.get_list_options(args))
+        return sorted(task.id for task in tasks.items), tasks.total
+
+    # Tests
+
+    def test_parse_tags(self):
+        self.assertEqual(Tag.parse_tags("Plan #Trip-2017 with#no, #trip-2017 ##x #_a #-b"), {'trip-2017', '_a'})
+        self.assertEqual(Tag.parse_tag_names("#work, home  Work #-x"), {'work', 'home'})
+
+    def test_adding_tasks_counts_tags(self):
+        self.assertEqual(self.tag_counts(), {'shop': 2, 'home': 3, 'garage': 2})
+        self.assertEqual(self.tag_counts(1), {'home': 1})
+
+    def test_editing_task_text_retags_task(self):
+        Task.handle_task_editing(self.tasks[2], 0, task_text="fix bike #garage #tools")
+        self.assertEqual(self.tag_counts(), {'shop': 1, 'home': 3, 'garage': 2, 'tools': 1})
+        Task.handle_task_editing(self.tasks[0], 0, task_text="buy milk")
+        self.assertEqual(self.tag_counts(), {'home': 2, 'garage': 2, 'tools': 1})
+        # zmiana statusu lub daty nie zmienia tagów, edycja cudzego zadania też nie
+        Task.handle_task_editing(self.tasks[1], 0, executed=True)
+        Task.handle_task_editing(self.tasks[1], 1, task_text="call mom")
+        self.assertEqual(self.tag_counts(), {'home': 2, 'garage': 2, 'tools': 1})
+
+    def test_deleting_tasks_untags_them(self):
+        Task.handle_tasks_deleting([self.tasks[0], self.tasks[2]], 0)
+        self.assertEqual(self.tag_counts(), {'home': 2, 'garage': 1})
+        Task.handle_tasks_deleting([self.tasks[1], self.tasks[4]], 1)
+        self.assertEqual(self.tag_counts(), {'home': 2, 'garage': 1})
+        Task.handle_tasks_deleting(self.tasks, 0)
+        self.assertEqual(self.tag_counts(), {})
+        self.assertEqual(self.tag_counts(1), {'home': 1})
+
+    def test_imported_tasks_are_tagged(self):
+        with app.app_context():
+            rows = [(1, "import #shop", '', 0), (2, "import #new #NEW", '', 1), (3, "no tags", '', 0)]
+            self.assertEqual(Task.handle_tasks_import(rows, 0).imported, 3)
+            self.assertEqual(self.tag_counts(), {'shop': 3, 'home': 3, 'garage': 2, 'new': 1})
+
+    def test_import_tags_only_its_own_tasks(self):
+        home_id = Tag.query.filter_by(username_id=0, name='home').one().id
+        added = []
+
+        def add_task(conn, cursor, statement, parameters, context, executemany):
+            # zadanie z tagiem dodane przez inne żądanie pomiędzy zapytaniami importu
+            if statement.startswith('INSERT INTO task ') and not added:
+                cursor.execute("INSERT INTO task (task, executed, username_id) VALUES ('added #home', 0, 0)")
+                added.append(cursor.lastrowid)
+                cursor.execute("INSERT INTO task_tag (task_id, tag_id) VALUES (?, ?)", (cursor.lastrowid, home_id))
+
+        rows = [(1, "no tags", '', 0), (2, "import #home", '', 0), (3, "import #new", '', 1)]
+        event.listen(db.engine, 'before_cursor_execute', add_task)
+        try:
+            with app.app_context():
+                self.assertEqual(Task.handle_tasks_import(rows, 0).imported, 3)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', add_task)
+        links = db.session.query(Task.task, Tag.name).join(task_tag, task_tag.c.task_id == Task.id)\
+            .join(Tag, Tag.id == task_tag.c.tag_id).filter(Task.username_id == 0, Task.id > self.tasks[-1])
+        self.assertEqual(sorted(links), [('added #home', 'home'), ('import #home', 'home'), ('import #new', 'new')])
+
+    def test_deleting_account_deletes_tags(self):
+        User.delete_account_rows(0)
+        self.assertEqual(self.tag_counts(), {})
+        self.assertEqual(self.tag_counts(1), {'home': 1})
+
+    def test_tag_filter_matches_all_or_any_tags(self):
+        tasks = self.tasks
+        self.assertEqual(self.tagged_ids(tags='home'), ([tasks[0], tasks[1], tasks[4]], 3))
+        self.assertEqual(self.tagged_ids(tags='#home #garage'), ([tasks[4]], 1))
+        self.assertEqual(self.tagged_ids(tags='home,shop', match='any'), ([tasks[0], tasks[1], tasks[2], tasks[4]], 4))
+        self.assertEqual(self.tagged_ids(tags='home missing'), ([], 0))
+        self.assertEqual(self.tagged_ids(tags='home missing', match='any'), ([tasks[0], tasks[1], tasks[4]], 3))
+        Task.handle_task_editing(tasks[1], 0, executed=True)
+        self.assertEqual(self.tagged_ids(tags='home', status='open'), ([tasks[0], tasks[4]], 2))
+
+    def test_single_tag_total_is_taken_from_tag_counter(self):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if 'count(' in statement.lower():
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            total = self.tagged_ids(tags='shop')[1]
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(total, 2)
+        self.assertEqual(statements, [])
+
+    def test_tag_filter_queries_search_indexes(self):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if 'task_tag' in statement and statement.startswith('SELECT'):
+                statements.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            for args in ({'tags': 'home'}, {'tags': 'home garage'}, {'tags': 'home shop', 'match': 'any'},
+                         {'tags': 'home shop', 'status': 'open', 'order': 'oldest'}):
+                self.tagged_ids(**args)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertTrue(statements)
+        cursor = db.session.connection().connection.cursor()
+        for statement, parameters in statements:
+            plan = [row[3] for row in cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)]
+            for detail in plan:
+                # wynik INTERSECT czytany w całości (SCAN anon_1) ma tylko zadania z tagami
+                self.assertNotRegex(detail, r'^SCAN (task|tag|task_tag)\b', (statement, plan))
+            self.assertTrue(any('ix_task_tag_tag_id_task_id' in detail for detail in plan), (statement, plan))
+
+    def test_tag_cloud_in_tasks_list(self):
+        with app.app_context():
+            self.assertEqual(Tag.get_tag_cloud(0), [('garage', 2, 1), ('home', 3, 5), ('shop', 2, 1)])
+        self.login('user1', 'password')
+        response = self.app.get('/user/user1?status=open')
+        self.assertIn(b'class="tag5" href="/user/user1?status=open&amp;tags=home"', response.data)
+        response = self.app.get('/user/user1?tags=garage+%23home')
+        self.assertIn(b'value="garage home"', response.data)
+        self.assertIn(b'paint fence', response.data)
+        self.assertNotIn(b'buy milk', response.data)
+
+    def test_tag_settings_read_from_app_config(self):
+        with app.app_context():
+            app.config['TAG_CLOUD_SIZE'] = 1
+            app.config['TASK_LIST_MAX_TAGS'] = 1
+            try:
+                self.assertEqual(Tag.get_tag_cloud(0), [('home', 3, 1)])
+                self.assertEqual(Task.get_list_options({'tags': 'shop home'}), {'tags': 'home'})
+            finally:
+                app.config['TAG_CLOUD_SIZE'] = 50
+                app.config['TASK_LIST_MAX_TAGS'] = 5
+
+
+class UserCacheTest(unittest.TestCase):
+    """Cached flask-login user_loader testing class"""
+
+    def setUp(self):
+        self.app = app.test_client()
+        test_database.begin()
+        password = User.hash_password("password")
+        user1 = User(id=0, username='user', password=password, email="test@test.com")
+        db.session.add(user1)
+        db.session.commit()
+
+    def tearDown(self):
+        test_database.rollback()
+
+    # Helper methods
+
+    def login(self, username, password):
+        return self.app.post('/', data=dict(login=username, password=password), follow_redirects=True)
+
+    def count_user_selects(self, function):
+        statements = []
+
+        def count_selects(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT') and 'FROM user' in statement:
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_selects)
+        try:
+            function()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_selects)
+        return len(statements)
+
+    # Tests
+
+    def test_authenticated_request_served_from_cache(self):
+        self.login('user', 'password')
+        self.app.get('/settings')
+        hits = user_cache.stats()['hits']
+        self.assertEqual(self.count_user_selects(lambda: self.app.get('/settings')), 0)
+        self.assertEqual(user_cache.stats()['hits'], hits + 1)
+
+    def test_cache_invalidated_by_profile_change(self):
+        self.login('user', 'password')
+        self.app.get('/settings')
+        self.app.post('/settings', data=dict(login='', password='', password2='', email='new@test.com'))
+        self.assertIsNone(user_cache.get(0))
+        response = self.app.get('/user/user')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(User.query.get(0).email, 'new@test.com')
+
+    def test_lru_eviction_and_ttl(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set(1, 'a')
+        cache.set(2, 'b')
+        cache.get(1)
+        cache.set(3, 'c')
+        self.assertEqual(cache.get(2), None)
+        self.assertEqual(cache.get(1), 'a')
+        cache.ttl = -1
+        cache.set(4, 'd')
+        self.assertEqual(cache.get(4), None)
+        self.assertEqual(cache.stats()['hits'], 2)
+
+    def test_test_database_rollback_clears_all_caches(self):
+        cache = LRUCache()
+        cache.set(1, 'a')
+        user_cache.set(1, 'b')
+        test_database.rollback()
+        test_database.begin()       # tearDown zamyka kolejną transakcję testu
+        self.assertEqual((cache.get(1), user_cache.get(1)), (None, None))
+        self.assertEqual(cache.stats()['misses'], 1)
+
+
+class PasswordHashingTest(unittest.TestCase):
+    """Password hashing pool and cost profiles testing class"""
+
+    def setUp(self):
+        self.app = app.test_client()
+        test_database.begin()
+        password = User.hash_password("password")
+        user1 = User(id=0, username='user', password=password, email="test@test.com")
+        db.session.add(user1)
+        db.session.commit()
+
+    def tearDown(self):
+        test_database.rollback()
+
+    # Helper methods
+
+    @staticmethod
+    def make_hasher(**settings):
+        config = dict(PASSWORD_HASH_PROFILES=app.config['PASSWORD_HASH_PROFILES'], PASSWORD_HASH_PROFILE='test')
+        config.update(settings)
+        hasher = PasswordHasher()
+        hasher.init_app(type('App', (object,), {'config': config}))
+        return hasher
+
+    # Tests
+
+    def test_outdated_hash_replaced_on_login(self):
+        app.config['PASSWORD_HASH_PROFILE'] = 'interactive'
+        password_hasher.init_app(app)
+        try:
+            response = self.app.post('/', data=dict(login='user', password='password'), follow_redirects=True)
+        finally:
+            app.config['PASSWORD_HASH_PROFILE'] = 'test'
+            password_hasher.init_app(app)
+        self.assertIn(b'Logged in successfully', response.data)
+        password_hash = User.query.get(0).password
+        self.assertIn('t=4', password_hash)
+        self.assertTrue(argon2.verify('password', password_hash))
+
+    def test_hash_and_verify_on_worker_pool(self):
+        hasher = self.make_hasher(PASSWORD_HASH_WORKERS=2, PASSWORD_HASH_QUEUE_SIZE=2, PASSWORD_HASH_TIMEOUT=5)
+        try:
+            password_hash = hasher.hash('password')
+            self.assertTrue(hasher.verify('password', password_hash))
+            self.assertFalse(hasher.verify('password1', password_hash))
+            self.assertFalse(hasher.needs_update(password_hash))
+        finally:
+            hasher.shutdown()
+
+    def test_full_queue_raises_busy(self):
+        hasher = self.make_hasher(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE_SIZE=0, PASSWORD_HASH_TIMEOUT=0.05)
+        started, release = threading.Event(), threading.Event()
+
+        def slow_job():
+            started.set()
+            release.wait(5)
+
+        worker = threading.Thread(target=hasher._run, args=(slow_job,))
+        worker.start()
+        try:
+            started.wait(5)
+            self.assertRaises(HashingPoolBusy, hasher.hash, 'password')
+        finally:
+            release.set()
+            worker.join()
+            hasher.shutdown()
+
 if __name__ == '__main__':
     unittest.main()
     os.chdir(basedir)
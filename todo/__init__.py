@@ -1,19 +1,49 @@
 # -*- coding: utf-8 -*-
 from flask import Flask
 from flask_login import LoginManager
-from flask_sqlalchemy import SQLAlchemy
 from flask_mail import Mail
 from flask_sslify import SSLify
 
-app = Flask(__name__)               # stworzenie aplikacji
-app.config.from_object('config')       # konfiguracja aplikacji wczytana z modułu config.py
-db = SQLAlchemy(app)            # utworzenie obiektu bazy danych
-mail = Mail(app)            # utworzenie możliwości wysyłania emaili
-sslify = SSLify(app)        # wymuszenie użycia https
+from .cache import page_cache, poll_results_cache, user_cache
+from .engine import SQLAlchemy
+from .hashing import password_hasher
+from .mailer import mail_dispatcher
+from .profiling import request_profiler
+from .purge import account_purger
+from .votes import vote_buffer
 
+# rozszerzenia tworzone bez aplikacji, wiązane z nią w create_app()
+db = SQLAlchemy()           # obiekt bazy danych, z profilem SQLite z konfiguracji
+mail = Mail()           # możliwość wysyłania emaili
 login_manager = LoginManager()
-login_manager.init_app(app)         #połączenie flask-login z flask
-login_manager.login_view = "login"
+login_manager.login_view = "main.login"
 login_manager.login_message = ""        #komunikat po zalogowaniu
 
-from todo import views, models
\ No newline at end of file
+
+def create_app(config='config', **settings):
+    """Creates the application. Takes configuration module, its import name or object (see Flask.config.from_object)
+    and optional single settings overriding it, i.e. create_app(SQLALCHEMY_DATABASE_URI='sqlite://').
+
+    Nothing connects to the database here, so the application can be created in a prefork server master before
+    the workers are forked (see wsgi.py)."""
+
+    from . import api, views       # widoki (i używane przez nie modele) importowane dopiero przy tworzeniu aplikacji
+
+    app = Flask(__name__)               # stworzenie aplikacji
+    app.config.from_object(config)       # konfiguracja aplikacji wczytana z modułu config.py
+    app.config.update(settings)
+    db.init_app(app)
+    mail.init_app(app)
+    SSLify(app)         # wymuszenie użycia https (flask_sslify nie obsługuje init_app bez aplikacji)
+    login_manager.init_app(app)         #połączenie flask-login z flask
+    user_cache.init_app(app)        # cache użytkowników wczytywanych przez flask-login
+    poll_results_cache.init_app(app)        # cache wyników ankiety
+    page_cache.init_app(app)        # cache wyrenderowanych stron listy zadań
+    password_hasher.init_app(app)       # pula wątków hashujących hasła
+    mail_dispatcher.init_app(app, mail)     # wysyłanie emaili z outboxa w tle
+    vote_buffer.init_app(app)       # opcjonalne buforowanie głosów ankiety
+    account_purger.init_app(app)        # usuwanie dużych kont w tle
+    request_profiler.init_app(app)      # opcjonalne pomiary czasu i zapytań SQL żądań
+    app.register_blueprint(views.bp)
+    app.register_blueprint(api.bp)
+    return app
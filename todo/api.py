@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# todo/api.py
+from functools import wraps
+
+from flask import Blueprint, current_app, g, jsonify, request, url_for
+from flask_login import current_user
+
+from .messages import ApiMessages
+from .models import User, Task
+
+bp = Blueprint('api', __name__)     # JSON API, rejestrowane w create_app()
+
+
+def api_login_required(view):
+    """Like flask_login.login_required, but answers 401 with JSON instead of redirecting to the login page"""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return error_response(ApiMessages.unauthorized_error_message, 401)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def error_response(message, status):
+    return jsonify(error=message), status
+
+
+def get_etag(user_id):
+    """Returns ETag of user's tasks: version of user's data, bumped by every change of the tasks"""
+
+    return '{}.{}'.format(user_id, User.get_data_version(user_id))
+
+
+def with_etag(response, status=200):
+    response = current_app.make_response((response, status))
+    response.set_etag(get_etag(g.user.id))
+    return response
+
+
+def get_task_or_none(task_id):
+    return Task.query.filter_by(id=task_id, username_id=g.user.id).first()
+
+
+@bp.route('/api/tasks', methods=['GET'])
+@api_login_required
+def api_tasks():
+    """Returns page of user's tasks. Answers 304 without reading tasks if If-None-Match holds the current ETag"""
+
+    etag = get_etag(g.user.id)
+    if request.if_none_match.contains(etag):
+        response = current_app.make_response(('', 304))
+        response.set_etag(etag)
+        return response
+
+    try:
+        limit = min(int(request.args.get('limit', current_app.config['API_TASKS_LIMIT'])), current_app.config['API_TASKS_MAX_LIMIT'])
+    except ValueError:
+        return error_response(ApiMessages.incorrect_limit_error_message, 400)
+    if limit < 1:
+        return error_response(ApiMessages.incorrect_limit_error_message, 400)
+    page = Task.get_tasks_after(g.user, limit, request.args.get('cursor'))
+    if page is None:
+        return error_response(ApiMessages.incorrect_cursor_error_message, 400)
+    tasks, next_cursor = page
+
+    response = jsonify(tasks=[task.get_api_values() for task in tasks], next_cursor=next_cursor)
+    response.set_etag(etag)
+    return response
+
+
+@bp.route('/api/tasks', methods=['POST'])
+@api_login_required
+def api_task_adding():
+    """Adds task given as JSON object with 'task' and optional 'date' ('2011-08-12T20:17')"""
+
+    data = request.get_json(silent=True) or {}
+    task_text, task_date = data.get('task'), data.get('date') or ''
+    if not isinstance(task_text, str) or not isinstance(task_date, str):
+        return error_response(ApiMessages.incorrect_task_error_message, 400)
+    try:
+        task = Task.handle_task_adding(task_text, task_date, g.user.id)
+    except ValueError:
+        task = None
+    if not task:
+        return error_response(ApiMessages.incorrect_task_error_message, 400)
+    response = with_etag(jsonify(task.get_api_values()), 201)
+    response.headers['Location'] = url_for('api.api_task', task_id=task.id)
+    return response
+
+
+@bp.route('/api/tasks/<int:task_id>', methods=['GET'])
+@api_login_required
+def api_task(task_id):
+    """Returns single task"""
+
+    task = get_task_or_none(task_id)
+    if task is None:
+        return error_response(ApiMessages.no_task_error_message, 404)
+    return jsonify(task.get_api_values())
+
+
+@bp.route('/api/tasks/<int:task_id>', methods=['PATCH'])
+@api_login_required
+def api_task_editing(task_id):
+    """Changes 'task', 'date' and/or 'executed' of a task, given as JSON object"""
+
+    data = request.get_json(silent=True) or {}
+    task_text, task_date, executed = data.get('task'), data.get('date'), data.get('executed')
+    if not all(value is None or isinstance(value, str) for value in (task_text, task_date)) or \
+            not (executed is None or isinstance(executed, bool)):
+        return error_response(ApiMessages.incorrect_task_error_message, 400)
+    changed = Task.handle_task_editing(task_id, g.user.id, task_text, task_date, executed)
+    if changed is False:
+        return error_response(ApiMessages.incorrect_task_error_message, 400)
+    if not changed:
+        return error_response(ApiMessages.no_task_error_message, 404)
+    return with_etag(jsonify(get_task_or_none(task_id).get_api_values()))
+
+
+@bp.route('/api/tasks/<int:task_id>', methods=['DELETE'])
+@api_login_required
+def api_task_deleting(task_id):
+    """Deletes task"""
+
+    if not Task.handle_tasks_deleting([task_id], g.user.id):
+        return error_response(ApiMessages.no_task_error_message, 404)
+    return with_etag('', 204)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# todo/cache.py
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """Thread-safe, per-process cache with LRU eviction and TTL. Counts hits and misses.
+    Optionally bounds memory taken by cached values (sys.getsizeof, exact for strings)"""
+
+    # wszystkie cache procesu, clear_all() czyści je np. po każdym teście
+    _instances = weakref.WeakSet()
+
+    def __init__(self, maxsize=1000, ttl=60, config_prefix=None, max_memory=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.config_prefix = config_prefix
+        self.max_memory = max_memory
+        self.memory = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        LRUCache._instances.add(self)
+
+    def init_app(self, app):
+        """Reads <config_prefix>_SIZE, <config_prefix>_TTL and <config_prefix>_MEMORY (bytes) from application
+        config"""
+
+        if self.config_prefix:
+            self.maxsize = app.config.get(self.config_prefix + '_SIZE', self.maxsize)
+            self.ttl = app.config.get(self.config_prefix + '_TTL', self.ttl)
+            self.max_memory = app.config.get(self.config_prefix + '_MEMORY', self.max_memory)
+
+    def get(self, key):
+        """Takes key, returns cached value or None if there is no valid value for the key"""
+
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[1] < time.time():
+                if item is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value):
+        """Takes key and value, saves value in cache evicting least recently used items if cache is full"""
+
+        size = sys.getsizeof(value)
+        with self._lock:
+            if key in self._items:
+                self._remove(key)
+            self._items[key] = (value, time.time() + self.ttl, size)
+            self.memory += size
+            while len(self._items) > self.maxsize or (self.max_memory and self.memory > self.max_memory):
+                self._remove(next(iter(self._items)))
+
+    def invalidate(self, key):
+        """Takes key and drops its cached value"""
+
+        with self._lock:
+            if key in self._items:
+                self._remove(key)
+
+    def clear(self):
+        """Drops all cached values and resets statistics"""
+
+        with self._lock:
+            self._items.clear()
+            self.memory = 0
+            self.hits = self.misses = 0
+
+    @classmethod
+    def clear_all(cls):
+        """Drops values and resets statistics of all caches of the process"""
+
+        for cache in list(cls._instances):
+            cache.clear()
+
+    def stats(self):
+        """Returns dict with number of hits, misses, cached items, memory taken by cached values and hit ratio"""
+
+        with self._lock:
+            requests = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._items), 'maxsize': self.maxsize,
+                    'memory': self.memory, 'max_memory': self.max_memory,
+                    'hit_ratio': self.hits / float(requests) if requests else 0.0}
+
+    def _remove(self, key):
+        self.memory -= self._items.pop(key)[2]
+
+
+# wartości kolumn użytkowników wczytywanych przez flask-login przy każdym requeście
+user_cache = LRUCache(config_prefix='USER_CACHE')
+
+# pytania ankiety z wariantami odpowiedzi i liczbą głosów (strony /poll i /results) oraz id wariantów
+poll_results_cache = LRUCache(maxsize=2, ttl=300, config_prefix='POLL_RESULTS_CACHE')
+
+# wyrenderowane strony listy zadań, klucz (id użytkownika, strona, kursor, zadań na stronę, wersja danych, opcje listy)
+page_cache = LRUCache(maxsize=2000, ttl=300, config_prefix='PAGE_CACHE', max_memory=32 * 1024 * 1024)
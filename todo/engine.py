@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# todo/engine.py
+import os
+import weakref
+
+import flask_sqlalchemy
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+
+class SQLAlchemy(flask_sqlalchemy.SQLAlchemy):
+    """flask_sqlalchemy.SQLAlchemy applying the SQLITE_PROFILE chosen in config to every SQLite engine it creates.
+
+    A profile (see SQLITE_PROFILES in config.py) holds pragmas executed on every new connection (journal_mode,
+    synchronous, busy_timeout, cache_size, mmap_size, foreign_keys...) and pool settings. pool_size > 0 keeps
+    that many connections open in a QueuePool instead of flask_sqlalchemy's default of opening a new connection
+    (and running the pragmas again) for every request. In-memory databases keep their single static connection.
+
+    Pools of engines created before os.fork() are replaced in the child process, so forked workers never share
+    connections opened by the master."""
+
+    def __init__(self, *args, **kwargs):
+        self._pragmas = {}
+        self._engines = weakref.WeakSet()
+        super(SQLAlchemy, self).__init__(*args, **kwargs)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._replace_pools)
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        sa_url, options = super(SQLAlchemy, self).apply_driver_hacks(app, sa_url, options)
+        if sa_url.drivername.startswith('sqlite'):
+            profile = app.config['SQLITE_PROFILES'][app.config['SQLITE_PROFILE']]
+            self._pragmas[str(sa_url)] = list(profile.get('pragmas', {}).items())
+            if profile.get('pool_size') and sa_url.database not in (None, '', ':memory:'):
+                options['poolclass'] = QueuePool
+                options['pool_size'] = profile['pool_size']
+                options['max_overflow'] = profile.get('max_overflow', 10)
+                options['pool_timeout'] = profile.get('pool_timeout', 30)
+                options['pool_recycle'] = profile.get('pool_recycle', -1)
+                # połączenie z puli może być użyte przez inny wątek, ale zawsze tylko przez jeden naraz
+                options.setdefault('connect_args', {})['check_same_thread'] = False
+        return sa_url, options
+
+    def create_engine(self, sa_url, engine_opts):
+        engine = super(SQLAlchemy, self).create_engine(sa_url, engine_opts)
+        pragmas = self._pragmas.get(str(sa_url))
+        if pragmas:
+            event.listen(engine, 'connect', lambda dbapi_connection, record: set_pragmas(dbapi_connection, pragmas))
+        self._engines.add(engine)
+        return engine
+
+    def _replace_pools(self):
+        # nowa, pusta pula; połączenia starej puli należą do procesu macierzystego i nie są zamykane
+        for engine in list(self._engines):
+            engine.pool = engine.pool.recreate()
+
+
+def set_pragmas(dbapi_connection, pragmas):
+    """Takes sqlite3 connection and list of (name, value), executes PRAGMA name = value for each of them"""
+
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas:
+        cursor.execute('PRAGMA {} = {}'.format(name, value))
+    cursor.close()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# todo/hashing.py
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.hash import argon2
+
+
+class HashingPoolBusy(Exception):
+    """Raised when password hashing queue stays full longer than PASSWORD_HASH_TIMEOUT"""
+
+
+class PasswordHasher(object):
+    """Hashes and verifies passwords with argon2 using parameters of the chosen cost profile.
+
+    Work is done by a bounded pool of worker threads (argon2_cffi releases the GIL), so a burst of logins or
+    registrations occupies at most PASSWORD_HASH_WORKERS cores instead of every request thread. At most
+    PASSWORD_HASH_QUEUE_SIZE jobs wait for a worker, further callers block up to PASSWORD_HASH_TIMEOUT seconds
+    and then get HashingPoolBusy. PASSWORD_HASH_WORKERS = 0 hashes on the calling thread."""
+
+    def __init__(self):
+        self.hasher = argon2
+        self.workers = 0
+        self.queue_size = 0
+        self.timeout = None
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Reads cost profile and pool settings from application config"""
+
+        profile = app.config['PASSWORD_HASH_PROFILES'][app.config['PASSWORD_HASH_PROFILE']]
+        self.hasher = argon2.using(**profile)
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', 0)
+        self.queue_size = app.config.get('PASSWORD_HASH_QUEUE_SIZE', 0)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT')
+        self.shutdown()
+
+    def hash(self, password):
+        """Takes password, returns its argon2 hash"""
+
+        return self._run(self.hasher.hash, password)
+
+    def verify(self, password, password_hash):
+        """Takes password and stored hash, returns True if they match. Otherwise returns False"""
+
+        return self._run(self.hasher.verify, password, password_hash)
+
+    def needs_update(self, password_hash):
+        """Takes stored hash, returns True if it was made with parameters other than the current profile"""
+
+        return self.hasher.needs_update(password_hash)
+
+    def shutdown(self):
+        """Stops worker threads, pool is created again on next use"""
+
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _get_executor(self):
+        # pula tworzona leniwie, dopiero w procesie który z niej korzysta (bezpieczne przy fork)
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hasher')
+                self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+            return self._executor, self._slots
+
+    def _run(self, function, *args):
+        if not self.workers:
+            return function(*args)
+        executor, slots = self._get_executor()
+        if not slots.acquire(timeout=self.timeout):
+            raise HashingPoolBusy()
+        try:
+            future = executor.submit(function, *args)
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        return future.result()
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# todo/mailer.py
+import smtplib
+import threading
+from datetime import timedelta
+
+from flask_mail import Message
+
+
+class MailDispatcher(object):
+    """Sends emails saved in the outbox (OutboxMail) on a background thread.
+
+    Views only enqueue an email and call wake(), so a slow SMTP server never holds a request. Due emails are
+    claimed in batches of MAIL_OUTBOX_BATCH_SIZE and sent over a single SMTP connection, which is reused for all
+    batches of one flush. Failed emails are retried with exponential backoff (MAIL_OUTBOX_RETRY_DELAY * 2^n)
+    until MAIL_OUTBOX_MAX_ATTEMPTS. The thread is started by the first request of every process, sends emails
+    left in the outbox (i.e. before a restart or by another process) at once and then every
+    MAIL_OUTBOX_POLL_INTERVAL seconds. MAIL_OUTBOX_WORKER = False disables the thread, flush() can then be called
+    directly (i.e. from tests or 'python send_mail.py' run by cron)."""
+
+    def __init__(self):
+        self.app = None
+        self.mail = None
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app, mail):
+        """Takes application and its flask_mail.Mail object, registers start of the thread on the first request
+        of the process"""
+
+        self.app = app
+        self.mail = mail
+        app.before_request(self._start)
+
+    def wake(self):
+        """Starts the background sender if needed and asks it to send due emails"""
+
+        if not self.app.config.get('MAIL_OUTBOX_WORKER', True):
+            return
+        with self._lock:
+            # wątek uruchamiany leniwie, dopiero w procesie który wysyła pocztę (bezpieczne przy fork)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='mail-dispatcher', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def _start(self):
+        # wątek każdego procesu (także workera po fork) startuje przy jego pierwszym żądaniu
+        if self._thread is None:
+            self.wake()
+
+    def flush(self):
+        """Sends all due emails, returns number of sent emails. Requires application context"""
+
+        from .models import OutboxMail
+        from todo import db
+
+        config = self.app.config
+        batch_size = config.get('MAIL_OUTBOX_BATCH_SIZE', 20)
+        lease = timedelta(seconds=config.get('MAIL_OUTBOX_LEASE', 300))
+        retry_delay = timedelta(seconds=config.get('MAIL_OUTBOX_RETRY_DELAY', 30))
+        max_attempts = config.get('MAIL_OUTBOX_MAX_ATTEMPTS', 5)
+
+        sent = 0
+        connection = None
+        try:
+            while True:
+                batch = OutboxMail.claim_due(batch_size, lease)
+                if not batch:
+                    break
+                for mail in batch:
+                    try:
+                        if connection is None:
+                            connection = self.mail.connect()
+                            connection.__enter__()
+                        connection.send(Message(mail['subject'], sender=config['MAIL_USERNAME'],
+                                                recipients=[mail['recipient']], body=mail['body']))
+                    except (smtplib.SMTPException, OSError) as error:
+                        OutboxMail.mark_failed(mail['id'], mail['attempts'], error, max_attempts, retry_delay)
+                        if not isinstance(error, smtplib.SMTPRecipientsRefused):
+                            connection = self._close(connection)     # połączenie zerwane, nowe przy kolejnym mailu
+                    else:
+                        OutboxMail.mark_sent(mail['id'])
+                        sent += 1
+                db.session.commit()
+                if len(batch) < batch_size:
+                    break
+        finally:
+            self._close(connection)
+        return sent
+
+    @staticmethod
+    def _close(connection):
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except (smtplib.SMTPException, OSError):
+                pass
+        return None
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.app.config.get('MAIL_OUTBOX_POLL_INTERVAL', 60))
+            self._wakeup.clear()
+            with self.app.app_context():
+                try:
+                    self.flush()
+                except Exception:
+                    self.app.logger.exception("Sending emails from the outbox failed")
+
+
+mail_dispatcher = MailDispatcher()
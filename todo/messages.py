@@ -8,6 +8,10 @@ class LoginMessages:
     success_message = 'Logged in successfully'
 
 
+class HashingMessages:
+    busy_error_message = "Server is busy at the moment. Try again in a few seconds."
+
+
 class LogoutMessages:
     success_message = 'logged out successfully'
 
@@ -23,6 +27,7 @@ class RegisterMessages:
 
 class UserMessages:
     error_message = 'Error: Task is empty or is too long. Max length 255 characters!'
+    date_error_message = 'Error: Incorrect date. Date format: YYYY-MM-DDTHH:MM'
     success_message = 'New task added.'
 
 
@@ -39,6 +44,10 @@ class UndoMessages:
     success_message = 'Task changed to not executed!'
 
 
+class TasksStatusMessages:
+    success_message = 'Tasks status changed!'
+
+
 class EraseMessages:
     success_message = 'Tasks deleted!'
 
@@ -68,4 +77,22 @@ class PasswordResetMessages:
                       " immediately. \n\nRegards, \ntodo team!"
     unidentified_error_message = """"There was a problem with resetting Your email address. Password was not reset.
                  Problem may be connected with email server. Try again in few minutes."""
-    no_user_error_message = "No user with given email address or address is wrong!"
\ No newline at end of file
+    no_user_error_message = "No user with given email address or address is wrong!"
+
+class TasksImportMessages:
+    success_message = "Imported {} tasks"
+    rejected_message = "Rejected {} rows (task is required, max 254 characters, date format: YYYY-MM-DDTHH:MM), " \
+                       "lines: {}"
+    incorrect_file_error_message = "Choose a .csv or .ndjson file"
+
+
+class SearchMessages:
+    no_words_error_message = "Enter at least one word to search for"
+
+
+class ApiMessages:
+    unauthorized_error_message = "Log in first"
+    incorrect_limit_error_message = "Invalid limit!"
+    incorrect_cursor_error_message = "Invalid cursor!"
+    incorrect_task_error_message = "Task is required, max 254 characters. Date format: YYYY-MM-DDTHH:MM"
+    no_task_error_message = "No such task"
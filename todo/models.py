@@ -2,16 +2,33 @@
 # todo/models.py
 import random
 import re
+from collections import Counter, OrderedDict, namedtuple
 from datetime import datetime, timedelta
+from itertools import groupby
 
+from flask import abort, current_app
 from flask_login import login_user
-from passlib.hash import argon2
+from flask_sqlalchemy import Pagination
+from sqlalchemy import and_, bindparam, case, exists, func, intersect, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
 
-from config import TASKS_PER_PAGE
 from todo import db
+from .cache import poll_results_cache, user_cache
+from .hashing import password_hasher
+from .pagination import cursor_paginate, iter_keyset, keyset_paginate
+from .purge import account_purger
+from .search import build_match_query, setup_search_index, task_search
+from .votes import vote_buffer
 
 random.seed()
 
+ImportResult = namedtuple('ImportResult', 'imported rejected rejected_lines')
+TaskCounters = namedtuple('TaskCounters', 'data_version tasks executed')
+CountersDrift = namedtuple('CountersDrift', 'user_id tasks executed actual_tasks actual_executed')
+TagCloudItem = namedtuple('TagCloudItem', 'name tasks weight')
+
 
 class User(db.Model):
     """User class"""
@@ -22,9 +39,17 @@ class User(db.Model):
     email = db.Column(db.String(100), unique=True, index=True)
     tasks = db.relationship('Task', backref='author', lazy='dynamic', cascade='all, delete')
     opinions = db.relationship('Opinion', backref='opinion_author', lazy='dynamic')
-    tasks_per_page = db.Column(db.Integer)
-    page = db.Column(db.Integer)
+    # nowe konto dostaje TASKS_PER_PAGE z konfiguracji (handle_registration), server_default jak w migracji 010
+    tasks_per_page = db.Column(db.Integer, server_default='9')
     last_login = db.Column(db.DateTime)
+    # zmieniana z zadaniami; nowy użytkownik zaczyna od losowej wartości, więc id po usuniętym koncie (SQLite może
+    # je użyć ponownie) nie trafi na strony i ETagi zapamiętane dla tamtego konta
+    data_version = db.Column(db.Integer, nullable=False, default=lambda: random.randint(0, 2 ** 30),
+                             server_default='0')
+    deleted_at = db.Column(db.DateTime, index=True)     # konto usunięte, zadania czekają na account_purger
+    # liczniki zadań zmieniane razem z zadaniami (Task.commit_changes), lista zadań nie liczy wierszy
+    tasks_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    executed_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     def __str__(self):
         return self.username
@@ -48,18 +73,139 @@ class User(db.Model):
         """always False, no anonymous users"""
         return False
 
-    def check_user_tasks_per_page(self):
-        """Check if user defined his own "tasks_per_page" value. Takes actual page, returns nothing"""
+    @classmethod
+    def get_by_id(cls, user_id):
+        """Returns user object given id or None. Reuses user already present in the session identity map, otherwise
+        builds it from column values kept in the per-process user cache, querying db only on cache miss."""
+
+        user_id = int(user_id)
+        user = db.session.identity_map.get(identity_key(cls, user_id))
+        if user is not None:
+            return user
+        values = user_cache.get(user_id)
+        if values is None:
+            user = cls.query.get(user_id)
+            if user is not None:
+                user_cache.set(user_id, user.get_cache_values())
+            return user
+        user = cls(**values)
+        make_transient_to_detached(user)  # obiekt traktowany jak wczytany z bazy, bez zapytania SELECT
+        db.session.add(user)
+        return user
+
+    def get_cache_values(self):
+        """Returns dict of column values used to rebuild the user from user_cache"""
+
+        return {column.key: getattr(self, column.key) for column in self.__table__.columns}
+
+    def save_changes(self):
+        """Commits changes of the user and drops its outdated copy from user_cache"""
+
+        user_id = self.id     # po commit atrybuty są wygasłe, odczyt id oznaczałby kolejne zapytanie
+        db.session.commit()
+        user_cache.invalidate(user_id)
+
+    @classmethod
+    def bump_data_version(cls, user_id, tasks=0, executed=0):
+        """Takes user id and changes of the numbers of user's tasks and executed tasks. Increments version of user's
+        data and changes the task counters with one UPDATE in the current transaction, without committing"""
 
-        if self.tasks_per_page is None:
-            self.tasks_per_page = TASKS_PER_PAGE
-            db.session.commit()
+        values = {cls.data_version: cls.data_version + 1}
+        if tasks:
+            values[cls.tasks_count] = cls.tasks_count + tasks
+        if executed:
+            values[cls.executed_count] = cls.executed_count + executed
+        cls.query.filter_by(id=user_id).update(values, synchronize_session=False)
+
+    @classmethod
+    def get_data_version(cls, user_id):
+        """Takes user id, returns current version of user's data read from db with a primary key lookup"""
+
+        return db.session.query(cls.data_version).filter_by(id=user_id).scalar()
+
+    @classmethod
+    def get_task_counters(cls, user_id):
+        """Takes user id, returns TaskCounters (data version, number of tasks, number of executed tasks) read from db
+        with a primary key lookup or None if there is no such user"""
 
-    def save_actual_page(self, page):
-        """Saves actual page to database, takes page, returns nothing"""
+        row = db.session.query(cls.data_version, cls.tasks_count, cls.executed_count).filter_by(id=user_id).first()
+        return TaskCounters(*row) if row else None
 
-        self.page = page
+    @classmethod
+    def get_task_counters_drift(cls):
+        """Counts tasks of all users with one GROUP BY and compares them with the stored counters. Returns list of
+        CountersDrift (user id, stored counters, counted values) of users whose counters are wrong"""
+
+        executed = func.sum(case([(Task.executed != 0, 1)], else_=0))
+        actual = {user_id: (tasks, executed_tasks or 0) for user_id, tasks, executed_tasks in
+                  db.session.query(Task.username_id, func.count(), executed).group_by(Task.username_id)}
+        drift = []
+        for user_id, tasks, executed_tasks in db.session.query(cls.id, cls.tasks_count, cls.executed_count):
+            actual_tasks, actual_executed = actual.get(user_id, (0, 0))
+            if (tasks, executed_tasks) != (actual_tasks, actual_executed):
+                drift.append(CountersDrift(user_id, tasks, executed_tasks, actual_tasks, actual_executed))
+        return drift
+
+    @classmethod
+    def repair_task_counters(cls, user_ids=None):
+        """Takes list of user ids (None - all users), sets their task counters to values counted by subqueries of
+        the same UPDATE statement, so tasks changed meanwhile are not missed. Returns number of repaired users"""
+
+        user, task = cls.__table__, Task.__table__
+        tasks = select([func.count()]).where(task.c.username_id == user.c.id).as_scalar()
+        executed = select([func.count()]).where(and_(task.c.username_id == user.c.id, task.c.executed != 0))\
+            .as_scalar()
+        statement = user.update().values(tasks_count=tasks, executed_count=executed,
+                                         data_version=user.c.data_version + 1)
+        if user_ids is not None:
+            if not user_ids:
+                return 0
+            statement = statement.where(user.c.id.in_(user_ids))
+        repaired = db.session.execute(statement).rowcount
+        db.session.commit()
+        user_cache.clear()
+        return repaired
+
+    @classmethod
+    def handle_account_deleting(cls, user_id, threshold=None):
+        """Takes user id and deletes the account. Accounts with up to threshold tasks are deleted at once
+        by delete_account_rows(). Bigger accounts are only marked deleted (nobody can log in to them any more) and
+        account_purger deletes their tasks in chunks. Returns True if the account was deleted at once, otherwise
+        False. Default threshold is ACCOUNT_PURGE_THRESHOLD of the application config."""
+
+        if threshold is None:
+            threshold = current_app.config['ACCOUNT_PURGE_THRESHOLD']
+        # liczenie kończy się po threshold + 1 zadaniach, niezależnie od wielkości konta
+        tasks = db.session.query(Task.id).filter_by(username_id=user_id).limit(threshold + 1)
+        if db.session.query(func.count()).select_from(tasks.subquery()).scalar() <= threshold:
+            cls.delete_account_rows(user_id)
+            return True
+        cls.query.filter_by(id=user_id).update({cls.deleted_at: datetime.utcnow()}, synchronize_session=False)
         db.session.commit()
+        user_cache.invalidate(user_id)
+        account_purger.wake()
+        return False
+
+    @classmethod
+    def delete_account_rows(cls, user_id):
+        """Takes user id, deletes the user with its tasks, tags, poll opinions and bug reports with one bulk DELETE per
+        table in a single transaction. Opinions are deleted with the account, author of an opinion can't be empty."""
+
+        user_tags = select([Tag.id]).where(Tag.username_id == user_id)
+        db.session.execute(task_tag.delete().where(task_tag.c.tag_id.in_(user_tags)))
+        Tag.query.filter_by(username_id=user_id).delete(synchronize_session=False)
+        Task.query.filter_by(username_id=user_id).delete(synchronize_session=False)
+        Opinion.query.filter_by(author=user_id).delete(synchronize_session=False)
+        ErrorOpinion.query.filter_by(author=user_id).delete(synchronize_session=False)
+        cls.query.filter_by(id=user_id).delete(synchronize_session=False)
+        db.session.commit()
+        user_cache.invalidate(user_id)
+
+    @classmethod
+    def get_deleted_ids(cls):
+        """Returns list of ids of users marked deleted, waiting for the purge"""
+
+        return [user_id for user_id, in db.session.query(cls.id).filter(cls.deleted_at.isnot(None))]
 
     @staticmethod
     def check_valid_email(email):
@@ -73,9 +219,10 @@ class User(db.Model):
 
     @staticmethod
     def hash_password(new_password):
-        """Hashes password using argon2. Takes password and returns hashed password"""
+        """Hashes password using argon2 with the configured cost profile. Takes password and returns hashed
+        password"""
 
-        password = argon2.using(rounds=4).hash(new_password)
+        password = password_hasher.hash(new_password)
         return password
 
     @staticmethod
@@ -90,28 +237,35 @@ class User(db.Model):
             return False
 
     @classmethod
-    def check_user_existence_by_email(cls, email):
-        """Takes email. Checks if exists user with given email and returns True. Otherwise returns False. """
-
-        user = cls.query.filter_by(email=email).first()
-        if user:
-            return True
-        else:
+    def check_user_existence(cls, username=None, email=None):
+        """Takes username and/or email. Checks with a single EXISTS query on the unique indexes if exists user with
+        given username or email and returns True. Otherwise returns False."""
+
+        conditions = []
+        if username is not None:
+            conditions.append(cls.username == username)
+        if email is not None:
+            conditions.append(cls.email == email)
+        if not conditions:
             return False
+        return db.session.query(exists().where(or_(*conditions))).scalar()
 
     @classmethod
-    def handle_registration(cls, username, password, confpass, email):
-        """Handle registration, takes username, password, confpass and email. Checks if password = confpass,
-        hashes password, creates user, saves it to db and returns True. Otherwise returns False."""
-
-        if password == confpass:
-            password = cls.hash_password(password)
-            user = cls(username=username, password=password, email=email)
-            db.session.add(user)
+    def handle_registration(cls, username, password, email):
+        """Handle registration, takes username, password and email. Hashes password, creates user, saves it to db
+        and returns True. Returns False if username or email is already taken, which is detected by unique
+        constraints of the user table, so there is no race between checking and inserting."""
+
+        password = cls.hash_password(password)
+        user = cls(username=username, password=password, email=email,
+                   tasks_per_page=current_app.config['TASKS_PER_PAGE'])
+        db.session.add(user)
+        try:
             db.session.commit()
-            return True
-        else:
+        except IntegrityError:
+            db.session.rollback()
             return False
+        return True
 
     @staticmethod
     def check_login_data_correctness(username, password):
@@ -124,25 +278,22 @@ class User(db.Model):
             return False
 
     @classmethod
-    def check_user_existence_by_username(cls, username):
-        """Takes username. Checks if exists user with given username and returns True. Otherwise returns False. """
-
-        user = cls.query.filter_by(username=username).first()
-        if user:
-            return True
-        else:
-            return False
-
-    @classmethod
-    def handle_login(cls, username, password, remember_me):
-        """Handle logging in, takes username, password and remember_me, checks if password is correct, logs user in,
-        sets last_login attribute in db and returns True. Otherwise returns False."""
-
-        user = cls.query.filter_by(username=username).first()
-        if argon2.verify(password, user.password):
-            login_user(user, remember=remember_me)
-            user.last_login = datetime.utcnow().replace(microsecond=0) + timedelta(hours=2)
-            db.session.commit()
+    def get_by_username(cls, username):
+        """Takes username. Returns user with given username or None, also if the account was deleted"""
+
+        return cls.query.filter_by(username=username, deleted_at=None).first()
+
+    def handle_login(self, password, remember_me):
+        """Handle logging in, takes password and remember_me, checks if password is correct, logs user in,
+        sets last_login attribute in db and returns True. Otherwise returns False. Password hash made with outdated
+        cost parameters is replaced by a new one."""
+
+        if password_hasher.verify(password, self.password):
+            login_user(self, remember=remember_me)
+            if password_hasher.needs_update(self.password):
+                self.password = User.hash_password(password)
+            self.last_login = datetime.utcnow().replace(microsecond=0) + timedelta(hours=2)
+            self.save_changes()
             return True
         else:
             return False
@@ -151,11 +302,9 @@ class User(db.Model):
         """Takes email and username. Checks if there is no such email addres in db, if there is no
          then changes email address of given user id db and returns True. Otherwise returns False."""
 
-        user_by_email = self.query.filter_by(email=email).first()
-        if not user_by_email:
-            user = User.query.filter_by(username=self.username).first()
-            user.email = email
-            db.session.commit()
+        if not User.check_user_existence(email=email):
+            self.email = email
+            self.save_changes()
             return True
         else:
             return False
@@ -165,15 +314,13 @@ class User(db.Model):
          if everything is ok then changes username of given user in db, logs user in again and returns True.
         Otherwise returns False."""
 
-        user_by_username = User.query.filter_by(username=new_username).first()
-        if not user_by_username and len(new_username) < 40:
-            user = User.query.filter_by(username=self.username).first()
-            tasks = Task.query.filter_by(username_id=self.id).all()
-            user.username = new_username
-            for i in tasks:
-                i.username = new_username
-            db.session.commit()
-            login_user(user)
+        if len(new_username) < 40 and not User.check_user_existence(username=new_username):
+            self.username = new_username
+            # zadania wskazują użytkownika przez id, zmienia się tylko wiersz user; wyrenderowane strony zadań
+            # (linki zawierają nazwę użytkownika) stają się nieaktualne przez zmianę wersji danych
+            self.data_version = User.data_version + 1
+            self.save_changes()
+            login_user(self)
             return True
         else:
             return False
@@ -184,10 +331,8 @@ class User(db.Model):
         Otherwise returns False."""
 
         if password == confpass and len(password) < 40:
-            password = User.hash_password(password)
-            user = User.query.filter_by(username=self.username).first()
-            user.password = password
-            db.session.commit()
+            self.password = User.hash_password(password)
+            self.save_changes()
             return True
         else:
             return False
@@ -198,9 +343,9 @@ class User(db.Model):
         Otherwise returns False."""
 
         if 100 > tasks_per_page > 0:
-            user = User.query.filter_by(username=self.username).first()
-            user.tasks_per_page = tasks_per_page
-            db.session.commit()
+            self.tasks_per_page = tasks_per_page
+            self.data_version = User.data_version + 1
+            self.save_changes()
             return True
         else:
             return False
@@ -209,7 +354,7 @@ class User(db.Model):
         """Takes new password and user object, hashes password using hash_password() method and saves it to db"""
         password_hashed = User.hash_password(password)
         self.password = password_hashed
-        db.session.commit()
+        self.save_changes()
 
     @staticmethod
     def password_generator():
@@ -227,9 +372,20 @@ class Task(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     task = db.Column(db.String(255), nullable=False)
     executed = db.Column(db.SmallInteger, nullable=False)
-    data_pub = db.Column(db.String(40))
+    data_pub = db.Column(db.DateTime)
     username_id = db.Column(db.Integer, db.ForeignKey("user.id"))  # user to nazwa tabeli
 
+    # lista zadań użytkownika czytana jest w kolejności indeksu, bez sortowania, także z filtrem statusu
+    __table_args__ = (db.Index('ix_task_username_id_data_pub_id', 'username_id', 'data_pub', 'id'),
+                      db.Index('ix_task_username_id_executed_data_pub_id', 'username_id', 'executed', 'data_pub', 'id'))
+
+    date_formats = ('%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d')
+    # opcje listy zadań, pierwsza wartość jest domyślna
+    list_statuses = ('all', 'open', 'executed')
+    list_orders = ('newest', 'oldest')
+    list_date_format = '%Y-%m-%d'
+    list_matches = ('all', 'any')
+
     def __str__(self):
         return self.task
 
@@ -244,26 +400,469 @@ class Task(db.Model):
             data_pub = ""
         return data_pub
 
+    @classmethod
+    def get_date(cls, date):
+        """Takes date in '2011-08-12T20:17' format (seconds optional), returns datetime or None if there was no
+        date given. Raises ValueError if date has incorrect format"""
+
+        data_pub = cls.get_string_date(date)
+        if not data_pub:
+            return None
+        for date_format in cls.date_formats:
+            try:
+                return datetime.strptime(data_pub, date_format)
+            except ValueError:
+                pass
+        raise ValueError("Incorrect date format: {}".format(date))
+
     @classmethod
     def handle_task_adding(cls, task_text, task_date, user_id):
-        """Handles task adding, takes task text and date, checks if length is correct, changes date format
-         using get_string_date() method, save task to db and returns True. Otherwise returns False."""
+        """Handles task adding, takes task text and date, checks if length is correct, changes date to datetime
+         using get_date() method, save task to db with #tags of its text and returns the new task. Otherwise returns
+         False. Raises ValueError if date has incorrect format."""
         if 255 > len(task_text) > 0:
-            data_pub = cls.get_string_date(task_date)
+            data_pub = cls.get_date(task_date)
             task = cls(task=task_text, executed=0, data_pub=data_pub, username_id=user_id)
             db.session.add(task)
-            db.session.commit()
-            return True
+            db.session.flush()
+            Tag.handle_tasks_tagging(user_id, [(task.id, task_text)])
+            cls.commit_changes(user_id, tasks=1)
+            return task
         else:
             return False
 
     @classmethod
-    def get_all_tasks_by_username(cls, current_user, page):
-        """Returns all tasks of given user with correct pagination"""
-        tasks = cls.query.filter_by(username_id=current_user.id).order_by(
-            Task.data_pub.desc()).paginate(page, current_user.tasks_per_page, True)
+    def handle_tasks_import(cls, rows, user_id, batch_size=None):
+        """Takes iterable of (line number, task text, date, executed 0/1 or None if incorrect) and user id. Checks rows
+        like handle_task_adding() and inserts correct ones with executemany INSERT, batch_size tasks per transaction.
+        Returns ImportResult(number of imported tasks, number of rejected rows, first rejected line numbers).
+        Default batch_size is TASKS_IMPORT_BATCH_SIZE of the application config"""
+
+        batch_size = batch_size or current_app.config['TASKS_IMPORT_BATCH_SIZE']
+        max_rejected_lines = current_app.config['TASKS_IMPORT_REJECTED_LINES']
+        imported, rejected, rejected_lines, batch = 0, 0, [], []
+        for line_number, task_text, task_date, executed in rows:
+            try:
+                if not isinstance(task_text, str) or not 255 > len(task_text) > 0 or executed is None:
+                    raise ValueError("Incorrect task")
+                if not isinstance(task_date, str):
+                    raise ValueError("Incorrect date format")
+                data_pub = cls.get_date(task_date)
+            except ValueError:
+                rejected += 1
+                if len(rejected_lines) < max_rejected_lines:
+                    rejected_lines.append(line_number)
+                continue
+            batch.append({'task': task_text, 'executed': executed, 'data_pub': data_pub, 'username_id': user_id})
+            if len(batch) >= batch_size:
+                imported += cls.insert_tasks(batch, user_id)
+                batch = []
+        if batch:
+            imported += cls.insert_tasks(batch, user_id)
+        return ImportResult(imported, rejected, rejected_lines)
+
+    @classmethod
+    def insert_tasks(cls, values, user_id):
+        """Takes list of dicts with column values of user's tasks, inserts them in their order, tasks without #tags
+        with executemany INSERT, tags the others and commits. Returns number of inserted tasks"""
+
+        # executemany nie zwraca id, zadania z tagami wstawiane są pojedynczo, żeby otagować tylko wiersze tej partii
+        tagged = []
+        for has_tags, group in groupby(values, key=lambda value: '#' in value['task']):
+            if not has_tags:
+                db.session.execute(cls.__table__.insert(), list(group))
+                continue
+            for value in group:
+                task_id = db.session.execute(cls.__table__.insert(), value).inserted_primary_key[0]
+                tagged.append((task_id, value['task']))
+        Tag.handle_tasks_tagging(user_id, tagged)
+        cls.commit_changes(user_id, tasks=len(values), executed=sum(1 for value in values if value['executed']))
+        return len(values)
+
+    @classmethod
+    def handle_task_editing(cls, task_id, user_id, task_text=None, task_date=None, executed=None):
+        """Takes task id, user id and new values (None - value is not changed, empty task_date removes the date).
+        Checks them like handle_task_adding() and saves them with a single UPDATE statement. Returns number of
+        changed tasks (0 if the user has no such task) or False if values are incorrect."""
+
+        values = {}
+        if task_text is not None:
+            if not 255 > len(task_text) > 0:
+                return False
+            values[cls.task] = task_text
+        if task_date is not None:
+            try:
+                values[cls.data_pub] = cls.get_date(task_date)
+            except ValueError:
+                return False
+        if not values and executed is None:
+            return False
+        query = cls.query.filter_by(id=task_id, username_id=user_id)
+        flipped = 0
+        if executed is not None:
+            values[cls.executed] = 1 if executed else 0
+            # warunek na poprzedni status: liczba zmienionych wierszy mówi, czy zmienić licznik wykonanych zadań
+            flipped = query.filter(cls.executed != values[cls.executed]).update(values, synchronize_session=False)
+        changed = flipped or query.update(values, synchronize_session=False)
+        if changed and task_text is not None:
+            Tag.handle_task_retagging(user_id, task_id, task_text)
+        cls.commit_changes(user_id, changed, executed=flipped if executed else -flipped)
+        return changed
+
+    @classmethod
+    def handle_tasks_deleting(cls, task_ids, user_id):
+        """Takes list of task ids and user id. Deletes all given tasks owned by the user in one transaction, executed
+        and not executed ones with separate DELETE statements whose row counts change the task counters. Tags of
+        the tasks are unlinked first. Ids which are not numbers are skipped. Returns number of deleted tasks."""
+
+        ids = cls.get_valid_ids(task_ids)
+        if not ids:
+            return 0
+        Tag.handle_tasks_untagging(user_id, ids)
+        query = cls.query.filter(cls.id.in_(ids), cls.username_id == user_id)
+        deleted_executed = query.filter(cls.executed != 0).delete(synchronize_session=False)
+        deleted = deleted_executed + query.filter(cls.executed == 0).delete(synchronize_session=False)
+        cls.commit_changes(user_id, deleted, tasks=-deleted, executed=-deleted_executed)
+        return deleted
+
+    @classmethod
+    def handle_tasks_status_change(cls, task_ids, user_id, executed):
+        """Takes list of task ids, user id and new status (True - executed, False - not executed). Changes status
+        of all given tasks owned by the user with a single UPDATE statement, without loading them. Tasks which
+        already have the status are not updated. Returns number of changed tasks."""
+
+        ids = cls.get_valid_ids(task_ids)
+        if not ids:
+            return 0
+        value = 1 if executed else 0
+        changed = cls.query.filter(cls.id.in_(ids), cls.username_id == user_id, cls.executed != value).update(
+            {cls.executed: value}, synchronize_session=False)
+        cls.commit_changes(user_id, changed, executed=changed if executed else -changed)
+        return changed
+
+    @staticmethod
+    def commit_changes(user_id, changed=True, tasks=0, executed=0):
+        """Commits changes of user's tasks. If anything changed, bumps user's data version and changes user's task
+        counters by tasks and executed in the same transaction, then drops the cached user"""
+
+        if changed:
+            User.bump_data_version(user_id, tasks, executed)
+        db.session.commit()
+        if changed:
+            user_cache.invalidate(user_id)
+
+    @classmethod
+    def delete_tasks_chunk(cls, user_id, chunk_size):
+        """Takes user id and number of tasks, deletes up to chunk_size user's tasks in one short transaction.
+        Returns number of tasks selected for deleting (less than chunk_size if there are no more tasks)"""
+
+        ids = [task_id for task_id, in db.session.query(cls.id).filter_by(username_id=user_id).limit(chunk_size)]
+        if ids:
+            # tagi użytkownika usuwa delete_account_rows(), tu tylko powiązania z usuwanymi zadaniami
+            db.session.execute(task_tag.delete().where(task_tag.c.task_id.in_(ids)))
+            cls.query.filter(cls.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        return len(ids)
+
+    @staticmethod
+    def get_valid_ids(task_ids):
+        """Takes list of task ids (i.e. strings from a form), returns set of those which are integers"""
+
+        ids = set()
+        for task_id in task_ids:
+            try:
+                ids.add(int(task_id))
+            except (TypeError, ValueError):
+                pass
+        return ids
+
+    @classmethod
+    def get_list_options(cls, args):
+        """Takes dict of request arguments: status ('all', 'open', 'executed'), from and to (dates 'YYYY-MM-DD',
+        both inclusive), order ('newest', 'oldest'), tags (names separated by spaces or commas, '#' optional) and
+        match ('all' - tasks with all the tags, 'any' - tasks with any of them). Returns dict of the given options
+        which are correct and differ from defaults, incorrect values are skipped. Tags are lowercase, sorted and
+        joined with commas"""
+
+        options = {}
+        if args.get('status') in cls.list_statuses[1:]:
+            options['status'] = args['status']
+        for name in ('from', 'to'):
+            try:
+                datetime.strptime(args.get(name, ''), cls.list_date_format)
+            except ValueError:
+                continue
+            options[name] = args[name]
+        if args.get('order') in cls.list_orders[1:]:
+            options['order'] = args['order']
+        tags = sorted(Tag.parse_tag_names(args.get('tags', '')))[:current_app.config['TASK_LIST_MAX_TAGS']]
+        if tags:
+            options['tags'] = ','.join(tags)
+            if args.get('match') in cls.list_matches[1:]:
+                options['match'] = args['match']
+        return options
+
+    @classmethod
+    def get_list_criteria(cls, user_id, options):
+        """Takes user id and options returned by get_list_options(), returns list of filter criteria of the tasks.
+        Status and user are compared for equality and date range is the next column of the same index, so
+        the list is still read in the order of ix_task_username_id_executed_data_pub_id or
+        ix_task_username_id_data_pub_id. Tags are checked by looking the task ids up in the result of
+        Tag.get_tagged_tasks()"""
+
+        criteria = [cls.username_id == user_id]
+        if 'status' in options:
+            criteria.append(cls.executed == (1 if options['status'] == 'executed' else 0))
+        if 'from' in options:
+            criteria.append(cls.data_pub >= datetime.strptime(options['from'], cls.list_date_format))
+        if 'to' in options:
+            criteria.append(cls.data_pub < datetime.strptime(options['to'], cls.list_date_format) + timedelta(days=1))
+        if 'tags' in options:
+            criteria.append(cls.id.in_(Tag.get_tagged_tasks(user_id, options['tags'].split(','),
+                                                            options.get('match') == 'any')))
+        return criteria
+
+    @classmethod
+    def get_all_tasks_by_username(cls, current_user, page, cursor=None, counters=None, options=None):
+        """Returns tasks of given user with correct pagination. Takes optional cursor token given by previous page,
+        which lets the page be fetched by seeking on (data_pub, id) instead of OFFSET, TaskCounters of the user
+        (by default counters of current_user) and list options returned by get_list_options(). Number of tasks
+        is taken from the counters of the user or of a single tag, tasks are counted (in the indexes) only for
+        a date range or more tags"""
+
+        options = options or {}
+        if counters is None:
+            counters = TaskCounters(current_user.data_version, current_user.tasks_count, current_user.executed_count)
+        criteria = cls.get_list_criteria(current_user.id, options)
+        dated = 'from' in options or 'to' in options    # zakres dat pomija zadania bez daty
+        if options.keys() - {'order', 'match'} == {'tags'}:
+            total = Tag.count_tagged_tasks(current_user.id, options['tags'].split(','), options.get('match') == 'any')
+        elif dated or 'tags' in options:
+            total = db.session.query(func.count(cls.id)).filter(*criteria).scalar()
+        elif options.get('status') == 'open':
+            total = counters.tasks - counters.executed
+        elif options.get('status') == 'executed':
+            total = counters.executed
+        else:
+            total = counters.tasks
+        tasks = keyset_paginate(cls.query.filter(*criteria), cls.data_pub, cls.id, page, current_user.tasks_per_page,
+                                total, cursor, ascending=options.get('order') == 'oldest', nullable=not dated)
         return tasks
 
+    @classmethod
+    def get_tasks_after(cls, current_user, limit, cursor=None):
+        """Takes user, number of tasks and optional cursor returned with the previous call. Returns (tasks,
+        next cursor or None if there are no more tasks) in the task list order. Returns None if cursor is invalid"""
+
+        query = cls.query.filter_by(username_id=current_user.id)
+        return cursor_paginate(query, cls.data_pub, cls.id, limit, cursor)
+
+    @classmethod
+    def iter_tasks(cls, user_id, chunk_size=None):
+        """Takes user id, yields (task, date, executed) of all user's tasks in the task list order. Tasks are read
+        chunk_size at a time with keyset pagination, so memory use does not depend on the number of tasks.
+        Default chunk_size is TASKS_EXPORT_CHUNK_SIZE of the application config"""
+
+        chunk_size = chunk_size or current_app.config['TASKS_EXPORT_CHUNK_SIZE']
+        query = db.session.query(cls.id, cls.task, cls.data_pub, cls.executed).filter(cls.username_id == user_id)
+        for row in iter_keyset(query, cls.data_pub, cls.id, chunk_size):
+            yield row.task, row.data_pub, row.executed
+
+    def get_api_values(self):
+        """Returns dict of task values served by the JSON API"""
+
+        return {'id': self.id, 'task': self.task, 'executed': bool(self.executed),
+                'date': self.data_pub.strftime('%Y-%m-%dT%H:%M') if self.data_pub else None}
+
+    @classmethod
+    def search_tasks(cls, current_user, text, page):
+        """Takes user, searched text and page number. Returns page of user's tasks containing all words of the text,
+        best matches first (bm25 rank of the FTS5 index). Returns None if the text contains no words"""
+
+        match_query = build_match_query(text)
+        if match_query is None:
+            return None
+        query = cls.query.filter(cls.username_id == current_user.id)
+        if db.engine.dialect.name != 'sqlite':
+            for word in re.findall(r'\w+', text, re.UNICODE):
+                query = query.filter(cls.task.contains(word))
+            return query.order_by(cls.data_pub.desc(), cls.id.desc()).paginate(page, current_user.tasks_per_page)
+
+        matches = task_search.c.task_search.op('MATCH')(match_query)
+        # liczba wyników przez IN (podzapytanie wykonywane raz), złączenie bez statystyk ANALYZE planer potrafi
+        # wykonać jako osobne przeszukanie indeksu FTS dla każdego zadania użytkownika
+        total = query.filter(cls.id.in_(select([task_search.c.rowid]).where(matches))).order_by(None).count()
+        per_page = current_user.tasks_per_page
+        if page < 1 or (page > 1 and (page - 1) * per_page >= total):
+            abort(404)
+        items = query.join(task_search, task_search.c.rowid == cls.id).filter(matches)\
+            .order_by(task_search.c.rank, cls.id.desc()).limit(per_page).offset((page - 1) * per_page).all()
+        return Pagination(query, page, per_page, total, items)
+
+
+setup_search_index(Task.__table__)      # indeks FTS5 tworzony i usuwany razem z tabelą task
+
+
+# powiązania zadań z tagami, indeksy w obu kierunkach: tagi zadania (klucz główny) i zadania z tagiem
+task_tag = db.Table(
+    'task_tag',
+    db.Column('task_id', db.Integer, db.ForeignKey('task.id'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True),
+    db.Index('ix_task_tag_tag_id_task_id', 'tag_id', 'task_id'),
+)
+
+
+class Tag(db.Model):
+    """Tag of user's tasks, written as #tag in the task text"""
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    name = db.Column(db.String(40), nullable=False)
+    username_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    # liczba zadań z tagiem zmieniana razem z powiązaniami, chmura tagów nie liczy wierszy
+    tasks_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    __table_args__ = (db.Index('ix_tag_username_id_name', 'username_id', 'name', unique=True),)
+
+    # tag w tekście zadania: '#' i do 40 liter, cyfr, '_' lub '-' (zaczyna się od litery, cyfry lub '_')
+    text_pattern = re.compile(r'(?<![\w#])#(\w[\w-]{0,39})(?![\w-])', re.UNICODE)
+    # nazwy tagów w filtrze listy zadań, '#' opcjonalny
+    names_pattern = re.compile(r'(?<![\w-])#?(\w[\w-]{0,39})(?![\w-])', re.UNICODE)
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def parse_tags(cls, text):
+        """Takes task text, returns set of lowercase names of #tags in it"""
+
+        return {name.lower() for name in cls.text_pattern.findall(text)}
+
+    @classmethod
+    def parse_tag_names(cls, text):
+        """Takes tag names separated by spaces or commas, with or without '#'. Returns set of lowercase names"""
+
+        return {name.lower() for name in cls.names_pattern.findall(text)}
+
+    @classmethod
+    def handle_tasks_tagging(cls, user_id, tasks):
+        """Takes user id and iterable of (task id, task text) of new user's tasks. Links the tasks with #tags of
+        their texts. Does not commit, tags are saved together with the tasks"""
+
+        cls.link_tasks(user_id, [(task_id, name) for task_id, text in tasks for name in cls.parse_tags(text)])
+
+    @classmethod
+    def handle_task_retagging(cls, user_id, task_id, text):
+        """Takes user id, id of user's task and its new text. Links the task with #tags of the text which it does
+        not have yet and unlinks it from tags which are not in the text any more. Does not commit"""
+
+        old_names = {name for name, in db.session.query(cls.name).join(task_tag, task_tag.c.tag_id == cls.id)
+                     .filter(task_tag.c.task_id == task_id, cls.username_id == user_id)}
+        new_names = cls.parse_tags(text)
+        if old_names - new_names:
+            cls.handle_tasks_untagging(user_id, [task_id], old_names - new_names)
+        cls.link_tasks(user_id, [(task_id, name) for name in new_names - old_names])
+
+    @classmethod
+    def handle_tasks_untagging(cls, user_id, task_ids, names=None):
+        """Takes user id, ids of tasks and optionally names of tags (None - all tags). Unlinks user's tasks from
+        the tags and subtracts numbers of unlinked tasks from the tag counters, tags left without tasks are
+        deleted. Does not commit"""
+
+        query = db.session.query(task_tag.c.tag_id, func.count()).join(cls, cls.id == task_tag.c.tag_id)\
+            .filter(cls.username_id == user_id, task_tag.c.task_id.in_(task_ids))
+        if names is not None:
+            query = query.filter(cls.name.in_(names))
+        counts = dict(query.group_by(task_tag.c.tag_id))
+        if not counts:
+            return
+        db.session.execute(task_tag.delete().where(and_(task_tag.c.task_id.in_(task_ids),
+                                                        task_tag.c.tag_id.in_(counts))))
+        cls.change_counts({tag_id: -count for tag_id, count in counts.items()})
+        cls.query.filter(cls.id.in_(counts), cls.tasks_count <= 0).delete(synchronize_session=False)
+
+    @classmethod
+    def link_tasks(cls, user_id, links):
+        """Takes user id and list of (task id, tag name). Creates missing user's tags, inserts the links with one
+        executemany INSERT and adds numbers of linked tasks to the tag counters. Does not commit"""
+
+        if not links:
+            return
+        tag_ids = cls.get_tag_ids(user_id, {name for task_id, name in links})
+        db.session.execute(task_tag.insert(), [{'task_id': task_id, 'tag_id': tag_ids[name]}
+                                               for task_id, name in links])
+        cls.change_counts(Counter(tag_ids[name] for task_id, name in links))
+
+    @classmethod
+    def get_tag_ids(cls, user_id, names):
+        """Takes user id and set of tag names, creates user's tags which do not exist yet. Returns dict
+        {name: tag id}"""
+
+        query = db.session.query(cls.name, cls.id).filter(cls.username_id == user_id)
+        tag_ids = dict(query.filter(cls.name.in_(names)))
+        missing = names - tag_ids.keys()
+        if missing:
+            db.session.execute(cls.__table__.insert(), [{'name': name, 'username_id': user_id, 'tasks_count': 0}
+                                                        for name in missing])
+            tag_ids.update(query.filter(cls.name.in_(missing)))
+        return tag_ids
+
+    @classmethod
+    def change_counts(cls, counts):
+        """Takes dict {tag id: change of the number of tasks}, changes the tag counters with a single executemany
+        UPDATE statement (tasks_count = tasks_count + n, no read-modify-write)"""
+
+        table = cls.__table__
+        db.session.execute(table.update().where(table.c.id == bindparam('tag_id'))
+                           .values(tasks_count=table.c.tasks_count + bindparam('count')),
+                           [dict(tag_id=tag_id, count=count) for tag_id, count in counts.items()])
+
+    @classmethod
+    def count_tagged_tasks(cls, user_id, names, any_tag=False):
+        """Takes arguments of get_tagged_tasks(), returns number of user's tasks with the tags. Number of tasks with
+        a single tag is taken from its counter, more tags are counted in task_tag indexes only"""
+
+        if len(names) == 1:
+            count = db.session.query(cls.tasks_count).filter_by(username_id=user_id, name=names[0]).scalar()
+            return count or 0
+        return db.session.query(func.count()).select_from(cls.get_tagged_tasks(user_id, names, any_tag).alias())\
+            .scalar()
+
+    @classmethod
+    def get_tagged_tasks(cls, user_id, names, any_tag=False):
+        """Takes user id, list of tag names and any_tag (False - tasks with all the tags, True - tasks with any of
+        them). Returns select of ids of user's tasks with the tags. Every tag is found by ix_tag_username_id_name,
+        its tasks by ix_task_tag_tag_id_task_id, tasks with all the tags by INTERSECT of these index searches"""
+
+        def tagged(*criteria):
+            return select([task_tag.c.task_id]).select_from(task_tag.join(cls, cls.id == task_tag.c.tag_id))\
+                .where(and_(cls.username_id == user_id, *criteria))
+
+        if any_tag or len(names) == 1:
+            return tagged(cls.name.in_(names)).distinct()
+        return intersect(*[tagged(cls.name == name) for name in names])
+
+    @classmethod
+    def get_tag_cloud(cls, user_id, size=None):
+        """Takes user id, returns list of TagCloudItem (name, tasks, weight 1-5) of up to size user's tags used
+        most often, ordered by name. Numbers of tasks are taken from the tag counters.
+        Default size is TAG_CLOUD_SIZE of the application config"""
+
+        size = size or current_app.config['TAG_CLOUD_SIZE']
+        tags = db.session.query(cls.name, cls.tasks_count).filter(cls.username_id == user_id, cls.tasks_count > 0)\
+            .order_by(cls.tasks_count.desc(), cls.name).limit(size).all()
+        if not tags:
+            return []
+        most, least = tags[0].tasks_count, tags[-1].tasks_count
+        return [TagCloudItem(name, tasks, 1 + (4 * (tasks - least) // (most - least) if most > least else 0))
+                for name, tasks in sorted(tags)]
+
+
+# wyniki ankiety trzymane w cache, niezależne od sesji SQLAlchemy
+PollQuestion = namedtuple('PollQuestion', 'id question_text choices')
+PollChoice = namedtuple('PollChoice', 'id choice_text votes')
+POLL_RESULTS_KEY = 'poll'
+CHOICE_IDS_KEY = 'choice_ids'
+
 
 class Question(db.Model):
     """Poll Question class"""
@@ -276,6 +875,26 @@ class Question(db.Model):
     def __str__(self):
         return self.question_text
 
+    @classmethod
+    def get_poll_results(cls):
+        """Returns tuple of PollQuestion (id, question_text, choices) ordered by id, choices are tuples of
+        PollChoice (id, choice_text, votes). Everything is loaded with one joined query and cached until
+        the next vote"""
+
+        results = poll_results_cache.get(POLL_RESULTS_KEY)
+        if results is None:
+            rows = db.session.query(cls.id, cls.question_text, Choice.id, Choice.choice_text, Choice.votes)\
+                .outerjoin(Choice, Choice.question == cls.id).order_by(cls.id, Choice.id).all()
+            questions = OrderedDict()
+            for question_id, question_text, choice_id, choice_text, votes in rows:
+                choices = questions.setdefault((question_id, question_text), [])
+                if choice_id is not None:
+                    choices.append(PollChoice(choice_id, choice_text, votes or 0))
+            results = tuple(PollQuestion(question_id, question_text, tuple(choices))
+                            for (question_id, question_text), choices in questions.items())
+            poll_results_cache.set(POLL_RESULTS_KEY, results)
+        return results
+
 
 class Choice(db.Model):
     """Poll question choices class"""
@@ -290,18 +909,42 @@ class Choice(db.Model):
 
     @classmethod
     def handle_selected_choices(cls, selected_choice1, selected_choice3):
-        """takes two choices, checks if are not None, saves them to db and returns True.
-        If at least one of them is None then returns False"""
-
-        if selected_choice1 and selected_choice3:
-            choice1 = cls.query.filter_by(id=selected_choice1).first()
-            choice1.votes += 1
-            choice3 = cls.query.filter_by(id=selected_choice3).first()
-            choice3.votes += 1
-            db.session.commit()
-            return True
-        else:
+        """takes two choices, checks if are not None and exist, saves votes to db (or to the vote buffer if
+        POLL_VOTE_BUFFER is on) and returns True. Otherwise returns False"""
+
+        try:
+            choice_ids = [int(selected_choice1), int(selected_choice3)]
+        except (TypeError, ValueError):
             return False
+        if not cls.get_valid_ids().issuperset(choice_ids):
+            return False
+        if vote_buffer.enabled:
+            vote_buffer.add(choice_ids)
+        else:
+            cls.add_votes(Counter(choice_ids))
+        return True
+
+    @classmethod
+    def get_valid_ids(cls):
+        """Returns frozenset of ids of all choices. Cached, votes do not invalidate it"""
+
+        choice_ids = poll_results_cache.get(CHOICE_IDS_KEY)
+        if choice_ids is None:
+            choice_ids = frozenset(choice_id for (choice_id,) in db.session.query(cls.id))
+            poll_results_cache.set(CHOICE_IDS_KEY, choice_ids)
+        return choice_ids
+
+    @classmethod
+    def add_votes(cls, counts):
+        """Takes dict {choice id: number of votes}, adds votes with a single atomic UPDATE statement
+        (votes = votes + n, no read-modify-write) and commits"""
+
+        table = cls.__table__
+        db.session.execute(table.update().where(table.c.id == bindparam('choice_id'))
+                           .values(votes=func.coalesce(table.c.votes, 0) + bindparam('count')),
+                           [dict(choice_id=choice_id, count=count) for choice_id, count in counts.items()])
+        db.session.commit()
+        poll_results_cache.invalidate(POLL_RESULTS_KEY)
 
 
 class Opinion(db.Model):
@@ -352,3 +995,66 @@ class ErrorOpinion(db.Model):
             return True
         else:
             return False
+
+
+class OutboxMail(db.Model):
+    """Outgoing email waiting in the outbox for the mail dispatcher"""
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    recipient = db.Column(db.String(100), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    created = db.Column(db.DateTime, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_attempt = db.Column(db.DateTime, index=True)  # None - wysyłka zakończona niepowodzeniem
+    last_error = db.Column(db.String(255))
+
+    def __str__(self):
+        return self.subject
+
+    @classmethod
+    def enqueue(cls, recipient, subject, body):
+        """Takes recipient address, subject and body, adds email to the outbox. Email is saved with the next
+        commit of the session, together with the rest of the changes it describes"""
+
+        now = datetime.utcnow()
+        mail = cls(recipient=recipient, subject=subject, body=body, created=now, attempts=0, next_attempt=now)
+        db.session.add(mail)
+        return mail
+
+    @classmethod
+    def claim_due(cls, batch_size, lease):
+        """Takes batch size and lease time (timedelta). Returns list of dicts (id, recipient, subject, body, attempts)
+        of emails waiting for sending. Every returned email has its next attempt moved by lease, so other
+        dispatchers skip it while it is being sent"""
+
+        now = datetime.utcnow()
+        due = cls.query.filter(cls.next_attempt <= now).order_by(cls.next_attempt).limit(batch_size).all()
+        claimed = []
+        for mail in due:
+            if cls.query.filter_by(id=mail.id, next_attempt=mail.next_attempt).update(
+                    {cls.next_attempt: now + lease}, synchronize_session=False):
+                claimed.append(dict(id=mail.id, recipient=mail.recipient, subject=mail.subject, body=mail.body,
+                                    attempts=mail.attempts))
+        db.session.commit()
+        return claimed
+
+    @classmethod
+    def mark_sent(cls, mail_id):
+        """Takes id of sent email and removes it from the outbox (body may contain a password)"""
+
+        cls.query.filter_by(id=mail_id).delete(synchronize_session=False)
+
+    @classmethod
+    def mark_failed(cls, mail_id, attempts, error, max_attempts, retry_delay):
+        """Takes id of email, number of its previous attempts, error, maximal number of attempts and base retry
+        delay (timedelta). Schedules next attempt with exponential backoff or gives up after max_attempts. Body of
+        an email given up is cleared (it may contain a password), the row is kept with its last error"""
+
+        attempts += 1
+        values = {cls.attempts: attempts, cls.last_error: str(error)[:255]}
+        if attempts >= max_attempts:
+            values.update({cls.next_attempt: None, cls.body: ''})
+        else:
+            values[cls.next_attempt] = datetime.utcnow() + retry_delay * 2 ** (attempts - 1)
+        cls.query.filter_by(id=mail_id).update(values, synchronize_session=False)
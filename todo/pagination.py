@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+# todo/pagination.py
+from datetime import datetime
+from math import ceil
+
+from flask import abort, current_app
+from itsdangerous import URLSafeSerializer, BadSignature
+from sqlalchemy import or_
+
+CURSOR_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+class KeysetPagination(object):
+    """Pager compatible with flask_sqlalchemy Pagination (items, page, pages, has_prev, has_next, prev_num,
+    next_num, iter_pages), additionally exposing opaque prev_cursor/next_cursor tokens for seek navigation"""
+
+    def __init__(self, page, per_page, total, items, has_next, prev_cursor=None, next_cursor=None):
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.items = items
+        self._has_next = has_next
+        self.prev_cursor = prev_cursor
+        self.next_cursor = next_cursor
+
+    @property
+    def pages(self):
+        """The total number of pages, at least the current one"""
+
+        if self.per_page == 0:
+            return 0
+        return max(int(ceil(self.total / float(self.per_page))), self.page if self.items else 0)
+
+    @property
+    def has_prev(self):
+        """True if a previous page exists"""
+
+        return self.page > 1
+
+    @property
+    def prev_num(self):
+        """Number of the previous page"""
+
+        if not self.has_prev:
+            return None
+        return self.page - 1
+
+    @property
+    def has_next(self):
+        """True if a next page exists"""
+
+        return self._has_next
+
+    @property
+    def next_num(self):
+        """Number of the next page"""
+
+        if not self.has_next:
+            return None
+        return self.page + 1
+
+    def iter_pages(self, left_edge=2, left_current=2, right_current=5, right_edge=2):
+        """Iterates over the page numbers in the pagination, skipped page numbers are represented as None"""
+
+        last = 0
+        for num in range(1, self.pages + 1):
+            if num <= left_edge or (self.page - left_current - 1 < num < self.page + right_current) or \
+                    num > self.pages - right_edge:
+                if last + 1 != num:
+                    yield None
+                yield num
+                last = num
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='keyset-cursor')
+
+
+def encode_cursor(page, key, direction):
+    """Takes page number, (sort value, id) key of a boundary row and direction ('next' or 'prev').
+    Returns opaque, signed cursor token"""
+
+    value = key[0]
+    if isinstance(value, datetime):
+        value = {'dt': value.strftime(CURSOR_DATE_FORMAT)}
+    return _serializer().dumps([page, value, key[1], direction])
+
+
+def decode_cursor(token):
+    """Takes cursor token. Returns (page, (sort value, id), direction) or None if token is invalid"""
+
+    try:
+        page, value, row_id, direction = _serializer().loads(token)
+        if isinstance(value, dict):
+            value = datetime.strptime(value['dt'], CURSOR_DATE_FORMAT)
+    except (BadSignature, TypeError, ValueError, KeyError):
+        return None
+    if direction not in ('next', 'prev'):
+        return None
+    return page, (value, row_id), direction
+
+
+def _row_key(row, column, id_column):
+    return getattr(row, column.key), getattr(row, id_column.key)
+
+
+def _seek_older(query, column, id_column, key, limit, nullable=True):
+    """Returns up to limit rows following key in (column desc, id desc) order. NULLs of column are sorted last
+    and read by a separate query, so that both parts stay index range scans. The query of NULLs is skipped
+    if nullable is False"""
+
+    value, row_id = key
+    rows = []
+    if value is not None:
+        rows = query.filter(column <= value, or_(column < value, id_column < row_id)).order_by(
+            column.desc(), id_column.desc()).limit(limit).all()
+    if len(rows) < limit and nullable:
+        nulls = query.filter(column.is_(None))
+        if value is None:
+            nulls = nulls.filter(id_column < row_id)
+        rows += nulls.order_by(id_column.desc()).limit(limit - len(rows)).all()
+    return rows
+
+
+def _seek_newer(query, column, id_column, key, limit, nullable=True):
+    """Returns up to limit rows preceding key in (column desc, id desc) order, nearest row first. nullable is
+    accepted for symmetry with _seek_older, a key with NULL value can be given only if NULLs are not filtered out"""
+
+    value, row_id = key
+    if value is not None:
+        return query.filter(column >= value, or_(column > value, id_column > row_id)).order_by(
+            column.asc(), id_column.asc()).limit(limit).all()
+    rows = query.filter(column.is_(None), id_column > row_id).order_by(id_column.asc()).limit(limit).all()
+    if len(rows) < limit:
+        rows += query.filter(column.isnot(None)).order_by(column.asc(), id_column.asc()).limit(
+            limit - len(rows)).all()
+    return rows
+
+
+def keyset_paginate(query, column, id_column, page, per_page, total, cursor=None, error_out=True, ascending=False,
+                    nullable=True):
+    """Paginates query ordered by (column desc, id_column desc), or by (column asc, id_column asc) with NULLs first
+    if ascending is True. Seeks from the boundary row encoded in cursor when it points at the requested page,
+    otherwise falls back to OFFSET. total is the (cached) number of rows. nullable=False tells that query filters
+    out NULLs of column, so they are not looked for by a separate query.
+    Returns KeysetPagination object, aborts with 404 for page below 1 and an empty page other than the first one."""
+
+    # kolejność rosnąca jest dokładnie odwrotna do malejącej, więc następna strona to wiersze "nowsze"
+    seek_next, seek_prev = (_seek_newer, _seek_older) if ascending else (_seek_older, _seek_newer)
+    if error_out and page < 1:
+        abort(404)
+    position = decode_cursor(cursor) if cursor else None
+    if position and position[0] == page:
+        key, direction = position[1], position[2]
+        if direction == 'next':
+            rows = seek_next(query, column, id_column, key, per_page + 1, nullable)
+            has_next = len(rows) > per_page
+            items = rows[:per_page]
+        else:
+            items = seek_prev(query, column, id_column, key, per_page, nullable)[::-1]
+            has_next = True
+    else:
+        order = (column.asc(), id_column.asc()) if ascending else (column.desc(), id_column.desc())
+        rows = query.order_by(*order).offset((page - 1) * per_page).limit(per_page + 1).all()
+        has_next = len(rows) > per_page
+        items = rows[:per_page]
+
+    if error_out and not items and page != 1:
+        abort(404)
+
+    prev_cursor = next_cursor = None
+    if items:
+        if page > 1:
+            prev_cursor = encode_cursor(page - 1, _row_key(items[0], column, id_column), 'prev')
+        if has_next:
+            next_cursor = encode_cursor(page + 1, _row_key(items[-1], column, id_column), 'next')
+    return KeysetPagination(page, per_page, total, items, has_next, prev_cursor, next_cursor)
+
+
+def cursor_paginate(query, column, id_column, limit, cursor=None):
+    """Returns (items, next_cursor) with up to limit rows of query ordered by (column desc, id_column desc), starting
+    after the row encoded in cursor (from the first row if cursor is None). next_cursor is None on the last page.
+    Returns None if cursor is invalid"""
+
+    if cursor:
+        position = decode_cursor(cursor)
+        if position is None or position[2] != 'next':
+            return None
+        rows = _seek_older(query, column, id_column, position[1], limit + 1)
+    else:
+        rows = query.order_by(column.desc(), id_column.desc()).limit(limit + 1).all()
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor(0, _row_key(items[-1], column, id_column), 'next')
+    return items, next_cursor
+
+
+def iter_keyset(query, column, id_column, chunk_size):
+    """Yields all rows of query ordered by (column desc, id_column desc), reading chunk_size rows per query. Every
+    query seeks from the last row of the previous one, so it stays an index range scan however far it gets"""
+
+    rows = query.order_by(column.desc(), id_column.desc()).limit(chunk_size).all()
+    while rows:
+        for row in rows:
+            yield row
+        if len(rows) < chunk_size:
+            return
+        rows = _seek_older(query, column, id_column, _row_key(rows[-1], column, id_column), chunk_size)
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+# todo/profiling.py
+import cProfile
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+from flask import abort, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .cache import page_cache, user_cache
+
+# górne granice (ms) przedziałów histogramu czasu odpowiedzi
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float('inf'))
+LOGGED_STATEMENTS = 20      # najwolniejsze zapytania pokazywane w logu wolnego żądania
+# cache, których trafienia i zajęta pamięć są pokazywane pod /debug/profiling
+REPORTED_CACHES = (('page_cache', page_cache), ('user_cache', user_cache))
+
+
+class RouteStats(object):
+    """Aggregated measurements of one route: request count, sums and histogram of wall time"""
+
+    def __init__(self):
+        self.count = 0
+        self.wall = self.cpu = self.db = 0.0
+        self.statements = 0
+        self.buckets = [0] * len(BUCKETS)
+
+    def add(self, wall, cpu, statements, db_time):
+        self.count += 1
+        self.wall += wall
+        self.cpu += cpu
+        self.statements += statements
+        self.db += db_time
+        milliseconds = wall * 1000
+        for number, bound in enumerate(BUCKETS):
+            if milliseconds <= bound:
+                self.buckets[number] += 1
+                break
+
+    def get_percentile(self, fraction):
+        """Returns upper bound (ms) of the histogram bucket holding given fraction of requests"""
+
+        needed, seen = fraction * self.count, 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            if seen >= needed:
+                return bound if bound != float('inf') else None
+        return None
+
+    def get_values(self):
+        return {
+            'count': self.count,
+            'mean_ms': round(1000 * self.wall / self.count, 3),
+            'mean_cpu_ms': round(1000 * self.cpu / self.count, 3),
+            'mean_sql_statements': round(self.statements / self.count, 2),
+            'mean_sql_ms': round(1000 * self.db / self.count, 3),
+            'p50_ms': self.get_percentile(0.5), 'p95_ms': self.get_percentile(0.95),
+            'p99_ms': self.get_percentile(0.99),
+            'histogram_ms': {str(bound): count for bound, count in zip(BUCKETS, self.buckets) if count},
+        }
+
+
+class RequestProfiler(object):
+    """Opt-in (PROFILING = True) instrumentation of requests.
+
+    Measures wall and CPU time of every request, number and total time of its SQL statements (SQLAlchemy engine
+    events), adds them to per-route histograms served as JSON by /debug/profiling (together with hit ratio and
+    memory of REPORTED_CACHES) and to the Server-Timing
+    header. /debug/profiling answers only requests coming directly from PROFILING_ALLOWED_ADDRESSES. Requests
+    slower than PROFILING_SLOW_REQUEST are logged with their slowest statements, statements
+    slower than PROFILING_SLOW_QUERY are logged on their own. PROFILING_SAMPLE_RATE of requests run under
+    cProfile, the profile is saved to PROFILING_DUMP_DIR if the request was slow. When disabled, request hooks
+    return at once and no engine listeners are registered."""
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def init_app(self, app):
+        """Registers request hooks and the /debug/profiling endpoint, enables profiling if PROFILING is set"""
+
+        self.app = app
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule('/debug/profiling', 'profiling', self._stats_view)
+        if app.config.get('PROFILING', False):
+            self.enable()
+
+    def enable(self):
+        if not self.enabled:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self.enabled = True
+
+    def disable(self):
+        if self.enabled:
+            self.enabled = False
+            event.remove(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.remove(Engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def get_stats(self):
+        """Returns dict of aggregated measurements per route ('GET /user/<username>')"""
+
+        with self._lock:
+            return {route: stats.get_values() for route, stats in sorted(self.stats.items())}
+
+    def clear(self):
+        with self._lock:
+            self.stats.clear()
+
+    def _before_request(self):
+        if not self.enabled:
+            return
+        state = self._local
+        state.statements = []
+        state.profile = None
+        if random.random() < self.app.config.get('PROFILING_SAMPLE_RATE', 0):
+            state.profile = cProfile.Profile()
+            state.profile.enable()
+        state.cpu = time.thread_time()
+        state.start = time.perf_counter()
+
+    def _after_request(self, response):
+        state = self._local
+        if not self.enabled or getattr(state, 'start', None) is None:
+            return response
+        wall = time.perf_counter() - state.start
+        cpu = time.thread_time() - state.cpu
+        if state.profile is not None:
+            state.profile.disable()
+        db_time = sum(duration for duration, _ in state.statements)
+        route = '{} {}'.format(request.method, request.url_rule.rule if request.url_rule else '<unknown>')
+        with self._lock:
+            self.stats.setdefault(route, RouteStats()).add(wall, cpu, len(state.statements), db_time)
+        response.headers['Server-Timing'] = 'app;dur={:.1f}, cpu;dur={:.1f}, db;dur={:.1f};desc="{} queries"'.format(
+            wall * 1000, cpu * 1000, db_time * 1000, len(state.statements))
+
+        if wall >= self.app.config.get('PROFILING_SLOW_REQUEST', 0.5):
+            slowest = sorted(state.statements, key=lambda item: item[0], reverse=True)[:LOGGED_STATEMENTS]
+            self.app.logger.warning("Slow request %s %s: %.1f ms (cpu %.1f ms), %d SQL statements in %.1f ms%s",
+                                    request.method, request.full_path, wall * 1000, cpu * 1000,
+                                    len(state.statements), db_time * 1000,
+                                    ''.join('\n  {:.1f} ms  {}'.format(duration * 1000, statement)
+                                            for duration, statement in slowest))
+            if state.profile is not None:
+                self._dump_profile(state.profile, request.endpoint, wall)
+        state.start = state.profile = state.statements = None
+        return response
+
+    def _teardown_request(self, error=None):
+        state = self._local
+        if getattr(state, 'start', None) is None:
+            return
+        # after_request nie został wywołany, bo obsługa żądania zakończyła się wyjątkiem
+        if state.profile is not None:
+            state.profile.disable()
+        state.start = state.profile = state.statements = None
+
+    def _dump_profile(self, profile, endpoint, wall):
+        directory = self.app.config.get('PROFILING_DUMP_DIR')
+        if not directory:
+            return
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, '{}-{}-{:.0f}ms.prof'.format(
+            datetime.now().strftime('%Y%m%d-%H%M%S-%f'), endpoint or 'unknown', wall * 1000))
+        profile.dump_stats(path)
+        self.app.logger.warning("Profile of slow request saved to %s", path)
+
+    # czas startu trzymany w kontekście wykonania zapytania, ginie razem z nim także gdy zapytanie rzuci wyjątek
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.profiling_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, 'profiling_start', None)
+        if start is None:
+            return      # zapytanie rozpoczęte przed włączeniem profilowania
+        duration = time.perf_counter() - start
+        if duration >= self.app.config.get('PROFILING_SLOW_QUERY', 0.1):
+            self.app.logger.warning("Slow SQL statement: %.1f ms  %s", duration * 1000, statement)
+        statements = getattr(self._local, 'statements', None)
+        if statements is not None:      # zapytania spoza żądań (wątki w tle) nie są liczone
+            statements.append((duration, statement))
+
+    def _stats_view(self):
+        """Returns JSON with aggregated measurements per route and statistics of the caches, 404 if profiling is
+        disabled or the request does not come directly from PROFILING_ALLOWED_ADDRESSES"""
+
+        if not self.enabled:
+            abort(404)
+        # żądanie przekazane przez proxy ma adres proxy (często lokalny), rozpoznawane po X-Forwarded-For
+        allowed = self.app.config.get('PROFILING_ALLOWED_ADDRESSES', ('127.0.0.1', '::1'))
+        if request.remote_addr not in allowed or 'X-Forwarded-For' in request.headers:
+            abort(404)
+        return jsonify({'routes': self.get_stats(), 'caches': {name: cache.stats() for name, cache in REPORTED_CACHES}})
+
+
+request_profiler = RequestProfiler()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# todo/purge.py
+import threading
+import time
+
+
+class AccountPurger(object):
+    """Deletes accounts marked deleted (User.deleted_at) on a background thread.
+
+    User.handle_account_deleting deletes small accounts at once. Accounts with more than ACCOUNT_PURGE_THRESHOLD
+    tasks are only marked deleted, so the request returns immediately, and their tasks are deleted here,
+    ACCOUNT_PURGE_CHUNK_SIZE per transaction with ACCOUNT_PURGE_PAUSE seconds between transactions, so that the
+    write lock is never held for long and other requests can write in between. The thread is started by the first
+    request of every process, purges accounts left marked deleted (i.e. before a restart or by another process)
+    at once and then every ACCOUNT_PURGE_POLL_INTERVAL seconds. ACCOUNT_PURGE_WORKER = False disables the thread,
+    purge_pending() can then be called directly (i.e. from tests or 'python purge_accounts.py' run by cron)."""
+
+    def __init__(self):
+        self.app = None
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Takes application, registers start of the thread on the first request of the process"""
+
+        self.app = app
+        app.before_request(self._start)
+
+    def wake(self):
+        """Starts the background purge if needed and asks it to purge accounts marked deleted"""
+
+        if not self.app.config.get('ACCOUNT_PURGE_WORKER', True):
+            return
+        with self._lock:
+            # wątek uruchamiany leniwie, dopiero w procesie który usuwa konta (bezpieczne przy fork)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='account-purger', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def _start(self):
+        # wątek każdego procesu (także workera po fork) startuje przy jego pierwszym żądaniu
+        if self._thread is None:
+            self.wake()
+
+    def purge_pending(self):
+        """Purges all accounts marked deleted, returns number of purged accounts. Requires application context"""
+
+        from .models import User
+
+        user_ids = User.get_deleted_ids()
+        for user_id in user_ids:
+            self.purge(user_id)
+        return len(user_ids)
+
+    def purge(self, user_id):
+        """Deletes tasks of the user in chunks, then the user with the rest of its rows"""
+
+        from .models import User, Task
+
+        chunk_size = self.app.config.get('ACCOUNT_PURGE_CHUNK_SIZE', 5000)
+        pause = self.app.config.get('ACCOUNT_PURGE_PAUSE', 0.1)
+        while Task.delete_tasks_chunk(user_id, chunk_size) == chunk_size:
+            time.sleep(pause)
+        User.delete_account_rows(user_id)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.app.config.get('ACCOUNT_PURGE_POLL_INTERVAL', 600))
+            self._wakeup.clear()
+            with self.app.app_context():
+                try:
+                    self.purge_pending()
+                except Exception:
+                    self.app.logger.exception("Purging deleted accounts failed")
+
+
+account_purger = AccountPurger()
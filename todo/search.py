@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# todo/search.py
+import re
+
+from sqlalchemy import DDL, column, event, table
+
+# indeks pełnotekstowy FTS5 z zewnętrzną zawartością (tabela task), przechowuje tylko indeks, nie kopię tekstu
+CREATE_INDEX = ("CREATE VIRTUAL TABLE IF NOT EXISTS task_search USING fts5("
+                "task, content='task', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+CREATE_TRIGGERS = (
+    "CREATE TRIGGER IF NOT EXISTS task_search_insert AFTER INSERT ON task BEGIN "
+    "INSERT INTO task_search(rowid, task) VALUES (new.id, new.task); END",
+    "CREATE TRIGGER IF NOT EXISTS task_search_delete AFTER DELETE ON task BEGIN "
+    "INSERT INTO task_search(task_search, rowid, task) VALUES ('delete', old.id, old.task); END",
+    "CREATE TRIGGER IF NOT EXISTS task_search_update AFTER UPDATE OF task ON task BEGIN "
+    "INSERT INTO task_search(task_search, rowid, task) VALUES ('delete', old.id, old.task); "
+    "INSERT INTO task_search(rowid, task) VALUES (new.id, new.task); END",
+)
+REBUILD_INDEX = "INSERT INTO task_search(task_search) VALUES ('rebuild')"
+DROP_TRIGGERS = tuple("DROP TRIGGER IF EXISTS " + name
+                      for name in ('task_search_insert', 'task_search_delete', 'task_search_update'))
+DROP_INDEX = "DROP TABLE IF EXISTS task_search"
+
+# kolumny tabeli wirtualnej używane w zapytaniach (rank - trafność bm25, im mniejsza tym lepsza)
+task_search = table('task_search', column('rowid'), column('task_search'), column('rank'))
+
+
+def setup_search_index(task_table):
+    """Takes task table, registers DDL creating the FTS5 index with its triggers after the table is created
+    and dropping it after the table is dropped. Does nothing for databases other than SQLite"""
+
+    for statement in (CREATE_INDEX,) + CREATE_TRIGGERS:
+        event.listen(task_table, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+    event.listen(task_table, 'after_drop', DDL(DROP_INDEX).execute_if(dialect='sqlite'))
+
+
+def build_match_query(text):
+    """Takes text typed by user, returns FTS5 query matching tasks containing all its words (the last one also
+    as a prefix) or None if there are no words. Every word is quoted, so operators and special characters
+    typed by user are searched for as plain text"""
+
+    words = re.findall(r'\w+', text, re.UNICODE)
+    if not words:
+        return None
+    terms = ['"{}"'.format(word) for word in words]
+    terms[-1] += '*'        # wyszukiwanie w trakcie pisania ostatniego słowa
+    return ' '.join(terms)
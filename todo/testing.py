@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# todo/testing.py
+import sqlite3
+import threading
+
+from todo import db
+from .cache import LRUCache
+
+LOCK_TIMEOUT = 10       # czas (s) oczekiwania wątku na transakcję innego wątku, potem 'database is locked'
+
+
+class SavepointConnection(sqlite3.Connection):
+    """sqlite3 connection of the in-memory test database, shared by all threads (StaticPool).
+
+    Between begin_test() and end_test() the whole test runs in one transaction: commit() only releases and
+    opens again the savepoint which rollback() returns to, end_test() rolls back everything the test wrote.
+    Savepoints are executed on the sqlite3 connection itself, so they are not seen by SQLAlchemy events and
+    statement counting tests. A thread executing statements owns the transaction until its commit() or
+    rollback(), other threads wait for it like for the write lock of a database file."""
+
+    def __init__(self, *args, **kwargs):
+        super(SavepointConnection, self).__init__(*args, **kwargs)
+        self.in_test = False
+        self._lock = threading.Lock()
+        self._owner = None
+
+    def begin_test(self):
+        self._execute('SAVEPOINT test_case')
+        self._execute('SAVEPOINT test_transaction')
+        self.in_test = True
+
+    def end_test(self):
+        self.in_test = False
+        self._execute('ROLLBACK TO SAVEPOINT test_case')
+        self._execute('RELEASE SAVEPOINT test_case')
+        if self._owner is not None:     # transakcja wątku, który nie zakończył sesji
+            self._release()
+
+    def cursor(self, *args, **kwargs):
+        if self.in_test and self._owner != threading.get_ident():
+            if not self._lock.acquire(timeout=LOCK_TIMEOUT):
+                raise sqlite3.OperationalError('database is locked')
+            self._owner = threading.get_ident()
+        return super(SavepointConnection, self).cursor(*args, **kwargs)
+
+    def commit(self):
+        if not self.in_test:
+            return super(SavepointConnection, self).commit()
+        if self._owner == threading.get_ident():
+            self._execute('RELEASE SAVEPOINT test_transaction')
+            self._execute('SAVEPOINT test_transaction')
+            self._release()
+
+    def rollback(self):
+        if not self.in_test:
+            return super(SavepointConnection, self).rollback()
+        # wątek, który nie wykonał żadnego zapytania, nie ma czego wycofywać (np. zwrot połączenia do puli)
+        if self._owner == threading.get_ident():
+            self._execute('ROLLBACK TO SAVEPOINT test_transaction')
+            self._release()
+
+    def _execute(self, statement):
+        sqlite3.Connection.cursor(self).execute(statement)
+
+    def _release(self):
+        self._owner = None
+        self._lock.release()
+
+
+# ustawienia aplikacji testowej: create_app('config', **TEST_SETTINGS)
+TEST_SETTINGS = {
+    'TESTING': True,
+    'DEBUG': True,
+    'WTF_CSRF_ENABLED': False,
+    'SQLALCHEMY_DATABASE_URI': 'sqlite://',     # baza w pamięci, osobna dla każdego procesu testów
+    'SQLALCHEMY_ENGINE_OPTIONS': {'connect_args': {'factory': SavepointConnection, 'check_same_thread': False}},
+    'PASSWORD_HASH_PROFILE': 'test',
+    'ACCOUNT_PURGE_WORKER': False,      # wątek w tle widziałby dane trwającego testu, testy wołają purge_pending()
+    'MAIL_OUTBOX_WORKER': False,        # jak wyżej, testy wołają mail_dispatcher.flush()
+}
+
+
+class TestDatabase(object):
+    """In-memory database of tests. Its schema is created once per process by the first begin(), every test
+    is wrapped in begin() and rollback() instead of create_all() and drop_all(). Processes running tests in
+    parallel have their own databases."""
+
+    def __init__(self):
+        self.app = None
+        self.created = False
+
+    def init_app(self, app):
+        self.app = app
+        self.created = False
+
+    def begin(self):
+        """Creates schema if it does not exist yet, starts the transaction rolled back by rollback()"""
+
+        if not self.created:
+            db.create_all(app=self.app)
+            self.created = True
+        self._call('begin_test')
+
+    def rollback(self):
+        """Closes session of the test, rolls back everything written since begin() and clears all caches, which
+        could keep values read from the rolled back data"""
+
+        db.session.remove()
+        self._call('end_test')
+        LRUCache.clear_all()
+
+    def _call(self, method):
+        connection = db.get_engine(self.app).raw_connection()
+        try:
+            getattr(connection.connection, method)()
+        finally:
+            connection.close()
+
+
+test_database = TestDatabase()
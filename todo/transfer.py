@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# todo/transfer.py
+"""Streaming import and export of tasks as CSV (columns: task, date, executed) or NDJSON (one JSON object with the
+same keys per line). Readers and writers are generators working row by row, so memory use does not depend on
+the size of the file."""
+import csv
+import io
+import json
+
+FORMATS = ('csv', 'ndjson')
+MIMETYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+FIELDS = ('task', 'date', 'executed')
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+MAX_LINE_LENGTH = 64 * 1024     # dłuższe linie NDJSON są odrzucane bez wczytywania ich w całości
+CHUNK_SIZE = 64 * 1024          # tyle znaków eksportu wysyłane jest naraz
+EXECUTED_VALUES = {'': 0, '0': 0, 'false': 0, 'no': 0, '1': 1, 'true': 1, 'yes': 1}
+
+
+def get_format(filename):
+    """Takes file name, returns format given by its extension or None if it is not supported"""
+
+    extension = (filename or '').rpartition('.')[2].lower()
+    return extension if extension in FORMATS else None
+
+
+def parse_executed(value):
+    """Takes 'executed' value from a file (bool, 0/1, 'true'/'false'...), returns 0 or 1, None if it is incorrect"""
+
+    if isinstance(value, bool):
+        return int(value)
+    if value in (0, 1):
+        return value
+    if isinstance(value, str):
+        return EXECUTED_VALUES.get(value.strip().lower())
+    return 0 if value is None else None
+
+
+def read_csv(stream):
+    """Takes binary stream with CSV file (header row required). Yields (line number, task, date, executed), task is
+    None if the row is malformed"""
+
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    try:
+        for row in reader:
+            yield reader.line_num, row.get('task'), row.get('date') or '', parse_executed(row.get('executed'))
+    except (csv.Error, UnicodeDecodeError):
+        # reszty pliku nie da się już wiarygodnie podzielić na wiersze
+        yield reader.line_num + 1, None, None, None
+
+
+def read_ndjson(stream):
+    """Takes binary stream with NDJSON file. Yields (line number, task, date, executed), task is None if the line
+    is not a JSON object. Empty lines are skipped"""
+
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig')
+    line_number = 0
+    try:
+        while True:
+            line = text.readline(MAX_LINE_LENGTH)
+            if not line:
+                return
+            line_number += 1
+            if len(line) == MAX_LINE_LENGTH and not line.endswith('\n'):
+                while line and not line.endswith('\n'):
+                    line = text.readline(MAX_LINE_LENGTH)
+                yield line_number, None, None, None
+                continue
+            if not line.strip():
+                continue
+            try:
+                values = json.loads(line)
+            except ValueError:
+                values = None
+            if not isinstance(values, dict):
+                yield line_number, None, None, None
+                continue
+            yield line_number, values.get('task'), values.get('date') or '', parse_executed(values.get('executed'))
+    except UnicodeDecodeError:
+        yield line_number + 1, None, None, None
+
+
+def read_tasks(stream, file_format):
+    return (read_csv if file_format == 'csv' else read_ndjson)(stream)
+
+
+def format_date(data_pub):
+    return data_pub.strftime(DATE_FORMAT) if data_pub else ''
+
+
+def write_csv(rows):
+    """Takes iterable of (task, date, executed). Yields CSV file line by line, header first"""
+
+    line = io.StringIO()
+    writer = csv.writer(line, lineterminator='\n')
+    writer.writerow(FIELDS)
+    yield line.getvalue()
+    for task_text, data_pub, executed in rows:
+        line.seek(0)
+        line.truncate()
+        writer.writerow((task_text, format_date(data_pub), executed))
+        yield line.getvalue()
+
+
+def write_ndjson(rows):
+    """Takes iterable of (task, date, executed). Yields NDJSON file line by line"""
+
+    for task_text, data_pub, executed in rows:
+        yield json.dumps({'task': task_text, 'date': format_date(data_pub) or None,
+                          'executed': bool(executed)}, ensure_ascii=False) + '\n'
+
+
+def write_tasks(rows, file_format):
+    return (write_csv if file_format == 'csv' else write_ndjson)(rows)
+
+
+def join_lines(lines, size=CHUNK_SIZE):
+    """Takes iterable of lines, yields them joined into chunks of about size characters, so that a response does
+    not need a separate write for every row"""
+
+    chunk, length = [], 0
+    for line in lines:
+        chunk.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(chunk)
+            chunk, length = [], 0
+    if chunk:
+        yield ''.join(chunk)
@@ -1,29 +1,45 @@
 # -*- coding: utf-8 -*-
 # todo/views.py
 
-from flask import g, render_template, flash, redirect, url_for, request, abort
+from flask import Blueprint, current_app, g, render_template, flash, redirect, url_for, request, abort, session, \
+    stream_with_context
+from markupsafe import Markup
 from flask_login import login_required, current_user, logout_user
-from flask_mail import Message
 
-from config import MAIL_USERNAME
-from todo import app, login_manager, db, mail
+from todo import login_manager, db
 from .messages import *
-from .models import User, Task, Question, Choice, Opinion, ErrorOpinion
+from .models import User, Task, Tag, Question, Choice, Opinion, ErrorOpinion, OutboxMail
+from .cache import page_cache
+from .hashing import HashingPoolBusy
+from .mailer import mail_dispatcher
+from .transfer import FORMATS, MIMETYPES, get_format, join_lines, read_tasks, write_tasks
+
+bp = Blueprint('main', __name__)     # strony aplikacji, rejestrowane w create_app()
 
 
 @login_manager.user_loader
 def user_loader(user_id):
     """Returns user object given id"""
 
-    return User.query.get(user_id)  # zwraca obiekt klasy User o podanym id
+    user = User.get_by_id(user_id)  # zwraca obiekt klasy User o podanym id, korzystając z user_cache
+    if user is not None and user.deleted_at is not None:
+        return None     # konto usunięte, czeka na usunięcie zadań w tle
+    return user
 
 
-@app.before_request
+@bp.before_app_request
 def before_request():
     g.user = current_user  # zapisanie aktualnego użytkownika do globalnego obiektu przed każdym requestem
 
 
-@app.route('/', methods=['GET', 'POST'])
+@bp.app_errorhandler(HashingPoolBusy)
+def hashing_pool_busy(error):
+    """Too many passwords waiting to be hashed, asks client to retry later"""
+
+    return HashingMessages.busy_error_message, 503
+
+
+@bp.route('/', methods=['GET', 'POST'])
 def login():
     """login method"""
 
@@ -37,13 +53,14 @@ def login():
             error = LoginMessages.incorrect_data_error_message
             return render_template('login.html', error=error)
 
-        if not User.check_user_existence_by_username(username):
+        user = User.get_by_username(username)
+        if not user:
             error = LoginMessages.no_user_error_message
             return render_template('login.html', error=error)
 
-        if User.handle_login(username, password, remember_me):
+        if user.handle_login(password, remember_me):
             flash(LoginMessages.success_message)
-            return redirect(url_for("user", username=g.user.username))
+            return redirect(url_for("main.user", username=username))
         else:
             error = LoginMessages.incorrect_password_error_message
             return render_template('login.html', error=error)
@@ -51,17 +68,17 @@ def login():
     return render_template('login.html')
 
 
-@app.route('/logout', methods=['GET'])
+@bp.route('/logout', methods=['GET'])
 @login_required
 def logout():
     """log out method"""
 
     logout_user()
     flash(LogoutMessages.success_message)
-    return redirect(url_for("login"))
+    return redirect(url_for("main.login"))
 
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     """Sign up method"""
 
@@ -79,50 +96,90 @@ def register():
             error = RegisterMessages.incorrect_email_error_message
             return render_template('register.html', error=error)
 
-        if User.check_user_existence_by_username(username) or User.check_user_existence_by_email(email):
-            error = RegisterMessages.already_exist_error_message
+        if password != confpass:
+            error = RegisterMessages.incorrect_passwords_error_message
             return render_template('register.html', error=error)
 
-        if User.handle_registration(username, password, confpass, email):
+        # unikalność loginu i emaila sprawdzana przez bazę przy zapisie
+        if User.handle_registration(username, password, email):
             flash(RegisterMessages.success_message)
-            return redirect(url_for("login"))
+            return redirect(url_for("main.login"))
         else:
-            error = RegisterMessages.incorrect_passwords_error_message
+            error = RegisterMessages.already_exist_error_message
             return render_template('register.html', error=error)
 
     return render_template('register.html')
 
 
-@app.route('/user/<username>', methods=['GET', 'POST'])
-@app.route('/user/<username>/<int:page>', methods=['GET', 'POST'])
+@bp.route('/user/<username>', methods=['GET', 'POST'])
+@bp.route('/user/<username>/<int:page>', methods=['GET', 'POST'])
 @login_required
 def user(username, page=1):
     """Adds and displays tasks"""
 
-    g.user.check_user_tasks_per_page()
-    g.user.save_actual_page(page)
+    # aktualna strona i opcje listy trzymane są w podpisanej sesji, wyświetlenie listy nie zapisuje nic w bazie
+    options = Task.get_list_options(request.args)
+    if session.get('page') != page:
+        session['page'] = page
+    if session.get('list_options', {}) != options:
+        session['list_options'] = options
     error = None
     if request.method == 'POST':
         task_text = request.form['task']
         task_date = request.form['date']
-        if Task.handle_task_adding(task_text, task_date, g.user.id):
-            flash(UserMessages.success_message)
-            return redirect(url_for('user', username=g.user.username))
-        else:
-            error = UserMessages.error_message
+        try:
+            if Task.handle_task_adding(task_text, task_date, g.user.id):
+                flash(UserMessages.success_message)
+                return redirect(url_for('main.user', username=g.user.username, **options))
+            else:
+                error = UserMessages.error_message
+        except ValueError:
+            error = UserMessages.date_error_message
     if username == g.user.username:
-        tasks = Task.get_all_tasks_by_username(g.user, page)
-        return render_template('tasks_list.html', tasks=tasks, error=error)
+        return render_template('tasks_list.html', tasks_html=render_tasks_page(g.user, page, options), error=error,
+                               options=options, statuses=Task.list_statuses, orders=Task.list_orders,
+                               matches=Task.list_matches)
     else:
         return abort(404)
 
 
-@app.route('/poll', methods=['POST', 'GET'])
+def render_tasks_page(user, page, options):
+    """Returns rendered list of user's tasks with pagination, given list options (Task.get_list_options()) and
+    tag cloud, cached until user's data version changes"""
+
+    # wersja danych i liczniki zadań aktualne, zapamiętany w user_cache użytkownik może być nieaktualny
+    counters = User.get_task_counters(user.id)
+    # strona odczytana od kursora (np. nieaktualnego, sprzed zmiany danych) nie może zastąpić strony o tym numerze
+    cursor = request.args.get('cursor')
+    key = (user.id, page, cursor, user.tasks_per_page, counters.data_version, tuple(sorted(options.items())))
+    tasks_html = page_cache.get(key)
+    if tasks_html is None:
+        tasks = Task.get_all_tasks_by_username(user, page, cursor, counters, options)
+        tasks_html = Markup(render_template('tasks_page.html', tasks=tasks, counters=counters, options=options,
+                                            tag_cloud=Tag.get_tag_cloud(user.id)))
+        page_cache.set(key, tasks_html)
+    return tasks_html
+
+
+@bp.route('/search', methods=['GET'])
+@bp.route('/search/<int:page>', methods=['GET'])
+@login_required
+def search(page=1):
+    """Searches user's tasks"""
+
+    text = request.args.get('q', '').strip()
+    if not text:
+        return redirect(url_for('main.user', username=g.user.username))
+    tasks = Task.search_tasks(g.user, text, page)
+    error = None if tasks else SearchMessages.no_words_error_message
+    return render_template('search.html', tasks=tasks, text=text, error=error)
+
+
+@bp.route('/poll', methods=['POST', 'GET'])
 @login_required
 def poll():
     """Vote logic"""
 
-    question = Question.query.order_by(Question.id).all()
     if request.method == 'POST':
         selected_choice1 = request.form.get('choice1')
         opinion_text = request.form['choice2']
@@ -131,74 +188,82 @@ def poll():
 
         if not Choice.handle_selected_choices(selected_choice1, selected_choice3):
             error = PollMessages.no_choices_error_message
-            return render_template('results.html', error=error, question=question)
+            return render_template('results.html', error=error, question=Question.get_poll_results())
 
         if opinion_text:
             if not Opinion.handle_opinion(opinion_text, g.user.id):
                 error = PollMessages.mex_length_error_message
-                return render_template('results.html', error=error, question=question)
+                return render_template('results.html', error=error, question=Question.get_poll_results())
 
         if error_text:
             if not ErrorOpinion.handle_error_opinion(error_text, g.user.id):
                 error = PollMessages.mex_length_error_message
-                return render_template('results.html', error=error, question=question)
+                return render_template('results.html', error=error, question=Question.get_poll_results())
 
-        return redirect(url_for('results'))
+        return redirect(url_for('main.results'))
     else:
-        return render_template('poll.html', question=question)
+        return render_template('poll.html', question=Question.get_poll_results())
 
 
-@app.route('/results', methods=['GET'])
+@bp.route('/results', methods=['GET'])
 @login_required
 def results():
     """Shows results template"""
-    question = Question.query.order_by(Question.id).all()
+    question = Question.get_poll_results()
     return render_template('results.html', question=question)
 
 
-@app.route('/executed', methods=['POST'])
+@bp.route('/executed', methods=['POST'])
 @login_required
 def executed():
     """Changes status of a task to executed """
 
-    task_id = request.form['execute']
-    task = Task.query.filter_by(id=task_id).first()
-    task.executed = 1
-    db.session.commit()
-    page = g.user.page
+    Task.handle_tasks_status_change([request.form['execute']], g.user.id, True)
+    page = session.get('page', 1)
+    options = session.get('list_options', {})
     flash(ExecutedMessages.success_message)
-    return redirect(url_for('user', username=g.user.username, page=page))
+    return redirect(url_for('main.user', username=g.user.username, page=page, **options))
 
 
-@app.route('/undo', methods=['POST'])
+@bp.route('/undo', methods=['POST'])
 @login_required
 def undo():
     """Changes status of a task back to not executed """
 
-    task_id = request.form['undo']
-    task = Task.query.filter_by(id=task_id).first()
-    task.executed = 0
-    db.session.commit()
-    page = g.user.page
+    Task.handle_tasks_status_change([request.form['undo']], g.user.id, False)
+    page = session.get('page', 1)
+    options = session.get('list_options', {})
     flash(UndoMessages.success_message)
-    return redirect(url_for('user', username=g.user.username, page=page))
+    return redirect(url_for('main.user', username=g.user.username, page=page, **options))
+
+
+@bp.route('/tasks_status', methods=['POST'])
+@login_required
+def tasks_status():
+    """Changes status of given tasks to executed (executed=1) or back to not executed (executed=0)"""
+
+    # zaznaczone checkboxy są wspólne z formularzem usuwania zadań, stąd nazwa pola 'erase'
+    executed = request.form.get('executed') == '1'
+    Task.handle_tasks_status_change(request.form.getlist('erase'), g.user.id, executed)
+    page = session.get('page', 1)
+    options = session.get('list_options', {})
+    flash(TasksStatusMessages.success_message)
+    return redirect(url_for('main.user', username=g.user.username, page=page, **options))
 
 
-@app.route('/erase', methods=['POST'])
+@bp.route('/erase', methods=['POST'])
 @login_required
 def erase():
-    """Deletes a given task"""
+    """Deletes given tasks"""
 
-    for task_id in request.form.getlist('erase'):
-        task = Task.query.filter_by(id=task_id).first()
-        db.session.delete(task)
-        db.session.commit()
-    page = g.user.page
+    Task.handle_tasks_deleting(request.form.getlist('erase'), g.user.id)
+    page = session.get('page', 1)
+    options = session.get('list_options', {})
     flash(EraseMessages.success_message)
-    return redirect(url_for('user', username=g.user.username, page=page))
+    return redirect(url_for('main.user', username=g.user.username, page=page, **options))
 
 
-@app.route('/settings', methods=['GET', 'POST'])
+@bp.route('/settings', methods=['GET', 'POST'])
 @login_required
 def settings():
     """Changes profile data"""
@@ -229,12 +294,12 @@ def settings():
                 return render_template('settings.html', error=error)
 
         flash(SettingsMessages.success_message)
-        return redirect(url_for('settings'))
+        return redirect(url_for('main.settings'))
 
     return render_template('settings.html')
 
 
-@app.route('/app_settings', methods=['POST'])
+@bp.route('/app_settings', methods=['POST'])
 @login_required
 def app_settings():
     """Changes app settings"""
@@ -252,27 +317,55 @@ def app_settings():
             error = AppSettingsMessages.incorrect_number_error_message
             return render_template('settings.html', error=error)
 
-    return redirect(url_for('settings'))
+    return redirect(url_for('main.settings'))
+
+
+@bp.route('/tasks/import', methods=['POST'])
+@login_required
+def tasks_import():
+    """Imports tasks from uploaded CSV or NDJSON file"""
+
+    upload = request.files.get('file')
+    file_format = request.form.get('format') or get_format(upload.filename if upload else None)
+    if not upload or file_format not in FORMATS:
+        return render_template('settings.html', error=TasksImportMessages.incorrect_file_error_message)
+    # plik jest czytany strumieniowo, wiersz po wierszu (werkzeug trzyma większe pliki na dysku, nie w pamięci)
+    result = Task.handle_tasks_import(read_tasks(upload.stream, file_format), g.user.id)
+    flash(TasksImportMessages.success_message.format(result.imported))
+    if result.rejected:
+        flash(TasksImportMessages.rejected_message.format(
+            result.rejected, ", ".join(str(line) for line in result.rejected_lines)))
+    return redirect(url_for('main.settings'))
+
+
+@bp.route('/tasks/export')
+@login_required
+def tasks_export():
+    """Returns all user's tasks as CSV or NDJSON (?format=ndjson) file, generated while it is being sent"""
+
+    file_format = request.args.get('format', 'csv')
+    if file_format not in FORMATS:
+        abort(404)
+    lines = write_tasks(Task.iter_tasks(g.user.id), file_format)
+    response = current_app.response_class(stream_with_context(join_lines(lines)), mimetype=MIMETYPES[file_format])
+    response.headers['Content-Disposition'] = 'attachment; filename=tasks.{}'.format(file_format)
+    return response
 
 
-@app.route('/delete_account', methods=['POST'])
+@bp.route('/delete_account', methods=['POST'])
 @login_required
 def delete_account():
     """Deletes account permanently"""
 
-    tasks = Task.query.filter_by(username_id=g.user.id).all()
-    # usuwamy wszystkie taski, co prawda cascade='all, delete' w modelu User załatwia sprawę, ale dla pewności
-    for task in tasks:
-        db.session.delete(task)
-    user = User.query.filter_by(username=g.user.username).first()
-    db.session.delete(user)
-    db.session.commit()
+    user_id = g.user.id
     logout_user()
+    # małe konta usuwane od razu, duże oznaczane jako usunięte i czyszczone w tle przez account_purger
+    User.handle_account_deleting(user_id)
     flash(DeleteAccountMessages.success_message)
-    return redirect(url_for("login"))
+    return redirect(url_for("main.login"))
 
 
-@app.route('/password_reset', methods=['GET', 'POST'])
+@bp.route('/password_reset', methods=['GET', 'POST'])
 def password_reset():
     """Resets password"""
 
@@ -280,17 +373,18 @@ def password_reset():
 
     if request.method == "POST":
         email = request.form['email']
-        user = User.query.filter_by(email=email).first()
+        user = User.query.filter_by(email=email, deleted_at=None).first()
         if user:
             try:
                 password = User.password_generator()
-                msg = Message(PasswordResetMessages.title_of_message, sender=MAIL_USERNAME, recipients=[user.email])
-                msg.body = PasswordResetMessages.body_of_message.format(user.username, password)
-                mail.send(msg)
-                user.handle_password_reset(password)
+                OutboxMail.enqueue(user.email, PasswordResetMessages.title_of_message,
+                                   PasswordResetMessages.body_of_message.format(user.username, password))
+                user.handle_password_reset(password)        # zapisuje hasło i email w jednej transakcji
+                mail_dispatcher.wake()
                 flash(PasswordResetMessages.success_message)
-                return redirect(url_for("login"))
+                return redirect(url_for("main.login"))
             except Exception:
+                db.session.rollback()
                 error = PasswordResetMessages.unidentified_error_message
         else:
             error = PasswordResetMessages.no_user_error_message
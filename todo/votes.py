@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# todo/votes.py
+import atexit
+import threading
+from collections import Counter
+
+
+class VoteBuffer(object):
+    """Counts poll votes in memory and adds them to Choice.votes with periodic bulk UPDATEs.
+
+    Used by Choice.handle_selected_choices when POLL_VOTE_BUFFER is True. A burst of submissions then costs one
+    UPDATE per voted choice every POLL_VOTE_FLUSH_INTERVAL seconds instead of a write transaction per vote.
+    Totals stay exact (counts are swapped out under a lock and merged back if the flush fails), but votes of the
+    last interval are visible in results only after the flush and are lost if the process is killed."""
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.interval = 1
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        """Reads POLL_VOTE_BUFFER and POLL_VOTE_FLUSH_INTERVAL from application config"""
+
+        self.app = app
+        self.enabled = app.config.get('POLL_VOTE_BUFFER', False)
+        self.interval = app.config.get('POLL_VOTE_FLUSH_INTERVAL', 1)
+
+    def add(self, choice_ids):
+        """Takes ids of voted choices and counts one vote for each of them"""
+
+        with self._lock:
+            self._counts.update(choice_ids)
+            # wątek uruchamiany leniwie, dopiero w procesie który zbiera głosy (bezpieczne przy fork)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='vote-buffer', daemon=True)
+                self._thread.start()
+
+    def pending(self):
+        """Returns number of votes waiting for flush"""
+
+        with self._lock:
+            return sum(self._counts.values())
+
+    def flush(self):
+        """Saves buffered votes with one UPDATE per choice, returns number of saved votes"""
+
+        from .models import Choice
+
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        if not counts:
+            return 0
+        try:
+            Choice.add_votes(counts)
+        except Exception:
+            with self._lock:
+                self._counts.update(counts)     # głosy wracają do bufora, zapis przy następnej próbie
+            raise
+        return sum(counts.values())
+
+    def _run(self):
+        while not self._wakeup.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    self.flush()
+                except Exception:
+                    self.app.logger.exception("Saving buffered poll votes failed")
+
+
+vote_buffer = VoteBuffer()
+
+
+@atexit.register
+def _flush_at_exit():
+    if vote_buffer.app is not None and vote_buffer.pending():
+        with vote_buffer.app.app_context():
+            vote_buffer.flush()
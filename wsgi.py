@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+"""WSGI entry point, i.e. 'gunicorn --preload --workers 4 wsgi:app'.
+
+With --preload the master process imports and creates the application once, workers are forked from it and
+share that memory copy-on-write. Nothing here connects to the database and background threads start lazily,
+so both are created by the workers themselves."""
+import gc
+
+from todo import create_app
+
+app = create_app()
+
+# obiekty utworzone do tej pory nie są przeglądane przez GC, który inaczej zapisywałby w ich nagłówkach
+# i kopiował współdzielone strony pamięci do każdego workera
+gc.freeze()